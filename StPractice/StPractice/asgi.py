@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'StPractice.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+# Потоковые ответы (выгрузки crm.exports) читают БД синхронно — обработчик перебирает их вне event loop
+from crm.exports import StreamingASGIHandler  # noqa: E402
+
+django_application = StreamingASGIHandler()
+
+# Поток событий проекта (SSE) отдается в обход Django, остальное — приложением Django
+from plan.events import EventStreamApp  # noqa: E402
+
+application = EventStreamApp(django_application)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -51,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'crm.metrics.RequestMetricsMiddleware',  # Метрики запросов для /api/metrics, должен быть первым
+    'crm.routers.ReplicaRoutingMiddleware',  # Чтение безопасных запросов с реплики
     'corsheaders.middleware.CorsMiddleware',  # Для CORS
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',  # CSRF Middleware
@@ -60,12 +63,14 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'crm.profiling.RequestProfilerMiddleware',  # Профилирование запросов по X-Profile: 1 для сотрудников
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        # JSONRenderer и BrowsableAPIRenderer с замером времени рендеринга (crm.metrics)
+        'crm.metrics.TimedJSONRenderer',
+        'crm.metrics.TimedBrowsableAPIRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -183,6 +188,40 @@ DATABASES = {
     }
 }
 
+# Реплика для чтения (crm.routers): безопасные запросы читают из нее, запись — всегда в default.
+# Движок и учетные данные — как у default, если не заданы переменные DB_REPLICA_*
+if os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'ENGINE': os.getenv('DB_REPLICA_ENGINE', DATABASES['default']['ENGINE']),
+        'NAME': os.getenv('DB_REPLICA_NAME'),
+    }
+    for option in ('HOST', 'PORT', 'USER', 'PASSWORD'):
+        if os.getenv(f'DB_REPLICA_{option}'):
+            DATABASES['replica'][option] = os.getenv(f'DB_REPLICA_{option}')
+DATABASE_ROUTERS = ['crm.routers.PrimaryReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_STICKY_SECONDS = 5  # сколько секунд после записи клиент читает из основной базы
+
+# Общий кеш воркеров: версии ответов (crm.caching), планов автоматизации и ролей.
+# В LocMem у каждого процесса uvicorn свои значения, поэтому при нескольких воркерах
+# задается REDIS_URL или CACHE_BACKEND=database (таблица создается manage.py createcachetable).
+# Без них — LocMem: разработка и тесты в одном процессе
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_BACKEND') == 'database':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -221,6 +260,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = "/api/profile/"
 
+# Время жизни кеша ролей пользователя в общем кеше (секунды); None или LocMem (CACHES не задан) —
+# только кеш на время запроса
+ROLE_CACHE_TIMEOUT = 300
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -234,3 +277,56 @@ EMAIL_HOST_USER = 'no-reply@meetuppoint.ru'  # Ваш email на Beget
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')  # Пароль от почты
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER  # Email отправителя по умолчанию
 SERVER_EMAIL = EMAIL_HOST_USER  # Для уведомлений админам
+
+# Очередь исходящих сообщений (crm.outbox, воркер: manage.py outbox_worker).
+# Для локальной разработки каналы можно переключить на 'crm.outbox.FakeTransport'
+OUTBOX_TRANSPORTS = {}
+OUTBOX_RATE_LIMITS = {}  # сообщений в секунду по каналам, например {'email': 5}
+OUTBOX_CONCURRENCY = 100  # одновременных запросов асинхронного воркера (outbox_worker --async)
+
+# Внешние API и общий асинхронный HTTP-клиент (crm.clients)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+VK_API_URL = os.getenv('VK_API_URL', 'https://api.vk.com/method')
+ASYNC_HTTP_MAX_CONNECTIONS = 100  # соединений в пуле одного event loop
+
+# Сколько заявок читается одним запросом при потоковой выгрузке (crm.exports)
+EXPORT_CHUNK_SIZE = 2000
+
+# Сколько строк массового импорта участников сохраняется одной транзакцией (crm.imports)
+IMPORT_CHUNK_SIZE = 500
+
+# Лента изменений проекта (plan.changes, GET /api/project/<id>/changes/?since=)
+CHANGES_PAGE_SIZE = 500
+CHANGES_SETTLE_SECONDS = 5  # более свежие изменения повторяются в следующем ответе
+CHANGES_RETENTION_DAYS = 30  # срок хранения записей об удалении и жизни sync-токена (manage.py prune_changes)
+
+# Push-канал изменений проекта (plan.events, SSE под ASGI: /api/project/<id>/events/).
+# Для нескольких воркеров — 'plan.events.DatabaseBroker'
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'plan.events.LocalBroker')
+EVENTS_QUEUE_SIZE = 100  # событий в очереди подключения; при переполнении клиент переподключается
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_POLL_SECONDS = 1  # период опроса таблицы изменений в DatabaseBroker
+EVENTS_RETRY_MS = 3000  # через сколько EventSource переподключается после обрыва
+
+# Сколько роботов автоматизации (crm.robots_triggers) может выполняться одновременно в одном воркере
+AUTOMATION_CONCURRENCY = 10
+# Сколько секунд воркер держит скомпилированные цепочки функций, даже если версия в кеше не менялась
+AUTOMATION_PLAN_TTL = 60
+
+# Время жизни отрендеренных ответов справочников в общем кеше (crm.caching), секунды.
+# Ответ сбрасывается раньше, как только меняется одна из моделей, от которых он зависит
+RESPONSE_CACHE_TIMEOUT = 600
+
+# Метрики запросов (crm.metrics, GET /api/metrics в формате Prometheus).
+# METRICS_DIR — общий каталог, через который воркеры объединяют метрики; без него видны метрики одного процесса
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5  # секунды между сохранениями снимка воркера
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer-токен сборщика Prometheus
+SLOW_REQUEST_MS = 1000  # запросы дольше пишутся в лог crm.metrics с самыми долгими SQL; None — отключить
+SLOW_REQUEST_TOP_SQL = 5
+
+# Профилирование запросов (crm.profiling): заголовок X-Profile: 1 или ?_profile=1 от сотрудника.
+# Просмотр: manage.py request_profiles
+PROFILER_DIR = os.getenv('PROFILER_DIR', os.path.join(tempfile.gettempdir(), 'stpractice-profiles'))
+PROFILER_MAX_ENTRIES = 50  # сколько последних профилей хранить
+PROFILER_TRACEMALLOC_FRAMES = 10  # глубина стека для выделений памяти
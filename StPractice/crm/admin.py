@@ -34,6 +34,9 @@ admin.site.register(Application)
 admin.site.register(Robot)
 admin.site.register(Trigger)
 admin.site.register(FunctionOrder)
+admin.site.register(OutboundMessage)
+admin.site.register(ScheduledTrigger)
+admin.site.register(AccessScope)
 # admin.site.register(Test)
 # admin.site.register(Question)
 # admin.site.register(Answer)
@@ -5,4 +5,8 @@ class CrmConfig(AppConfig):
     name = 'crm'
 
     def ready(self):
-        import crm.signals
\ No newline at end of file
+        import crm.signals
+        from django.db.backends.signals import connection_created
+        from crm import dbhooks
+
+        connection_created.connect(dbhooks.install, dispatch_uid='crm.dbhooks.install')
@@ -0,0 +1,193 @@
+"""
+Замеры производительности API (manage.py benchmark_api).
+
+Обходит все GET-маршруты crm/urls.py и plan/urls.py на текущей базе (обычно
+заполненной manage.py seed_scale), для каждого считает SQL-запросы (холодный
+запрос — после очистки кеша, и повторный) и перцентили времени ответа.
+Отчет в JSON можно сравнить с отчетом другого коммита (compare_reports).
+"""
+import math
+import re
+import subprocess
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from plan.models import Project, Task, Checklist, Team
+from .models import Event, Application, Profile
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Маршруты, которые нельзя дергать в замерах
+SKIP = {
+    'google/callback': 'внешняя OAuth-авторизация',
+}
+# Параметры запроса, без которых маршрут не возвращает данные
+QUERY_PARAMS = {
+    'search/': {'q': 'иван'},
+}
+# Модель параметра <pk> во вложенных маршрутах: tasks/<pk>/comments/ — это задача
+SEGMENT_MODELS = {
+    'tasks': Task,
+    'checklists': Checklist,
+    'project': Project,
+}
+DATASET_MODELS = (Event, Project, Team, Profile, Task, Application)
+
+Route = namedtuple('Route', ['route', 'callback'])
+
+
+def route_string(pattern):
+    """'events/<int:pk>' для path() и 'direction/<pk>/' для маршрутов роутера DRF"""
+    route = str(pattern)
+    if route.startswith('^'):
+        route = re.sub(r'\(\?P<(\w+)>[^)]*\)', r'<\1>', route.strip('^$'))
+    return route
+
+
+def collect_routes():
+    """GET-маршруты API и пропущенные маршруты с причиной"""
+    from crm import urls as crm_urls
+    from plan import urls as plan_urls
+
+    routes, skipped = [], {}
+    for pattern in [*crm_urls.urlpatterns, *plan_urls.urlpatterns]:
+        route = route_string(pattern.pattern)
+        callback = pattern.callback
+        view_class = getattr(callback, 'cls', None)
+        actions = getattr(callback, 'actions', None)
+
+        if route in SKIP:
+            skipped[route] = SKIP[route]
+        elif view_class is None:
+            skipped[route] = 'не DRF-представление'
+        elif not ('get' in actions if actions is not None else hasattr(view_class, 'get')):
+            skipped[route] = 'нет GET'
+        else:
+            routes.append(Route(route, callback))
+    return routes, skipped
+
+
+def sample_model(route, callback):
+    before, _, after = route.partition('<')
+    if after.split('>', 1)[1].strip('/'):
+        return SEGMENT_MODELS.get(before.strip('/').split('/')[-1])
+    queryset = getattr(callback.cls, 'queryset', None)
+    return queryset.model if queryset is not None else None
+
+
+def build_url(route, callback):
+    """URL с id существующего объекта вместо параметров; None, если подставить нечего"""
+    if '<' not in route:
+        return f'/api/{route}'
+    model = sample_model(route, callback)
+    pk = model.objects.order_by('pk').values_list('pk', flat=True).first() if model is not None else None
+    if pk is None:
+        return None
+    return '/api/' + re.sub(r'<(?:\w+:)?\w+>', str(pk), route)
+
+
+def percentile(sorted_values, p):
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+class QueryCounter:
+    """
+    Считает запросы через execute_wrapper. CaptureQueriesContext тут не подходит:
+    при DEBUG=True сигнал request_started очищает connection.queries посреди замера
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(client, url, params, iterations, warmup):
+    cache.clear()
+    cold = QueryCounter()
+    with connection.execute_wrapper(cold):
+        response = client.get(url, params, HTTP_ACCEPT='application/json')
+    for _ in range(warmup):
+        client.get(url, params, HTTP_ACCEPT='application/json')
+
+    timings = []
+    for _ in range(iterations):
+        warm = QueryCounter()
+        with connection.execute_wrapper(warm):
+            started = time.perf_counter()
+            client.get(url, params, HTTP_ACCEPT='application/json')
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    result = {
+        'url': url,
+        'status': response.status_code,
+        'bytes': len(response.content),
+        'cold_queries': cold.count,
+        'warm_queries': warm.count,
+        'mean_ms': round(sum(timings) / len(timings), 2),
+        'max_ms': round(timings[-1], 2),
+    }
+    result.update({f'p{p}_ms': round(percentile(timings, p), 2) for p in PERCENTILES})
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(user, iterations=20, warmup=2, only=None):
+    """Отчет о замерах: время ответа и число запросов по маршрутам"""
+    host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+    # Ошибка представления попадает в отчет как статус 500, а не прерывает замеры
+    client = APIClient(raise_request_exception=False, HTTP_HOST=host)
+    client.force_authenticate(user)
+
+    routes, skipped = collect_routes()
+    results = {}
+    for route in routes:
+        if only and not route.route.startswith(only):
+            continue
+        url = build_url(route.route, route.callback)
+        if url is None:
+            skipped[route.route] = 'нет данных для параметров'
+            continue
+        results[route.route] = measure(client, url, QUERY_PARAMS.get(route.route, {}), iterations, warmup)
+
+    return {
+        'created_at': timezone.now().isoformat(),
+        'git_commit': git_commit(),
+        'database': connection.vendor,
+        'user': user.username,
+        'iterations': iterations,
+        'dataset': {model.__name__: model.objects.count() for model in DATASET_MODELS},
+        'routes': results,
+        'skipped': skipped,
+    }
+
+
+def compare_reports(baseline, report, metric='p95_ms'):
+    """Строки сравнения двух отчетов по маршрутам, которые есть в обоих"""
+    lines = []
+    for route, result in report['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if before is None:
+            continue
+        change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0
+        lines.append(
+            f'{route:45} {metric} {before[metric]:>9.2f} → {result[metric]:>9.2f} ({change:+.0f}%)  '
+            f'запросы {before["cold_queries"]} → {result["cold_queries"]}'
+        )
+    return lines
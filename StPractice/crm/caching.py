@@ -0,0 +1,122 @@
+"""
+Условные GET-запросы и кеш готовых ответов для справочных данных.
+
+Для каждой модели в кеше хранится счетчик версии, который сигналы (crm.signals)
+увеличивают при любом изменении. ETag ответа — хеш пути, параметров запроса и
+версий моделей, от которых зависит ответ. Поэтому:
+- на If-None-Match с актуальным ETag отвечаем 304 без запросов к БД и сериализатора;
+- отрендеренные байты JSON лежат в общем кеше под тем же хешем и не пересчитываются,
+  пока не изменится одна из моделей.
+Ответу, который выводит только число строк модели, достаточно версии состава
+строк rows_of(модель): она меняется лишь при создании и удалении, а не при каждом
+изменении строки.
+Для нескольких процессов нужен общий кеш (CACHES в settings: Redis или таблица в БД),
+иначе у каждого процесса свои версии.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+
+def cache_is_shared():
+    """Кеш общий для всех процессов (Redis, БД), а не память текущего воркера"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def rows_of(model):
+    """Версия состава строк модели — для ответов со счетчиками"""
+    return f'{model._meta.label_lower}:rows'
+
+
+def version_key(model):
+    """model — модель или версия состава строк rows_of(model)"""
+    label = model if isinstance(model, str) else model._meta.label_lower
+    return f'crm:version:{label}'
+
+
+def _initial_version():
+    # Версия не должна повториться после очистки кеша, иначе старый ETag снова станет актуальным
+    return time.time_ns() // 1000
+
+
+def get_versions(models):
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    key = version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Версии еще нет — любое новое значение отличается от прежних
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def bump_version_on_commit(model):
+    """
+    Увеличивает версию сразу и еще раз после фиксации транзакции: ответ, собранный
+    другим запросом до фиксации, мог попасть в кеш уже под новой версией
+    """
+    bump_version(model)
+    transaction.on_commit(lambda: bump_version(model))
+
+
+class CachedResponseMixin:
+    """
+    Кеширует JSON-ответы list/retrieve и отвечает 304 на If-None-Match.
+    cache_models — модели, от которых зависит ответ (или переопределить get_cache_models).
+    """
+    cache_models = ()
+
+    def get_cache_models(self):
+        return self.cache_models
+
+    def get_cache_digest(self, request):
+        parts = [request.path, *(f'{key}={value}' for key, value in sorted(request.query_params.lists()))]
+        parts += map(str, get_versions(self.get_cache_models()))
+        return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+    def cached_response(self, request, build):
+        if request.accepted_renderer.format != 'json':
+            return build()  # Browsable API и прочие форматы не кешируем
+
+        digest = self.get_cache_digest(request)
+        etag = quote_etag(digest)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            key = f'crm:response:{digest}'
+            content = cache.get(key)
+            if content is None:
+                response = build()
+                if response.status_code != 200:
+                    return response
+                content = JSONRenderer().render(response.data)
+                cache.set(key, content, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 600))
+            response = HttpResponse(content, content_type='application/json')
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
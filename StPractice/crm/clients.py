@@ -0,0 +1,67 @@
+"""
+Общий асинхронный HTTP-клиент для внешних API (Telegram, ВКонтакте).
+
+На каждый event loop создается один httpx.AsyncClient с пулом соединений, поэтому
+роботы автоматизации и асинхронная отправка очереди держат сотни одновременных
+запросов на нескольких TCP-соединениях без потоков. Адреса API задаются настройками
+TELEGRAM_API_URL и VK_API_URL (в тестах — локальный сервер-заглушка).
+
+Вызов из синхронного кода (async_to_sync, asyncio.run) получает собственный event
+loop, и клиент этого loop никто бы не закрыл. Поэтому такие точки входа
+оборачиваются в http_session: корутина и все запущенные ею задачи работают с
+отдельным клиентом, который закрывается по ее завершении.
+"""
+import asyncio
+import contextvars
+import functools
+import weakref
+
+import httpx
+from django.conf import settings
+
+_clients = weakref.WeakKeyDictionary()
+_session_client = contextvars.ContextVar('http_session_client', default=None)
+
+
+def create_http_client():
+    connections = getattr(settings, 'ASYNC_HTTP_MAX_CONNECTIONS', 100)
+    return httpx.AsyncClient(
+        timeout=10,
+        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+    )
+
+
+def get_http_client():
+    """Клиент текущей http_session, а вне ее — общий клиент долгоживущего event loop (ASGI)"""
+    client = _session_client.get()
+    if client is not None:
+        return client
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = create_http_client()
+    return client
+
+
+def http_session(func):
+    """Корутина-функция со своим клиентом на время вызова; клиент закрывается при выходе"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _session_client.get() is not None:
+            return await func(*args, **kwargs)
+        client = create_http_client()
+        token = _session_client.set(client)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _session_client.reset(token)
+            await client.aclose()
+    return wrapper
+
+
+def telegram_url(method, token=None):
+    return f"{settings.TELEGRAM_API_URL}/bot{token or settings.TELEGRAM_BOT_TOKEN}/{method}"
+
+
+def vk_url(method):
+    return f"{settings.VK_API_URL}/{method}"
@@ -0,0 +1,36 @@
+"""
+Подписка на SQL-запросы текущего запроса.
+
+connection.execute_wrapper действует только на соединение своего потока, а под ASGI
+синхронный код представления выполняется не в том потоке, где работает middleware.
+Поэтому на каждое соединение при создании ставится одна обертка, которая передает
+запрос слушателям из contextvar: asgiref копирует контекст в потоки sync_to_async,
+и слушатели видят запросы запроса, в каком бы потоке они ни выполнялись.
+Слушатель — вызываемый объект с сигнатурой execute_wrapper.
+"""
+import contextvars
+import functools
+from contextlib import contextmanager
+
+_listeners = contextvars.ContextVar('crm_query_listeners', default=())
+
+
+@contextmanager
+def listen_queries(listener):
+    token = _listeners.set((*_listeners.get(), listener))
+    try:
+        yield listener
+    finally:
+        _listeners.reset(token)
+
+
+def _dispatch(execute, sql, params, many, context):
+    for listener in reversed(_listeners.get()):
+        execute = functools.partial(listener, execute)
+    return execute(sql, params, many, context)
+
+
+def install(sender=None, connection=None, **kwargs):
+    """Обработчик connection_created: ставит обертку-диспетчер на соединение"""
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
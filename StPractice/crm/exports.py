@@ -0,0 +1,283 @@
+"""
+Потоковая выгрузка заявок мероприятия в CSV и XLSX.
+
+Строки читаются плоскими кортежами (values_list) порциями по EXPORT_CHUNK_SIZE
+с продолжением по первичному ключу и сразу отдаются в StreamingHttpResponse,
+поэтому память не растет с числом заявок, а первые байты уходят клиенту до
+чтения всей выборки. Порции по ключу, а не один .iterator(): драйвер MySQL без
+серверных курсоров читает весь результат запроса в память.
+
+XLSX собирается без сторонних библиотек: zip-архив пишется потоком (zipfile
+умеет писать в поток без seek), лист — строками inlineStr.
+
+ASGI-обработчик Django 4.1 перебирает потоковый ответ прямо в event loop, где
+синхронные запросы к БД запрещены. Поэтому StPractice.asgi использует
+StreamingASGIHandler: он берет каждый кусок ответа в потоке запроса через
+sync_to_async, там же, где выполнялось представление, а event loop только
+отправляет готовые байты.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.utils import timezone
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# (поле values_list, заголовок столбца)
+APPLICATION_COLUMNS = [
+    ('id', 'ID заявки'),
+    ('user_id', 'ID пользователя'),
+    ('status__name', 'Статус'),
+    ('direction__name', 'Направление'),
+    ('specialization__name', 'Специализация'),
+    ('project__name', 'Проект'),
+    ('is_approved', 'Заявка одобрена'),
+    ('is_link', 'Состоит в чате'),
+    ('message', 'Текст заявки'),
+    ('comment', 'Отзыв'),
+    ('date_sub', 'Дата подачи'),
+    ('date_end', 'Дата изменения'),
+]
+
+# Дополнительные группы столбцов (?include=profile,team)
+EXTRA_COLUMNS = {
+    'profile': [
+        ('user__surname', 'Фамилия'),
+        ('user__name', 'Имя'),
+        ('user__patronymic', 'Отчество'),
+        ('user__email', 'Email'),
+        ('user__telegram', 'Telegram'),
+        ('user__vk', 'VK'),
+        ('user__university', 'Университет'),
+        ('user__course', 'Курс'),
+        ('user__job', 'Место работы'),
+    ],
+    'team': [
+        ('team_id', 'ID команды'),
+        ('team__name', 'Команда'),
+        ('team__project__name', 'Проект команды'),
+        ('team__curator__surname', 'Фамилия куратора'),
+        ('team__curator__name', 'Имя куратора'),
+        ('team__chat', 'Чат команды'),
+        ('team__drive', 'Диск команды'),
+    ],
+}
+
+ROWS_PER_CHUNK = 500  # Сколько строк файла отдается клиенту одним куском
+
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def application_columns(include=()):
+    columns = list(APPLICATION_COLUMNS)
+    for group, group_columns in EXTRA_COLUMNS.items():
+        if group in include:
+            columns += group_columns
+    return columns
+
+
+def iter_rows(queryset, fields, chunk_size=None):
+    """Кортежи значений fields порциями по первичному ключу"""
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+# Начало текста, с которого Excel и LibreOffice читают ячейку CSV как формулу
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def format_value(value, escape_formulas=False):
+    """
+    Значение ячейки в виде текста: даты в местном времени, булевы — Да/Нет.
+    escape_formulas — для CSV: текст, похожий на формулу, начинается с апострофа
+    и открывается как текст (CSV injection). Числа не экранируются
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Да' if value else 'Нет'
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    if escape_formulas and isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return str(value)
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    # BOM, чтобы Excel открыл UTF-8 с кириллицей без мастера импорта
+    lines = ['\ufeff' + writer.writerow(header)]
+    for row in rows:
+        lines.append(writer.writerow([format_value(value, escape_formulas=True) for value in row]))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+class _ZipBuffer:
+    """Поток без seek для zipfile: копит записанные байты до следующего куска ответа"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def column_letter(index):
+    """Буквенное имя столбца по номеру с нуля: 0 → A, 26 → AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def xlsx_cell(reference, value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    # Строка inlineStr в XLSX не вычисляется как формула, экранировать ее не нужно
+    text = escape(_INVALID_XML.sub('', format_value(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_row(number, values, letters):
+    cells = ''.join(xlsx_cell(f'{letter}{number}', value) for letter, value in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def stream_xlsx(header, rows, sheet_name='Заявки'):
+    letters = [column_letter(index) for index in range(len(header))]
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write((XLSX_SHEET_HEAD + xlsx_row(1, header, letters)).encode())
+            yield buffer.pop()
+            for number, row in enumerate(rows, start=2):
+                sheet.write(xlsx_row(number, row, letters).encode())
+                if number % ROWS_PER_CHUNK == 0:
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            sheet.write(XLSX_SHEET_TAIL.encode())
+    yield buffer.pop()
+
+
+def stream_export(file_format, columns, rows):
+    header = [title for _, title in columns]
+    if file_format == 'xlsx':
+        return stream_xlsx(header, rows)
+    return stream_csv(header, rows)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ASGI-обработчик Django, который перебирает потоковые ответы вне event loop"""
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [(header.encode('ascii'), value.encode('latin1')) for header, value in response.items()]
+        headers += [(b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+                    for cookie in response.cookies.values()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, None)) is not None:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,199 @@
+"""
+Проверка тестов мероприятий (Test, Question, True_Answer, Answer) и таблица лидеров.
+
+Попытка участника — его ответы на вопросы одного теста; новая попытка заменяет
+прежние ответы. Проверка идет множествами: правильные ответы нужных вопросов
+загружаются одним запросом в {question_id: множество нормализованных ответов},
+после чего каждый ответ проверяется поиском в множестве, а ответы сохраняются
+bulk_create пачками. Так же пересчитываются сохраненные ответы при изменении
+правильных ответов или баллов вопроса (regrade, manage.py grade_tests).
+
+Баллы и прохождение теста (порог Test.entry в процентах от суммы баллов вопросов)
+считаются агрегатными запросами, без обхода ответов в Python.
+
+Триггер автоматизации test_result ({"test": id, "passed": true}) проверяет
+результат автора заявки; после проверки попытки цепочки заявок участника на
+мероприятие теста продолжаются с шага после такого триггера, как и для
+временных триггеров (crm.scheduler).
+"""
+import re
+from collections import namedtuple
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.db.models import Sum
+
+from .caching import bump_version_on_commit
+from .clients import http_session
+from .models import Answer, Application, Profile, Question, Test, True_Answer
+from .robots_triggers import check_trigger, get_plan, run_steps
+from .search import profile_title
+
+BATCH_SIZE = 1000
+TEST_TRIGGER = 'test_result'
+
+TestResult = namedtuple('TestResult', ['test_id', 'user_id', 'score', 'max_score', 'percent', 'passed'])
+
+_SPACES = re.compile(r'\s+')
+_EDGE_PUNCTUATION = ' .,;:!?"\'«»()'
+
+
+def normalize_answer(text):
+    """Регистр, ё/е, лишние пробелы и знаки препинания по краям не влияют на проверку"""
+    text = _SPACES.sub(' ', str(text).casefold().replace('ё', 'е'))
+    return text.strip(_EDGE_PUNCTUATION)
+
+
+def answer_keys(question_ids=None):
+    """{question_id: (балл за вопрос, множество нормализованных правильных ответов)}"""
+    questions = Question.objects.all()
+    true_answers = True_Answer.objects.all()
+    if question_ids is not None:
+        questions = questions.filter(pk__in=question_ids)
+        true_answers = true_answers.filter(question_id__in=question_ids)
+
+    keys = {question_id: (count, set()) for question_id, count in questions.values_list('pk', 'count')}
+    for question_id, text in true_answers.values_list('question_id', 'true_answer'):
+        keys[question_id][1].add(normalize_answer(text))
+    return keys
+
+
+def grade_answer(answer, keys):
+    """Проставляет балл ответу; True, если балл изменился"""
+    count, correct = keys.get(answer.question_id, (0, ()))
+    score = count if normalize_answer(answer.answer) in correct else 0
+    changed = answer.count != score
+    answer.count = score
+    return changed
+
+
+def grade_attempts(test, attempts):
+    """
+    Проверяет и сохраняет попытки теста: attempts — {user_id: {question_id: ответ}}.
+    Прежние ответы этих участников на вопросы теста заменяются. Возвращает результаты
+    {user_id: TestResult}
+    """
+    keys = answer_keys(Question.objects.filter(test=test).values('pk'))
+    unknown = {question_id for answers in attempts.values() for question_id in answers} - set(keys)
+    if unknown:
+        raise ValueError(f'Вопросы {sorted(unknown)} не относятся к тесту {test.pk}')
+
+    user_ids = list(attempts)
+    with transaction.atomic():
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            Answer.objects.filter(user_id__in=batch, question_id__in=keys).delete()
+            answers = [
+                Answer(question_id=question_id, user_id=user_id, answer=str(text)[:100], count=0)
+                for user_id in batch
+                for question_id, text in attempts[user_id].items()
+            ]
+            for answer in answers:
+                grade_answer(answer, keys)
+            Answer.objects.bulk_create(answers, batch_size=BATCH_SIZE)
+        bump_version_on_commit(Answer)
+
+    return {result.user_id: result for result in test_results([test.pk], user_ids)}
+
+
+def regrade(question_ids=None, batch_size=BATCH_SIZE):
+    """Пересчитывает баллы сохраненных ответов. Возвращает число измененных ответов"""
+    keys = answer_keys(question_ids)
+    answers = Answer.objects.order_by('pk').only('pk', 'question_id', 'answer', 'count')
+    if question_ids is not None:
+        answers = answers.filter(question_id__in=question_ids)
+
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(answers.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        changed = [answer for answer in batch if grade_answer(answer, keys)]
+        Answer.objects.bulk_update(changed, ['count'], batch_size=batch_size)
+        updated += len(changed)
+        last_pk = batch[-1].pk
+    if updated:
+        bump_version_on_commit(Answer)
+    return updated
+
+
+def test_results(test_ids, user_ids=None):
+    """Результаты участников, отвечавших на тесты: [TestResult], два агрегатных запроса"""
+    tests = dict(Test.objects.filter(pk__in=test_ids).values_list('pk', 'entry'))
+    max_scores = dict(
+        Question.objects.filter(test_id__in=tests).order_by().values('test_id')
+        .annotate(total=Sum('count')).values_list('test_id', 'total')
+    )
+    scores = Answer.objects.filter(question__test_id__in=tests)
+    if user_ids is not None:
+        scores = scores.filter(user_id__in=user_ids)
+    scores = scores.order_by().values('question__test_id', 'user_id').annotate(score=Sum('count'))
+
+    results = []
+    for row in scores.values_list('question__test_id', 'user_id', 'score'):
+        test_id, user_id, score = row
+        max_score = max_scores.get(test_id) or 0
+        percent = round(score * 100 / max_score, 1) if max_score else 0.0
+        passed = max_score > 0 and score * 100 >= tests[test_id] * max_score
+        results.append(TestResult(test_id, user_id, score, max_score, percent, passed))
+    return results
+
+
+def has_passed(user_id, test_id):
+    results = test_results([test_id], [user_id])
+    return bool(results) and results[0].passed
+
+
+def leaderboard(event_id, limit=50):
+    """Участники мероприятия по числу пройденных тестов и сумме баллов"""
+    test_ids = list(Test.objects.filter(event_id=event_id).values_list('pk', flat=True))
+    rows = {}
+    for result in test_results(test_ids):
+        row = rows.setdefault(result.user_id, {'user_id': result.user_id, 'score': 0, 'passed': 0, 'tests': 0})
+        row['score'] += result.score
+        row['passed'] += result.passed
+        row['tests'] += 1
+
+    top = sorted(rows.values(), key=lambda row: (-row['passed'], -row['score'], row['user_id']))[:limit]
+    names = Profile.objects.in_bulk([row['user_id'] for row in top])
+    for place, row in enumerate(top, start=1):
+        row['place'] = place
+        row['name'] = profile_title(names[row['user_id']]) if row['user_id'] in names else ''
+    return {'tests': len(test_ids), 'results': top}
+
+
+def submit_attempts(test, attempts):
+    """
+    Проверяет попытки и продолжает цепочки автоматизации участников, у которых
+    изменился итог теста (прошел/не прошел или это первая попытка)
+    """
+    before = {result.user_id: result.passed for result in test_results([test.pk], list(attempts))}
+    results = grade_attempts(test, attempts)
+    changed = [user_id for user_id, result in results.items() if before.get(user_id) != result.passed]
+    if changed:
+        resume_test_triggers(test, changed)
+    return results
+
+
+def resume_test_triggers(test, user_ids):
+    """Продолжает цепочки заявок участников после триггеров test_result этого теста"""
+    applications = list(
+        Application.objects.filter(event_id=test.event_id, user_id__in=user_ids).select_related('status')
+    )
+    if applications:
+        async_to_sync(_resume_applications)(applications, test.pk)
+
+
+@http_session
+async def _resume_applications(applications, test_id):
+    for application in applications:
+        plan = await sync_to_async(get_plan)(application.event_id, application.status_id)
+        index = next((i for i, step in enumerate(plan)
+                      if step.action == TEST_TRIGGER and step.config.get('test') == test_id), None)
+        if index is None:
+            continue
+        # Шаги до триггера уже выполнены при входе в статус; предыдущие условия должны выполняться
+        gates = [step for step in plan[:index + 1] if step.type_function == 'trigger']
+        if all([await check_trigger(step, application) for step in gates]):
+            await run_steps(plan[index + 1:], application)
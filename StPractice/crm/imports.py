@@ -0,0 +1,244 @@
+"""
+Массовый импорт участников из CSV или JSONL (manage.py import_participants, POST /api/import/participants/).
+
+Файл читается потоково и обрабатывается порциями по IMPORT_CHUNK_SIZE строк, каждая
+порция — одна транзакция: User, Profile, Role, Contact и Application создаются
+через bulk_create, поэтому сигналы crm.signals не срабатывают: профили, роли,
+почтовые контакты и письма подтверждения создает пачкой crm.onboarding, а сроки
+временных триггеров, поисковые документы заявок и версии закешированных ответов
+обновляются здесь.
+
+Ошибочные строки не прерывают импорт: они попадают в отчет с номером строки.
+Если порция упала на ограничении целостности (например, тот же логин
+параллельно создан регистрацией), она повторяется по одной строке.
+
+Столбцы: username (по умолчанию email), email, password (без пароля вход через
+восстановление), surname, name, patronymic, telegram, vk, university, job, course;
+для заявки на мероприятие — direction, specialization, status (названия) и message.
+Существующие пользователи не изменяются, для них создается только заявка.
+"""
+import codecs
+import csv
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .caching import bump_version_on_commit, rows_of
+from .models import Application, Profile, SearchDocument, Status_order
+from .onboarding import onboard_users
+from .scheduler import schedule_time_triggers
+from .search import build_document
+from .serializers import ParticipantImportRowSerializer
+
+FORMATS = ('csv', 'jsonl')
+PROFILE_FIELDS = ('surname', 'name', 'patronymic', 'email', 'telegram', 'vk', 'university', 'job', 'course')
+
+
+def detect_format(filename):
+    return 'jsonl' if str(filename).lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(file, file_format):
+    """
+    Строки файла по одной: (номер строки, dict или None, ошибка разбора или None).
+    file — бинарный файл или загруженный файл Django, читается построчно
+    """
+    lines = codecs.iterdecode(file, 'utf-8-sig')
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'Некорректный JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Строка должна быть JSON-объектом'
+            continue
+        yield number, row, None
+
+
+def clean_row(row):
+    """Пустые ячейки CSV и лишние столбцы без заголовка не считаются значениями"""
+    return {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in row.items()
+        if key is not None and value not in ('', None)
+    }
+
+
+class ParticipantImporter:
+    def __init__(self, event=None, chunk_size=None):
+        self.event = event
+        self.chunk_size = chunk_size or getattr(settings, 'IMPORT_CHUNK_SIZE', 500)
+        self.rows = 0
+        self.created = Counter()
+        self.errors = []
+        if event is not None:
+            self.directions = {direction.name: direction for direction in event.directions.all()}
+            self.specializations = {specialization.name: specialization
+                                    for specialization in event.specializations.all()}
+            orders = list(Status_order.objects.filter(event=event).select_related('status').order_by('number'))
+            self.statuses = {}
+            for order in orders:
+                self.statuses.setdefault(order.status.name, order.status)
+            # Без столбца status заявка попадает в первый статус воронки
+            self.default_status = orders[0].status if orders else None
+
+    def run(self, rows):
+        """Импортирует строки из read_rows и возвращает отчет"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self.process_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.process_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'created': {key: self.created[key] for key in ('users', 'applications', 'emails')},
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+    def error(self, line, errors):
+        if isinstance(errors, str):
+            errors = {'non_field_errors': [errors]}
+        self.errors.append({'line': line, 'errors': errors})
+
+    def process_chunk(self, chunk):
+        self.rows += len(chunk)
+        valid = self.validate(chunk)
+        try:
+            with transaction.atomic():
+                created = self.save(valid)
+        except IntegrityError:
+            # Конфликт с параллельной записью — сохраняем по одной строке, чтобы найти виновную
+            created = Counter()
+            for line, data in valid:
+                try:
+                    with transaction.atomic():
+                        created += self.save([(line, data)])
+                except IntegrityError as e:
+                    self.error(line, str(e))
+        self.created += created
+
+    def validate(self, chunk):
+        """Проверяет строки порции: [(номер строки, данные)], ошибки попадают в отчет"""
+        valid = []
+        seen = set()
+        for line, row, parse_error in chunk:
+            if parse_error:
+                self.error(line, parse_error)
+                continue
+            serializer = ParticipantImportRowSerializer(data=clean_row(row))
+            if not serializer.is_valid():
+                self.error(line, serializer.errors)
+                continue
+            data = dict(serializer.validated_data)
+            if data['username'] in seen:
+                self.error(line, {'username': f'Логин {data["username"]} повторяется в файле'})
+                continue
+            if self.event is not None and not self.resolve(line, data):
+                continue
+            seen.add(data['username'])
+            valid.append((line, data))
+
+        if self.event is not None:
+            applied = set(Application.objects.filter(
+                event=self.event, user__user__username__in=seen
+            ).values_list('user__user__username', flat=True))
+            for line, data in valid:
+                if data['username'] in applied:
+                    self.error(line, {'username': 'Заявка на мероприятие уже подана'})
+            valid = [(line, data) for line, data in valid if data['username'] not in applied]
+        return valid
+
+    def resolve(self, line, data):
+        """Заменяет названия направления, специализации и статуса объектами мероприятия"""
+        errors = {}
+        for field, choices in (('direction', self.directions), ('specialization', self.specializations)):
+            if field in data:
+                data[field] = choices.get(data[field])
+                if data[field] is None:
+                    errors[field] = f'Нет у мероприятия: {", ".join(sorted(choices)) or "список пуст"}'
+        if 'status' in data:
+            data['status'] = self.statuses.get(data['status'])
+            if data['status'] is None:
+                errors['status'] = f'Нет в воронке мероприятия: {", ".join(self.statuses) or "воронка пуста"}'
+        elif self.default_status is None:
+            errors['status'] = 'У мероприятия не настроены статусы заявок'
+        else:
+            data['status'] = self.default_status
+        if errors:
+            self.error(line, errors)
+        return not errors
+
+    def save(self, valid):
+        created = Counter()
+        if not valid:
+            return created
+        usernames = [data['username'] for _, data in valid]
+        existing = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        new_rows = [data for _, data in valid if data['username'] not in existing]
+
+        users = User.objects.bulk_create([
+            User(username=data['username'], email=data.get('email', ''), password=make_password(data.get('password')))
+            for data in new_rows
+        ])
+        if users and users[0].pk is None:
+            # СУБД не возвращает id из bulk_create (MySQL)
+            ids = dict(User.objects.filter(username__in=[user.username for user in users])
+                       .values_list('username', 'pk'))
+            for user in users:
+                user.pk = ids[user.username]
+        user_ids = {user.username: user.pk for user in users}
+
+        onboarded = onboard_users(users, {
+            user_ids[data['username']]: {field: data[field] for field in PROFILE_FIELDS if field in data}
+            for data in new_rows
+        })
+        created['users'] = len(onboarded.profiles)
+        created['emails'] = len(onboarded.contacts)
+
+        if self.event is not None:
+            applications = self.create_applications(valid, {**existing, **user_ids}, onboarded.profiles)
+            schedule_time_triggers(applications)
+            SearchDocument.objects.bulk_create([build_document(application) for application in applications])
+            created['applications'] = len(applications)
+            bump_version_on_commit(Application)
+            bump_version_on_commit(rows_of(Application))
+        return created
+
+    def create_applications(self, valid, user_ids, new_profiles):
+        profiles = {profile.pk: profile for profile in new_profiles}
+        missing = set(user_ids.values()) - set(profiles)
+        profiles.update(Profile.objects.in_bulk(missing))
+
+        applications = Application.objects.bulk_create([
+            Application(
+                user=profiles[user_ids[data['username']]], event=self.event, status=data['status'],
+                direction=data.get('direction'), specialization=data.get('specialization'),
+                message=data.get('message'),
+            )
+            for _, data in valid
+        ])
+        if applications and applications[0].pk is None:
+            ids = dict(Application.objects.filter(
+                event=self.event, user_id__in=[application.user_id for application in applications]
+            ).values_list('user_id', 'pk'))
+            for application in applications:
+                application.pk = ids[application.user_id]
+        return applications
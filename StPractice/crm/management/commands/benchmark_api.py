@@ -0,0 +1,45 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmark import run_benchmark, compare_reports
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время ответа и число SQL-запросов всех GET-маршрутов API и пишет отчет в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmark.json', help='Файл отчета')
+        parser.add_argument('--compare', help='Отчет предыдущего коммита для сравнения')
+        parser.add_argument('--iterations', type=int, default=20, help='Замеров на маршрут')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на маршрут')
+        parser.add_argument('--user', help='Пользователь, от имени которого идут запросы (по умолчанию суперпользователь)')
+        parser.add_argument('--route', help='Замерять только маршруты с этим префиксом')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля')
+        users = User.objects.filter(username=options['user']) if options['user'] else \
+            User.objects.filter(is_superuser=True).order_by('pk')
+        user = users.first()
+        if user is None:
+            raise CommandError('Пользователь не найден — укажите --user или создайте данные через seed_scale')
+
+        report = run_benchmark(user, options['iterations'], options['warmup'], options['route'])
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+        for route, result in report['routes'].items():
+            self.stdout.write(f'{route:45} {result["status"]}  p50 {result["p50_ms"]:>8.2f}  '
+                              f'p95 {result["p95_ms"]:>8.2f} мс  запросы {result["cold_queries"]}/{result["warm_queries"]}')
+        for route, reason in report['skipped'].items():
+            self.stdout.write(f'{route:45} пропущен: {reason}')
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            self.stdout.write(f'\nСравнение с {options["compare"]} ({baseline.get("git_commit")}):')
+            for line in compare_reports(baseline, report):
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'Отчет записан в {options["output"]}'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.grading import regrade
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает баллы сохраненных ответов на тесты по текущим правильным ответам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--question', type=int, action='append', dest='questions',
+                            help='Только ответы на вопрос (можно указать несколько раз)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сколько ответов обновлять за раз')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = regrade(options['questions'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Изменено ответов: {updated} за {time.monotonic() - started:.1f} с'
+        ))
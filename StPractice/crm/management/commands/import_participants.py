@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.imports import FORMATS, ParticipantImporter, detect_format, read_rows
+from crm.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Импортирует участников и их заявки из CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу')
+        parser.add_argument('--event', type=int, help='Мероприятие, на которое создаются заявки')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию — по расширению)')
+        parser.add_argument('--chunk-size', type=int, help='Сколько строк сохранять одной транзакцией')
+
+    def handle(self, *args, **options):
+        event = None
+        if options['event'] is not None:
+            event = Event.objects.filter(pk=options['event']).first()
+            if event is None:
+                raise CommandError(f'Мероприятие {options["event"]} не найдено')
+
+        started = time.monotonic()
+        importer = ParticipantImporter(event, chunk_size=options['chunk_size'])
+        try:
+            with open(options['path'], 'rb') as file:
+                report = importer.run(read_rows(file, options['format'] or detect_format(options['path'])))
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f'Не удалось прочитать файл: {e}')
+
+        for error in report['errors']:
+            self.stderr.write(f'Строка {error["line"]}: {error["errors"]}')
+        created = report['created']
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк: {report["rows"]}, пользователей: {created["users"]}, заявок: {created["applications"]}, '
+            f'писем: {created["emails"]}, ошибок: {len(report["errors"])} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
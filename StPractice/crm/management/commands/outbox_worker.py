@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.clients import http_session
+from crm.outbox import process_batch, aprocess_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправляет сообщения из очереди OutboundMessage (Telegram, ВК, почта)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Сколько сообщений забирать за раз')
+        parser.add_argument('--interval', type=float, default=2, help='Пауза (сек) когда очередь пуста')
+        parser.add_argument('--once', action='store_true', help='Обработать одну пачку и выйти')
+        parser.add_argument('--async', action='store_true', dest='use_async',
+                            help='Отправлять пачку параллельно (до OUTBOX_CONCURRENCY запросов одновременно)')
+
+    def handle(self, *args, **options):
+        if options['use_async']:
+            asyncio.run(self.run_async(options))
+            return
+
+        limiters = {}
+        while True:
+            sent, failed = process_batch(options['batch_size'], limiters)
+            if self.report(sent, failed, options):
+                break
+            if not sent and not failed:
+                time.sleep(options['interval'])
+
+    @http_session
+    async def run_async(self, options):
+        limiters = {}
+        while True:
+            sent, failed = await aprocess_batch(options['batch_size'], limiters)
+            if self.report(sent, failed, options):
+                break
+            if not sent and not failed:
+                await asyncio.sleep(options['interval'])
+
+    def report(self, sent, failed, options):
+        """Печатает итог пачки; True — пора выйти (--once)"""
+        if sent or failed:
+            self.stdout.write(f'Отправлено: {sent}, с ошибкой: {failed}')
+        return options['once']
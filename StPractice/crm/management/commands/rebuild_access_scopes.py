@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from crm.models import Profile
+from crm.scopes import refresh_scopes
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает области видимости (AccessScope) всех профилей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько профилей пересчитывать за раз')
+
+    def handle(self, *args, **options):
+        profile_ids = list(Profile.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(profile_ids), batch_size):
+            refresh_scopes(profile_ids[start:start + batch_size])
+        self.stdout.write(f'Пересчитано профилей: {len(profile_ids)}')
@@ -0,0 +1,66 @@
+import io
+import pstats
+import shutil
+import tracemalloc
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.profiling import list_profiles, load_profile, profile_dir
+
+
+class Command(BaseCommand):
+    help = 'Показывает профили запросов, снятые по X-Profile: 1 (crm.profiling)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?', help='Id профиля: вывести сводку по нему')
+        parser.add_argument('--sort', choices=['cumulative', 'tottime', 'calls'], default='cumulative',
+                            help='Сортировка функций cProfile')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько строк выводить в каждом разделе')
+        parser.add_argument('--clear', action='store_true', help='Удалить все сохраненные профили')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            shutil.rmtree(profile_dir(), ignore_errors=True)
+            self.stdout.write('Профили удалены')
+        elif options['profile_id']:
+            self.summarize(options['profile_id'], options['sort'], options['limit'])
+        else:
+            self.list()
+
+    def list(self):
+        profiles = list_profiles()
+        if not profiles:
+            self.stdout.write(f'Профилей нет ({profile_dir()})')
+        for meta in profiles:
+            self.stdout.write(
+                f'{meta["id"]}  {meta["created_at"]}  {meta["method"]} {meta["path"]}  {meta["status"]}  '
+                f'{meta["duration_ms"]} мс  SQL {meta["queries"]} за {meta["db_ms"]} мс  '
+                f'пик {meta["memory_peak_kb"]} КБ  {meta["user"]}'
+            )
+
+    def summarize(self, profile_id, sort, limit):
+        profile = load_profile(profile_id)
+        if profile is None:
+            raise CommandError(f'Профиль {profile_id} не найден')
+        meta, stats_path, snapshot_path = profile
+
+        self.stdout.write(f'{meta["method"]} {meta["path"]} ({meta["route"]}) — {meta["status"]}, '
+                          f'{meta["duration_ms"]} мс, пик памяти {meta["memory_peak_kb"]} КБ')
+
+        self.stdout.write(f'\nФункции ({sort}):')
+        output = io.StringIO()
+        pstats.Stats(str(stats_path), stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(output.getvalue().strip())
+
+        self.stdout.write('\nВыделения памяти:')
+        for statistic in tracemalloc.Snapshot.load(str(snapshot_path)).statistics('lineno')[:limit]:
+            self.stdout.write(f'  {statistic}')
+
+        self.stdout.write(f'\nSQL: {meta["queries"]} запросов за {meta["db_ms"]} мс')
+        grouped = defaultdict(lambda: [0, 0.0])
+        for statement in meta['sql']:
+            grouped[statement['sql']][0] += 1
+            grouped[statement['sql']][1] += statement['ms']
+        for sql, (count, elapsed) in sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:limit]:
+            self.stdout.write(f'  {elapsed:.1f} мс × {count}: {sql[:300]}')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.scheduler import run_due_triggers
+
+
+class Command(BaseCommand):
+    help = 'Запускает цепочки функций для наступивших триггеров time_expiration'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько триггеров обрабатывать за раз')
+        parser.add_argument('--interval', type=float, default=30, help='Пауза (сек) между проверками')
+        parser.add_argument('--once', action='store_true', help='Выполнить одну проверку и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_due_triggers(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Обработано триггеров: {processed}')
+            # Полная пачка — вероятно, есть еще наступившие триггеры, пауза не нужна
+            if processed == options['batch_size']:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
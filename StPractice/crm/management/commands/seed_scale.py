@@ -0,0 +1,33 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from crm.seeding import PRESETS, Sizes, Seeder
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для замеров производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=PRESETS, default='small', help='Набор размеров по умолчанию')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора: одинаковое зерно — одинаковые данные')
+        for field in Sizes._fields:
+            parser.add_argument(f'--{field.replace("_", "-")}', type=int, dest=field,
+                                help=f'Переопределить размер {field} из пресета')
+
+    def handle(self, *args, **options):
+        sizes = PRESETS[options['preset']]._replace(
+            **{field: options[field] for field in Sizes._fields if options[field] is not None}
+        )
+        if User.objects.filter(username=f'seed{options["seed"]}-admin').exists():
+            raise CommandError(f'Данные с зерном {options["seed"]} уже созданы — укажите другое --seed')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            counts = Seeder(sizes, seed=options['seed'], stdout=self.stdout if options['verbosity'] > 1 else None).run()
+
+        for model, count in sorted(counts.items()):
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.monotonic() - started:.1f} с'))
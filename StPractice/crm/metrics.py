@@ -0,0 +1,301 @@
+"""
+Метрики запросов в формате Prometheus (GET /api/metrics).
+
+RequestMetricsMiddleware для каждого запроса замеряет время ответа, число и время
+SQL-запросов, время рендеринга ответа и его размер. Значения складываются в
+гистограммы по шаблону маршрута ('api/events/<int:pk>') и методу. Рендеринг
+замеряют рендереры DRF из этого модуля (TimedJSONRenderer, TimedBrowsableAPIRenderer
+в DEFAULT_RENDERER_CLASSES): время перевода готовых данных ответа в JSON добавляется
+к замерам текущего запроса. Работа сериализаторов (serializer.data) выполняется
+раньше, в представлении, и входит только в общее время ответа и время SQL.
+Представления со своими renderer_classes не замеряются.
+
+Гистограммы живут в памяти процесса. Если задан METRICS_DIR, каждый воркер
+периодически (не чаще METRICS_FLUSH_INTERVAL) сохраняет свой снимок в этот
+каталог, а /api/metrics суммирует снимки всех воркеров. Снимки завершившихся
+воркеров остаются в каталоге, поэтому счетчики не откатываются назад; каталог
+очищают при перезапуске сервиса.
+
+Запросы дольше SLOW_REQUEST_MS пишутся в лог crm.metrics вместе с самыми
+долгими SQL-выражениями.
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+from .dbhooks import listen_queries
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'crm_'
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Гистограммы: имя -> (описание, верхние границы корзин)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Время обработки запроса, с', TIME_BUCKETS),
+    'db_queries': ('Число SQL-запросов за запрос', (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)),
+    'db_duration_seconds': ('Время SQL-запросов за запрос, с', TIME_BUCKETS),
+    'render_duration_seconds': ('Время рендеринга данных ответа в JSON (без сериализаторов DRF), с', TIME_BUCKETS),
+    'http_response_size_bytes': ('Размер ответа, байты', (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)),
+}
+UNMATCHED = '<unmatched>'  # Запросы, не попавшие ни в один маршрут — одной меткой, чтобы не плодить серии
+
+_current = contextvars.ContextVar('crm_request_metrics', default=None)
+
+
+def route_label(request):
+    match = request.resolver_match
+    if match is None:
+        return UNMATCHED
+    # Маршруты роутера DRF — регулярные выражения: '^direction/(?P<pk>[^/.]+)/$' -> 'direction/<pk>/'
+    return re.sub(r'\(\?P<(\w+)>[^)]*\)', r'<\1>', match.route).replace('^', '').replace('$', '')
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы текущего процесса"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = defaultdict(int)  # (маршрут, метод, статус) -> число запросов
+            # имя -> {(маршрут, метод): [накопленные значения корзин..., сумма, количество]}
+            self.histograms = {name: {} for name in HISTOGRAMS}
+            self.last_flush = 0
+
+    def observe(self, route, method, status, values):
+        with self.lock:
+            self.requests[(route, method, str(status))] += 1
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                series = self.histograms[name].setdefault((route, method), [0] * (len(buckets) + 2))
+                for index, bound in enumerate(buckets):
+                    if value <= bound:
+                        series[index] += 1
+                series[-2] += value
+                series[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': [[*labels, count] for labels, count in self.requests.items()],
+                'histograms': {name: [[*labels, list(series)] for labels, series in histogram.items()]
+                               for name, histogram in self.histograms.items()},
+            }
+
+    def flush(self, force=False):
+        """Сохраняет снимок процесса в METRICS_DIR (атомарно, через временный файл)"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)):
+            return
+        self.last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        path = Path(directory) / f'{socket.gethostname()}-{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot()), encoding='utf-8')
+        os.replace(temporary, path)
+
+
+registry = MetricsRegistry()
+
+
+def merge(snapshots):
+    requests = defaultdict(int)
+    histograms = {name: {} for name in HISTOGRAMS}
+    for snapshot in snapshots:
+        for *labels, count in snapshot['requests']:
+            requests[tuple(labels)] += count
+        for name, rows in snapshot['histograms'].items():
+            if name not in histograms:
+                continue
+            for route, method, series in rows:
+                total = histograms[name].setdefault((route, method), [0] * len(series))
+                for index, value in enumerate(series):
+                    total[index] += value
+    return requests, histograms
+
+
+def collect():
+    """Метрики всех воркеров (или только текущего процесса, если METRICS_DIR не задан)"""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return merge([registry.snapshot()])
+
+    registry.flush(force=True)
+    snapshots = []
+    for path in Path(directory).glob('*.json'):
+        try:
+            snapshots.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue  # Файл воркера удален или поврежден — пропускаем его
+    return merge(snapshots)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(requests, histograms):
+    """Текстовый формат Prometheus 0.0.4"""
+    name = f'{PREFIX}http_requests_total'
+    lines = [f'# HELP {name} Число обработанных запросов', f'# TYPE {name} counter']
+    for (route, method, status), count in sorted(requests.items()):
+        lines.append(f'{name}{_labels(route=route, method=method, status=status)} {count}')
+
+    for short_name, (description, buckets) in HISTOGRAMS.items():
+        name = f'{PREFIX}{short_name}'
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (route, method), series in sorted(histograms[short_name].items()):
+            for bound, count in zip([*map(str, buckets), '+Inf'], [*series[:len(buckets)], series[-1]]):
+                lines.append(f'{name}_bucket{_labels(route=route, method=method, le=bound)} {count}')
+            lines.append(f'{name}_sum{_labels(route=route, method=method)} {_number(series[-2])}')
+            lines.append(f'{name}_count{_labels(route=route, method=method)} {series[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestCollector:
+    """Замеры одного запроса. Слушает SQL-запросы через crm.dbhooks"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.rendering = False
+        self.statements = defaultdict(lambda: [0, 0.0])  # SQL -> [число выполнений, время]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            statement = self.statements[sql]
+            statement[0] += 1
+            statement[1] += elapsed
+
+
+class TimedRendererMixin:
+    """Добавляет время рендеринга ответа к замерам текущего запроса"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        collector = _current.get()
+        if collector is None or collector.rendering:
+            # Вне запроса или вложенный рендерер (BrowsableAPIRenderer рендерит JSON внутри себя)
+            return super().render(data, accepted_media_type, renderer_context)
+        collector.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            collector.render_time += time.perf_counter() - started
+            collector.rendering = False
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True  # Под ASGI не переводит цепочку middleware в синхронный поток
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @contextmanager
+    def tracking(self, collector):
+        token = _current.set(collector)
+        try:
+            with listen_queries(collector):
+                yield
+        finally:
+            _current.reset(token)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        collector, started = RequestCollector(), time.perf_counter()
+        with self.tracking(collector):
+            response = self.get_response(request)
+        return self.record(request, response, collector, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        collector, started = RequestCollector(), time.perf_counter()
+        with self.tracking(collector):
+            response = await self.get_response(request)
+        return self.record(request, response, collector, time.perf_counter() - started)
+
+    def record(self, request, response, collector, duration):
+        route = route_label(request)
+        values = {
+            'http_request_duration_seconds': duration,
+            'db_queries': collector.queries,
+            'db_duration_seconds': collector.db_time,
+            'render_duration_seconds': collector.render_time,
+        }
+        if not response.streaming:
+            values['http_response_size_bytes'] = len(response.content)
+        registry.observe(route, request.method, response.status_code, values)
+        registry.flush()
+
+        threshold = getattr(settings, 'SLOW_REQUEST_MS', None)
+        if threshold is not None and duration * 1000 >= threshold:
+            self.log_slow_request(request, route, response, duration, collector)
+        return response
+
+    def log_slow_request(self, request, route, response, duration, collector):
+        top = sorted(collector.statements.items(), key=lambda item: item[1][1], reverse=True)
+        statements = '\n'.join(
+            f'  {elapsed * 1000:.1f} мс × {count}: {sql[:500]}'
+            for sql, (count, elapsed) in top[:getattr(settings, 'SLOW_REQUEST_TOP_SQL', 5)]
+        )
+        logger.warning(
+            'Медленный запрос %s %s (%s): %s, %.0f мс, SQL: %s запросов за %.0f мс, рендеринг %.0f мс\n%s',
+            request.method, request.get_full_path(), route, response.status_code, duration * 1000,
+            collector.queries, collector.db_time * 1000, collector.render_time * 1000, statements,
+        )
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """Authorization: Bearer <METRICS_TOKEN> — доступ сборщика Prometheus без учетной записи"""
+
+    def authenticate(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and header.startswith('Bearer ') and constant_time_compare(header[len('Bearer '):], token):
+            return AnonymousUser(), 'metrics'
+        return None
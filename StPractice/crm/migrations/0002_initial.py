@@ -0,0 +1,60 @@
+# Generated by Django 4.1 on 2026-10-18 14:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('crm', '0001_initial'),
+        ('plan', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='plan.project'),
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='specialization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='crm.specialization'),
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='status',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.status'),
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='team',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='plan.team'),
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.profile'),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.question'),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.profile'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='role',
+            unique_together={('user', 'role_type', 'content_type', 'object_id')},
+        ),
+        migrations.AddConstraint(
+            model_name='functionorder',
+            constraint=models.UniqueConstraint(fields=('status_order', 'position'), name='unique_status_order_position'),
+        ),
+    ]
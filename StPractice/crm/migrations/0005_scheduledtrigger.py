@@ -0,0 +1,27 @@
+# Generated by Django 4.1 on 2026-10-18 15:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_outboundmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledTrigger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_at', models.DateTimeField(db_index=True, verbose_name='Время срабатывания')),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_triggers', to='crm.application')),
+                ('function_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_triggers', to='crm.functionorder')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scheduledtrigger',
+            constraint=models.UniqueConstraint(fields=('application', 'function_order'), name='unique_scheduled_trigger'),
+        ),
+    ]
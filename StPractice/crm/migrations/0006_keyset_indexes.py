@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_scheduledtrigger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['date_sub', 'id'], name='application_date_sub_id_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['event', 'status'], name='application_event_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(condition=models.Q(('verified_token__isnull', False)), fields=['verified_token'], name='contact_verified_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(condition=models.Q(('password_reset_token__isnull', False)), fields=['password_reset_token'], name='profile_reset_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='role',
+            index=models.Index(condition=models.Q(('content_type__isnull', True)), fields=['user', 'role_type'], name='role_global_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='role',
+            index=models.Index(fields=['content_type', 'object_id', 'role_type'], name='role_object_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.1 on 2026-10-18 15:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('crm', '0007_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessScope',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_scopes', to='crm.profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accessscope',
+            index=models.Index(fields=['content_type', 'object_id'], name='access_scope_object_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='accessscope',
+            constraint=models.UniqueConstraint(fields=('profile', 'content_type', 'object_id'), name='unique_access_scope'),
+        ),
+    ]
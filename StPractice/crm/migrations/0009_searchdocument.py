@@ -0,0 +1,82 @@
+# Generated by Django 4.1 on 2026-10-18 15:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Полнотекстовый индекс над crm_searchdocument (см. crm.search).
+# SQLite: внешнее содержимое FTS5, синхронизируется триггерами; PostgreSQL: GIN по tsvector.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE crm_searchdocument_fts USING fts5(
+        title, text, content='crm_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER crm_searchdocument_ai AFTER INSERT ON crm_searchdocument BEGIN
+        INSERT INTO crm_searchdocument_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER crm_searchdocument_ad AFTER DELETE ON crm_searchdocument BEGIN
+        INSERT INTO crm_searchdocument_fts(crm_searchdocument_fts, rowid, title, text)
+        VALUES ('delete', old.id, old.title, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER crm_searchdocument_au AFTER UPDATE ON crm_searchdocument BEGIN
+        INSERT INTO crm_searchdocument_fts(crm_searchdocument_fts, rowid, title, text)
+        VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO crm_searchdocument_fts(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS crm_searchdocument_au',
+    'DROP TRIGGER IF EXISTS crm_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS crm_searchdocument_ai',
+    'DROP TABLE IF EXISTS crm_searchdocument_fts',
+]
+POSTGRES_FORWARD = [
+    "CREATE INDEX crm_searchdocument_tsv_idx ON crm_searchdocument USING GIN (to_tsvector('simple', text))",
+]
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS crm_searchdocument_tsv_idx',
+]
+
+
+def run_for_vendor(sqlite, postgres):
+    def run(apps, schema_editor):
+        statements = {'sqlite': sqlite, 'postgresql': postgres}.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('crm', '0008_accessscope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=300, verbose_name='Заголовок')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id'), name='unique_search_document'),
+        ),
+        migrations.RunPython(
+            run_for_vendor(SQLITE_FORWARD, POSTGRES_FORWARD),
+            run_for_vendor(SQLITE_BACKWARD, POSTGRES_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['user', 'question'], name='answer_user_question_idx'),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
 from crm.utils import has_role
@@ -31,6 +32,12 @@ class Profile(models.Model):
     password_reset_token = models.CharField(max_length=65, blank=True, null=True)
     password_reset_token_created = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['password_reset_token'], name='profile_reset_token_idx',
+                         condition=models.Q(password_reset_token__isnull=False)),
+        ]
+
     def is_admin(self):
         return has_role(self, 'admin')
 
@@ -61,6 +68,12 @@ class Contact(models.Model):
     verified_token = models.CharField(verbose_name="Токен верификации", max_length=100, null=True, blank=True)
     token_created_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['verified_token'], name='contact_verified_token_idx',
+                         condition=models.Q(verified_token__isnull=False)),
+        ]
+
     def __str__(self):
         return f'{self.profile.name}: {self.data} ({self.type})'
 
@@ -92,6 +105,13 @@ class Role(models.Model):
             # Для ролей, привязанных к объектам
             ['user', 'role_type', 'content_type', 'object_id']
         ]
+        indexes = [
+            # Глобальные роли (admin, projectant): content_type и object_id пустые
+            models.Index(fields=['user', 'role_type'], name='role_global_idx',
+                         condition=models.Q(content_type__isnull=True)),
+            # Все роли на конкретном объекте (организаторы мероприятия, кураторы проекта)
+            models.Index(fields=['content_type', 'object_id', 'role_type'], name='role_object_idx'),
+        ]
 
     def __str__(self):
         obj = f" ({self.content_object})" if self.content_object else ""
@@ -199,6 +219,12 @@ class Application(models.Model):
     date_sub = models.DateTimeField(verbose_name="Дата подачи", auto_now=True)
     date_end = models.DateTimeField(verbose_name="Дата изменения", null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_sub', 'id'], name='application_date_sub_id_idx'),
+            models.Index(fields=['event', 'status'], name='application_event_status_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user}'
 
@@ -236,6 +262,12 @@ class Answer(models.Model):
     answer = models.CharField(verbose_name="Ответ", max_length=100)
     count = models.IntegerField(verbose_name="Полученный балл")
 
+    class Meta:
+        indexes = [
+            # Ответы участника: замена попытки и баллы по тестам (crm.grading)
+            models.Index(fields=['user', 'question'], name='answer_user_question_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user}'
 
@@ -303,3 +335,91 @@ class FunctionOrder(models.Model):
                 self._validate_trigger_config()
         except json.JSONDecodeError:
             raise ValidationError('Некорректный JSON в конфигурации')
+
+
+class OutboundMessage(models.Model):
+    CHANNEL_CHOICES = (
+        ("telegram", "Telegram"),
+        ("vk", "ВК"),
+        ("email", "Почта"),
+    )
+    STATUS_CHOICES = (
+        ("pending", "В очереди"),
+        ("sent", "Отправлено"),
+        ("failed", "Ошибка"),
+    )
+
+    channel = models.CharField(verbose_name="Канал", choices=CHANNEL_CHOICES, max_length=20)
+    payload = models.JSONField(verbose_name="Содержимое сообщения")
+    status = models.CharField(verbose_name="Статус", choices=STATUS_CHOICES, default="pending", max_length=20)
+    attempts = models.PositiveIntegerField(verbose_name="Количество попыток", default=0)
+    next_attempt_at = models.DateTimeField(verbose_name="Следующая попытка", default=timezone.now)
+    last_error = models.TextField(verbose_name="Последняя ошибка", null=True, blank=True)
+    created_at = models.DateTimeField(verbose_name="Дата создания", auto_now_add=True)
+    sent_at = models.DateTimeField(verbose_name="Дата отправки", null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_channel_display()} #{self.id} ({self.get_status_display()})'
+
+
+class ScheduledTrigger(models.Model):
+    """Срок срабатывания триггера time_expiration для заявки в текущем статусе (см. crm.scheduler)"""
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='scheduled_triggers')
+    function_order = models.ForeignKey(FunctionOrder, on_delete=models.CASCADE, related_name='scheduled_triggers')
+    due_at = models.DateTimeField(verbose_name="Время срабатывания", db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['application', 'function_order'],
+                name='unique_scheduled_trigger'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.application_id}: {self.function_order} ({self.due_at})'
+
+
+class AccessScope(models.Model):
+    """Мероприятие, направление, проект или команда, которые видит профиль (поддерживается crm.scopes)"""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='access_scopes')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['profile', 'content_type', 'object_id'],
+                name='unique_access_scope'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['content_type', 'object_id'], name='access_scope_object_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.profile_id}: {self.content_type.model} #{self.object_id}'
+
+
+class SearchDocument(models.Model):
+    """Нормализованный текст объекта для полнотекстового поиска (см. crm.search)"""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(verbose_name="Заголовок", max_length=300)
+    text = models.TextField(verbose_name="Текст")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_type', 'object_id'],
+                name='unique_search_document'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.content_type.model} #{self.object_id}: {self.title}'
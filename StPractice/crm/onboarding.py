@@ -0,0 +1,94 @@
+"""
+Онбординг новых пользователей: профиль, глобальная роль и почтовый контакт.
+
+Вызывается один раз при создании пользователя (сигнал post_save User в
+crm.signals) и пачкой из массового импорта (crm.imports). Обычные сохранения
+User, в том числе обновление last_login при входе, ничего не делают.
+
+Все записи создаются через bulk_create в одной транзакции, число запросов
+не зависит от числа пользователей:
+- Profile с тем же pk, что у User;
+- роль admin для суперпользователя, иначе projectant;
+- контакт «Почта» из User.email сразу с токеном подтверждения;
+- письма подтверждения (кроме суперпользователей) — строками очереди crm.outbox
+  в той же транзакции, отправляет их воркер outbox_worker;
+- поисковые документы профилей и версия закешированных ответов Profile.
+
+Повторный вызов для тех же пользователей ничего не дублирует: уже созданные
+профили, роли и контакты пропускаются.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .caching import bump_version_on_commit
+from .models import Contact, OutboundMessage, Profile, Role, SearchDocument
+from .outbox import verification_email
+from .search import build_document
+from .utils import clear_role_cache, generate_verification_token
+
+Onboarded = namedtuple('Onboarded', ['profiles', 'contacts'])
+
+
+def global_role(user):
+    return 'admin' if user.is_superuser else 'projectant'
+
+
+def onboard_users(users, profile_fields=None):
+    """
+    Создает недостающие профили, роли и почтовые контакты пользователей.
+    profile_fields — {id пользователя: {поле Profile: значение}} для новых профилей.
+    Возвращает созданные профили и контакты
+    """
+    users = [user for user in users if user.pk is not None]
+    if not users:
+        return Onboarded([], [])
+    profile_fields = profile_fields or {}
+    ids = [user.pk for user in users]
+
+    with transaction.atomic():
+        existing_profiles = set(Profile.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        existing_roles = set(Role.objects.filter(
+            user_id__in=ids, role_type__in=['admin', 'projectant'], content_type__isnull=True,
+        ).values_list('user_id', 'role_type'))
+        emails = Q(pk__in=[])
+        for user in users:
+            if user.email:
+                emails |= Q(profile_id=user.pk, data=user.email)
+        existing_contacts = set(Contact.objects.filter(emails, type='Почта').values_list('profile_id', 'data'))
+
+        profiles = Profile.objects.bulk_create([
+            Profile(user_id=user.pk, **profile_fields.get(user.pk, {}))
+            for user in users if user.pk not in existing_profiles
+        ])
+        roles = Role.objects.bulk_create([
+            Role(user_id=user.pk, role_type=global_role(user))
+            for user in users if (user.pk, global_role(user)) not in existing_roles
+        ])
+        for role in roles:
+            clear_role_cache(role.user_id)
+
+        now = timezone.now()
+        contacts = Contact.objects.bulk_create([
+            Contact(profile_id=user.pk, type='Почта', data=user.email,
+                    verified_token=generate_verification_token(), token_created_at=now)
+            for user in users if user.email and (user.pk, user.email) not in existing_contacts
+        ])
+        superusers = {user.pk for user in users if user.is_superuser}
+        OutboundMessage.objects.bulk_create([
+            OutboundMessage(channel='email', payload=verification_email(contact))
+            for contact in contacts if contact.profile_id not in superusers
+        ])
+
+        # bulk_create обходит сигналы Profile — индексируем и сбрасываем кеш здесь
+        SearchDocument.objects.bulk_create([build_document(profile) for profile in profiles])
+        if profiles:
+            bump_version_on_commit(Profile)
+
+    by_user = {profile.pk: profile for profile in profiles}
+    for user in users:
+        if user.pk in by_user:
+            user.profile = by_user[user.pk]
+    return Onboarded(profiles, contacts)
@@ -0,0 +1,389 @@
+"""
+Очередь исходящих сообщений (Telegram, ВК, почта).
+
+API и сигналы только кладут сообщение в таблицу OutboundMessage, а отправкой
+занимается воркер (manage.py outbox_worker): он забирает пачку готовых к
+отправке сообщений, отправляет их через транспорты с общими HTTP/SMTP
+соединениями и при ошибке откладывает повторную попытку с экспоненциальной задержкой.
+Асинхронный воркер (outbox_worker --async, aprocess_batch) отправляет пачку
+параллельно через общий httpx.AsyncClient (crm.clients), не больше
+OUTBOX_CONCURRENCY запросов одновременно и с теми же ограничениями частоты.
+"""
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .clients import get_http_client, telegram_url, vk_url
+from .models import OutboundMessage
+
+DEFAULT_TRANSPORTS = {
+    'telegram': 'crm.outbox.TelegramTransport',
+    'vk': 'crm.outbox.VKTransport',
+    'email': 'crm.outbox.EmailTransport',
+}
+
+# Сколько сообщений в секунду можно отправлять в канал
+DEFAULT_RATE_LIMITS = {
+    'telegram': 25,
+    'vk': 20,
+    'email': 10,
+}
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30  # секунд, задержка удваивается с каждой попыткой
+LEASE_SECONDS = 300  # на это время сообщение закрепляется за воркером
+
+
+def enqueue(channel, **payload):
+    """Кладёт сообщение в очередь и сразу возвращает запись OutboundMessage"""
+    return OutboundMessage.objects.create(channel=channel, payload=payload)
+
+
+async def aenqueue(channel, **payload):
+    return await OutboundMessage.objects.acreate(channel=channel, payload=payload)
+
+
+def email_payload(subject, message, recipient_list, from_email=None):
+    return {
+        'subject': subject,
+        'message': message,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'recipient_list': list(recipient_list),
+    }
+
+
+def enqueue_email(subject, message, recipient_list, from_email=None):
+    return enqueue('email', **email_payload(subject, message, recipient_list, from_email))
+
+
+def verification_email(contact):
+    """Письмо со ссылкой подтверждения почтового контакта (payload для канала email)"""
+    verification_url = reverse('verify-email') + f'?token={contact.verified_token}'
+    return email_payload(
+        'Подтверждение email',
+        f'Перейдите по ссылке для подтверждения: https://crm.meetuppoint.ru{verification_url}',
+        recipient_list=[contact.data],
+        from_email='no-reply@meetuppoint.ru',
+    )
+
+
+class TransportError(Exception):
+    pass
+
+
+class Transport:
+    """
+    Базовый транспорт: open/close оборачивают пачку отправок одним соединением.
+    Асинхронные aopen/asend/aclose по умолчанию выполняют синхронные методы в потоке
+    и по одному (соединение, например SMTP, нельзя делить между отправками);
+    HTTP-транспорты переопределяют их и отправляют параллельно
+    """
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, payload):
+        raise NotImplementedError
+
+    async def aopen(self):
+        self.lock = asyncio.Lock()
+        await sync_to_async(self.open, thread_sensitive=False)()
+
+    async def aclose(self):
+        await sync_to_async(self.close, thread_sensitive=False)()
+
+    async def asend(self, payload):
+        async with self.lock:
+            return await sync_to_async(self.send, thread_sensitive=False)(payload)
+
+
+class AsyncHTTPTransport(Transport):
+    """Транспорт с асинхронной отправкой через общий клиент crm.clients: open/close не нужны"""
+
+    async def aopen(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class TelegramTransport(AsyncHTTPTransport):
+    def __init__(self):
+        self.client = None
+
+    def open(self):
+        self.client = httpx.Client(timeout=10)
+
+    def close(self):
+        self.client.close()
+
+    @staticmethod
+    def request(payload):
+        return telegram_url('sendMessage'), {
+            "chat_id": payload['chat_id'],
+            "text": payload['message'],
+            "parse_mode": payload.get('parse_mode'),
+        }
+
+    @staticmethod
+    def result(response):
+        if response.is_error:
+            raise TransportError(f"HTTP error: {response.text}")
+        return response.json()['result']['message_id']
+
+    def send(self, payload):
+        url, data = self.request(payload)
+        return self.result(self.client.post(url, json=data))
+
+    async def asend(self, payload):
+        url, data = self.request(payload)
+        return self.result(await get_http_client().post(url, json=data))
+
+
+class VKTransport(AsyncHTTPTransport):
+    def __init__(self):
+        self.session = None
+
+    def open(self):
+        self.session = requests.Session()
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def params(payload):
+        params = {
+            'access_token': settings.VK_CONFIG['ACCESS_TOKEN'],
+            'v': settings.VK_CONFIG['API_VERSION'],
+            'random_id': payload['random_id'],
+            'message': payload['message'],
+        }
+
+        # Определяем тип получателя
+        if payload['recipient_id'] > 2000000000:
+            params['peer_id'] = payload['recipient_id']  # для бесед
+        else:
+            params['user_id'] = payload['recipient_id']  # для пользователей
+
+        if payload.get('keyboard'):
+            params['keyboard'] = json.dumps(payload['keyboard'])
+
+        if payload.get('attachment'):
+            params['attachment'] = payload['attachment']
+        return params
+
+    @staticmethod
+    def result(response):
+        if 'error' in response:
+            raise TransportError(response['error'])
+        return response['response']
+
+    def send(self, payload):
+        return self.result(
+            self.session.post(vk_url('messages.send'), params=self.params(payload), timeout=10).json()
+        )
+
+    async def asend(self, payload):
+        response = await get_http_client().post(vk_url('messages.send'), params=self.params(payload))
+        return self.result(response.json())
+
+
+class EmailTransport(Transport):
+    def __init__(self):
+        self.connection = None
+
+    def open(self):
+        self.connection = get_connection(fail_silently=False)
+        self.connection.open()
+
+    def close(self):
+        self.connection.close()
+
+    def send(self, payload):
+        EmailMessage(
+            payload['subject'],
+            payload['message'],
+            payload['from_email'],
+            payload['recipient_list'],
+            connection=self.connection,
+        ).send()
+
+
+class FakeTransport(Transport):
+    """Локальный транспорт для тестов и разработки: ничего не отправляет, а запоминает сообщения в sent"""
+    fail = False
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, payload):
+        if self.fail:
+            raise TransportError('Fake transport failure')
+        self.sent.append(payload)
+        return len(self.sent)
+
+
+def get_transport(channel):
+    transports = {**DEFAULT_TRANSPORTS, **getattr(settings, 'OUTBOX_TRANSPORTS', {})}
+    return import_string(transports[channel])()
+
+
+class RateLimiter:
+    """Выдерживает минимальный интервал между отправками в один канал"""
+
+    def __init__(self, per_second):
+        self.interval = 1 / per_second if per_second else 0
+        self.last = 0
+
+    def reserve(self):
+        """Занимает ближайший свободный момент отправки и возвращает задержку до него"""
+        now = time.monotonic()
+        self.last = max(now, self.last + self.interval)
+        return self.last - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def await_turn(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def claim_batch(batch_size):
+    """Забирает пачку готовых сообщений, продлевая им next_attempt_at, чтобы их не взял другой воркер"""
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboundMessage.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutboundMessage.objects.filter(id__in=[message.id for message in messages]).update(
+            next_attempt_at=now + timedelta(seconds=LEASE_SECONDS)
+        )
+    return messages
+
+
+def process_batch(batch_size=100, limiters=None):
+    """Отправляет одну пачку сообщений. Возвращает (отправлено, с ошибкой)"""
+    messages = claim_batch(batch_size)
+    rate_limits = {**DEFAULT_RATE_LIMITS, **getattr(settings, 'OUTBOX_RATE_LIMITS', {})}
+    limiters = limiters if limiters is not None else {}
+
+    by_channel = {}
+    for message in messages:
+        by_channel.setdefault(message.channel, []).append(message)
+
+    sent = failed = 0
+    for channel, channel_messages in by_channel.items():
+        limiter = limiters.setdefault(channel, RateLimiter(rate_limits.get(channel)))
+        transport = get_transport(channel)
+        try:
+            transport.open()
+        except Exception as e:
+            # Канал недоступен (SMTP, сеть) — его сообщения откладываются, остальные каналы отправляются
+            for message in channel_messages:
+                _schedule_retry(message, e)
+            failed += len(channel_messages)
+            continue
+        try:
+            for message in channel_messages:
+                limiter.wait()
+                try:
+                    transport.send(message.payload)
+                except Exception as e:
+                    _schedule_retry(message, e)
+                    failed += 1
+                else:
+                    _mark_sent(message)
+                    sent += 1
+        finally:
+            transport.close()
+
+    return sent, failed
+
+
+async def aprocess_batch(batch_size=100, limiters=None):
+    """
+    Асинхронная версия process_batch: сообщения пачки отправляются параллельно,
+    не больше OUTBOX_CONCURRENCY одновременно. Возвращает (отправлено, с ошибкой)
+    """
+    messages = await sync_to_async(claim_batch)(batch_size)
+    rate_limits = {**DEFAULT_RATE_LIMITS, **getattr(settings, 'OUTBOX_RATE_LIMITS', {})}
+    limiters = limiters if limiters is not None else {}
+    semaphore = asyncio.Semaphore(getattr(settings, 'OUTBOX_CONCURRENCY', 100))
+
+    transports, open_errors = {}, {}
+    for channel in {message.channel for message in messages}:
+        transport = get_transport(channel)
+        try:
+            await transport.aopen()
+        except Exception as e:
+            open_errors[channel] = e
+        else:
+            transports[channel] = transport
+
+    async def deliver(message):
+        if message.channel in open_errors:
+            return message, open_errors[message.channel]
+        limiter = limiters.setdefault(message.channel, RateLimiter(rate_limits.get(message.channel)))
+        async with semaphore:
+            await limiter.await_turn()
+            try:
+                await transports[message.channel].asend(message.payload)
+            except Exception as e:
+                return message, e
+            return message, None
+
+    try:
+        results = await asyncio.gather(*(deliver(message) for message in messages))
+    finally:
+        for transport in transports.values():
+            await transport.aclose()
+
+    await sync_to_async(_record_results)(results)
+    failed = sum(1 for _, error in results if error is not None)
+    return len(results) - failed, failed
+
+
+def _record_results(results):
+    for message, error in results:
+        if error is None:
+            _mark_sent(message)
+        else:
+            _schedule_retry(message, error)
+
+
+def _mark_sent(message):
+    message.status = 'sent'
+    message.attempts += 1
+    message.sent_at = timezone.now()
+    message.save(update_fields=['status', 'attempts', 'sent_at'])
+
+
+def _schedule_retry(message, error):
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= MAX_ATTEMPTS:
+        message.status = 'failed'
+    else:
+        message.next_attempt_at = timezone.now() + timedelta(seconds=BACKOFF_BASE * 2 ** (message.attempts - 1))
+    message.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
@@ -0,0 +1,154 @@
+"""
+Пагинация по курсору (keyset).
+
+Вместо OFFSET страница выбирается условием по составному ключу сортировки:
+для (created_at, id) это (created_at, id) > (x, y), т.е.
+created_at > x OR (created_at = x AND id > y), а значения x и y лежат в курсоре.
+Время ответа не растет с номером страницы, и строки с одинаковым created_at
+не пропускаются и не повторяются, сколько бы их ни было. Ключ должен быть
+неизменяемым (поле auto_now не подходит: строка переехала бы на другую страницу),
+последним в нем идет id — если его нет в сортировке, он добавляется.
+Общее количество записей считается отдельным COUNT(*) — клиенты, которым оно
+не нужно, передают ?count=false и обходятся без этого запроса.
+
+Курсор включается параметром ?cursor= (для первой страницы — пустым), дальше
+клиент идет по ссылкам next. Без него работает прежняя пагинация списка
+(fallback_class): фронтенд запрашивает страницы через page/page_size или
+limit/offset и читает count.
+"""
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(pagination.CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+    fallback_class = pagination.LimitOffsetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback = None
+        if self.cursor_query_param not in request.query_params:
+            self.fallback = self.fallback_class()
+            if not queryset.ordered:  # Порядок фильтра ?ordering= сохраняется
+                queryset = queryset.order_by(*self.ordering)
+            return self.fallback.paginate_queryset(queryset, request, view)
+        self.count = queryset.count() if self.get_with_count(request) else None
+
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        if self.ordering[-1].lstrip('-') not in ('id', 'pk'):
+            self.ordering += ('id',)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = (False, None) if self.cursor is None else (self.cursor.reverse, self.cursor.position)
+
+        ordering = pagination._reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek(ordering, position))
+
+        # Лишняя строка показывает, есть ли следующая страница
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        self.display_page_controls = self.has_previous or self.has_next
+        return self.page
+
+    @staticmethod
+    def seek(ordering, position):
+        """Строки после position: (a, b) > (x, y) раскрывается в a > x OR (a = x AND b > y)"""
+        condition, equal = Q(), Q()
+        for order, value in zip(ordering, position):
+            field = order.lstrip('-')
+            condition |= equal & Q(**{f'{field}__{"lt" if order.startswith("-") else "gt"}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        # Пустая страница бывает, только если строки удалили между запросами: начинаем сначала
+        position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else None
+        return self.encode_cursor(pagination.Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(pagination.Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        # Пустой ?cursor= — первая страница в режиме курсора
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'))
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = json.loads(tokens['p'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return pagination.Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {'r': '1'} if cursor.reverse else {}
+        if cursor.position is not None:
+            tokens['p'] = json.dumps(cursor.position)
+        encoded = b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        """Значения всего ключа сортировки, а не только первого поля"""
+        fields = [order.lstrip('-') for order in ordering]
+        if isinstance(instance, dict):
+            return [str(instance[field]) for field in fields]
+        return [str(getattr(instance, field)) for field in fields]
+
+    def get_with_count(self, request):
+        return request.query_params.get(self.count_query_param, 'true').lower() not in ('0', 'false', 'no')
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties'] = {
+            'count': {'type': 'integer', 'nullable': True, 'example': 123},
+            **response_schema['properties'],
+        }
+        return response_schema
+
+
+class ApplicationPagination(KeysetPagination):
+    # date_sub — auto_now и меняется при каждом сохранении, поэтому ключ — неизменяемый id
+    ordering = ('id',)
+
+
+class ProfilePagination(KeysetPagination):
+    ordering = ('user_id',)
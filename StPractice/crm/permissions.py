@@ -1,6 +1,7 @@
 from rest_framework import permissions
 
 from crm.models import Profile
+from crm.utils import has_role
 
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
@@ -19,3 +20,18 @@ class IsCuratorAuthorOrReadonly(permissions.BasePermission):
             return True
 
         return obj.creator == request.user.profile
+
+
+class CanReadMetrics(permissions.BasePermission):
+    """Метрики видят сотрудники (is_staff) и сборщик Prometheus с METRICS_TOKEN"""
+
+    def has_permission(self, request, view):
+        return request.auth == 'metrics' or bool(request.user and request.user.is_staff)
+
+
+class IsAdministrator(permissions.BasePermission):
+    """Администраторы (роль admin) и сотрудники (is_staff)"""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.is_staff or has_role(user, 'admin')))
@@ -0,0 +1,191 @@
+"""
+Профилирование отдельных запросов по требованию сотрудника.
+
+Запрос с заголовком X-Profile: 1 или параметром ?_profile=1 от пользователя с
+is_staff выполняется под cProfile и tracemalloc. В PROFILER_DIR сохраняются:
+- profile.pstats — статистика cProfile (читается pstats/snakeviz);
+- allocations.tracemalloc — снимок выделений памяти (tracemalloc.Snapshot.load);
+- meta.json — запрос, статус, время, пик памяти и трасса SQL.
+Каталог — кольцевой буфер: хранится не больше PROFILER_MAX_ENTRIES последних профилей.
+Id профиля возвращается в заголовке ответа X-Profile-Id.
+Просмотр: manage.py request_profiles [id].
+
+Одновременно профилируется только один запрос: cProfile не поддерживает
+параллельные профилировщики, остальные запросы в это время выполняются как обычно.
+"""
+import cProfile
+import json
+import os
+import shutil
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .dbhooks import listen_queries
+from .metrics import route_label
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_FLAG = '_profile'
+SQL_TRACE_LIMIT = 1000  # Сколько SQL-выражений сохраняется в трассе одного запроса
+
+_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILER_DIR'))
+
+
+def list_profiles():
+    """Метаданные сохраненных профилей, новые первыми"""
+    profiles = []
+    for path in sorted(profile_dir().glob('*/meta.json'), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def load_profile(profile_id):
+    """(метаданные, путь к pstats, путь к снимку tracemalloc) или None"""
+    path = profile_dir() / profile_id
+    if not profile_id or path.parent != profile_dir() or not (path / 'meta.json').exists():
+        return None
+    return json.loads((path / 'meta.json').read_text(encoding='utf-8')), path / 'profile.pstats', \
+        path / 'allocations.tracemalloc'
+
+
+def trim_profiles(keep):
+    for path in sorted(p for p in profile_dir().iterdir() if p.is_dir())[:-keep or None]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def is_profiling_requested(request):
+    return request.META.get(HEADER) == '1' or request.GET.get(QUERY_FLAG) == '1'
+
+
+def is_staff(request):
+    """
+    Сессионный пользователь известен уже в middleware, JWT и OAuth — только после
+    аутентификации DRF, поэтому прогоняем аутентификаторы DRF заранее
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            user = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]).user
+        except APIException:
+            return False
+    return bool(user and user.is_staff)
+
+
+class SQLTrace:
+    def __init__(self):
+        self.statements = []
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if len(self.statements) < SQL_TRACE_LIMIT:
+                self.statements.append({'sql': sql, 'params': repr(params)[:200], 'ms': round(elapsed * 1000, 3)})
+
+
+class RequestProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not is_profiling_requested(request) or not is_staff(request):
+            return self.get_response(request)
+        return self.handle(request, self.get_response)
+
+    async def __acall__(self, request):
+        if not is_profiling_requested(request) or not await sync_to_async(is_staff)(request):
+            return await self.get_response(request)
+        # cProfile видит только свой поток, поэтому профилируемый запрос целиком выполняется
+        # в отдельном потоке: синхронные представления вызываются в нем же через async_to_sync
+        return await sync_to_async(self.handle, thread_sensitive=False)(request, async_to_sync(self.get_response))
+
+    def handle(self, request, get_response):
+        if not _lock.acquire(blocking=False):
+            response = get_response(request)
+            response['X-Profile-Skipped'] = 'busy'
+            return response
+        try:
+            return self.profile(request, get_response)
+        finally:
+            _lock.release()
+
+    def profile(self, request, get_response):
+        profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+        trace = SQLTrace()
+        profiler = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(getattr(settings, 'PROFILER_TRACEMALLOC_FRAMES', 10))
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+
+        started = time.perf_counter()
+        try:
+            with listen_queries(trace):
+                profiler.enable()
+                try:
+                    response = get_response(request)
+                finally:
+                    profiler.disable()
+            duration = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            memory_peak = tracemalloc.get_traced_memory()[1] - memory_before
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        path = profile_dir() / profile_id
+        os.makedirs(path)
+        profiler.dump_stats(path / 'profile.pstats')
+        snapshot.dump(str(path / 'allocations.tracemalloc'))
+        meta = {
+            'id': profile_id,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'route': route_label(request),
+            'user': request.user.get_username() if getattr(request, 'user', None) else '',
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'memory_peak_kb': round(memory_peak / 1024, 1),
+            'queries': trace.count,
+            'db_ms': round(trace.duration * 1000, 2),
+            'sql': trace.statements,
+        }
+        (path / 'meta.json').write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding='utf-8')
+        trim_profiles(getattr(settings, 'PROFILER_MAX_ENTRIES', 50))
+
+        response['X-Profile-Id'] = profile_id
+        return response
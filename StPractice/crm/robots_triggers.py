@@ -1,33 +1,167 @@
 # Импорт необходимых модулей
-import httpx  # Асинхронный HTTP-клиент
-from django.db import transaction  # Для работы с транзакциями БД
+import asyncio
+import json  # Работа с JSON-файлами
+import time
+import uuid
+import weakref
+from collections import namedtuple
+
 from asgiref.sync import sync_to_async  # Преобразование синхронных методов в асинхронные
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone  # Работа с датой и временем
-from .models import Application, Status, FunctionOrder  # Импорт моделей приложения
-import json  # Работа с JSON-файлами
+from .models import Application, Status, FunctionOrder, ScheduledTrigger  # Импорт моделей приложения
+from .caching import bump_version_on_commit
+from .clients import get_http_client, telegram_url  # Общий асинхронный HTTP-клиент
+
+# Роботы, не зависящие от результата соседних шагов: их можно выполнять параллельно.
+# move_status и триггеры — точки синхронизации, до них завершаются все предыдущие шаги
+CONCURRENT_ACTIONS = {"notification"}
+
+# Ограничение глубины цепочек move_status -> move_status, чтобы зацикленная воронка не ушла в бесконечность
+MAX_CHAIN_DEPTH = 10
+
+# Скомпилированный шаг цепочки функций статуса
+CompiledStep = namedtuple('CompiledStep', [
+    'function_id',  # id FunctionOrder
+    'type_function',  # "robot" или "trigger"
+    'action',  # type_action робота или type_condition триггера
+    'handler',  # функция-обработчик
+    'config',  # уже разобранная конфигурация
+    'target_status',  # объект Status для move_status
+])
+
+# Скомпилированные планы: (event_id, status_id) -> tuple[CompiledStep]
+PLAN_VERSION_KEY = 'crm:automation:version'
+_plans = {}
+_plans_version = None
+_plans_compiled_at = 0.0
+
+
+def get_plan(event_id, status_id):
+    """
+    Возвращает скомпилированную цепочку функций для статуса мероприятия.
+    Планы хранятся в памяти процесса; версия в общем кеше (CACHES в settings) позволяет
+    сбросить их во всех воркерах при изменении FunctionOrder/Robot/Trigger/Status_order.
+    Если версия не дошла до воркера (кеш не общий или ключ вытеснен), планы
+    все равно перестраиваются не реже раза в AUTOMATION_PLAN_TTL секунд.
+    """
+    global _plans_version, _plans_compiled_at
+    version = cache.get(PLAN_VERSION_KEY)
+    now = time.monotonic()
+    if version != _plans_version or now - _plans_compiled_at > getattr(settings, 'AUTOMATION_PLAN_TTL', 60):
+        _plans.clear()
+        _plans_version = version
+        _plans_compiled_at = now
+
+    key = (event_id, status_id)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = compile_plan(event_id, status_id)
+    return plan
+
+
+# Семафор параллельности роботов — по одному на event loop (HTTP-клиент общий, crm.clients)
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(getattr(settings, 'AUTOMATION_CONCURRENCY', 10))
+    return semaphore
+
+
+async def gather_limited(coroutines):
+    """Выполняет корутины параллельно, но не больше AUTOMATION_CONCURRENCY одновременно"""
+    semaphore = get_semaphore()
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+
+def split_steps(steps):
+    """
+    Делит цепочку на группы: подряд идущие независимые роботы образуют одну группу
+    и выполняются параллельно, остальные шаги идут по одному в исходном порядке.
+    """
+    group = []
+    for step in steps:
+        if step.type_function == "robot" and step.action in CONCURRENT_ACTIONS:
+            group.append(step)
+            continue
+        if group:
+            yield group
+            group = []
+        yield [step]
+    if group:
+        yield group
+
 
-# Асинхронные обертки для ORM-запросов
-async_get = sync_to_async(Application.objects.get, thread_sensitive=True)  # Асинхронное получение объекта
-async_save = sync_to_async(Application.save, thread_sensitive=True)  # Асинхронное сохранение объекта
+def invalidate_plans():
+    """Сбрасывает скомпилированные планы (вызывается из crm.signals)"""
+    cache.set(PLAN_VERSION_KEY, uuid.uuid4().hex, None)
+    _plans.clear()
+
+
+def parse_config(config):
+    # config — JSONField, но старые записи могут хранить JSON строкой
+    if isinstance(config, str):
+        return json.loads(config)
+    return config or {}
+
+
+def compile_plan(event_id, status_id):
+    """Собирает цепочку функций статуса: разбирает конфиги, находит обработчики и целевые статусы"""
+    functions = FunctionOrder.objects.filter(
+        status_order__status_id=status_id
+    ).select_related('robot', 'trigger').order_by('status_order__number', 'position')
+    if event_id is not None:
+        functions = functions.filter(status_order__event_id=event_id)
+
+    steps = []
+    for function in functions:
+        try:
+            config = parse_config(function.config)
+        except json.JSONDecodeError:
+            continue  # Некорректная конфигурация — функция пропускается
+
+        if function.type_function == "robot" and function.robot and function.robot.status:
+            action = function.robot.type_action
+            handler = ROBOT_HANDLERS.get(action)
+        elif function.type_function == "trigger" and function.trigger and function.trigger.status:
+            action = function.trigger.type_condition
+            handler = TRIGGER_HANDLERS.get(action)
+        else:
+            continue  # Неактивный или не привязанный робот/триггер
+
+        if handler is not None:
+            steps.append(CompiledStep(function.id, function.type_function, action, handler, config, None))
+
+    # Целевые статусы всех move_status роботов одним запросом
+    names = {step.config.get('target_status') for step in steps if step.action == "move_status"}
+    statuses = {status.name: status for status in Status.objects.filter(name__in=names)} if names else {}
+    return tuple(
+        step._replace(target_status=statuses.get(step.config.get('target_status')))
+        if step.action == "move_status" else step
+        for step in steps
+    )
 
 
 async def move_application_status(application_id: int, new_status_name: str):
     """Асинхронно изменяет статус заявки и запускает связанные действия"""
     try:
-        # Атомарная транзакция для обеспечения целостности данных
-        async with transaction.atomic():
-            # Получение объекта заявки
-            application = await async_get(id=application_id)
-            # Получение нового статуса
-            new_status = await sync_to_async(Status.objects.get)(name=new_status_name)
+        # Получение объекта заявки
+        application = await Application.objects.select_related('status').aget(id=application_id)
+        # Получение нового статуса
+        new_status = await Status.objects.aget(name=new_status_name)
 
-            # Обновление статуса заявки
-            application.status = new_status
-            await async_save(application)
-
-            # Запуск обработки связанных функций
-            await process_status_functions(application)
-            return True, "Статус успешно изменен"
+        await set_application_status(application, new_status)
+        return True, "Статус успешно изменен"
 
     except Status.DoesNotExist:
         # Обработка отсутствия статуса
@@ -37,103 +171,223 @@ async def move_application_status(application_id: int, new_status_name: str):
         return False, f"Ошибка: {str(e)}"
 
 
-async def send_telegram_notification(application_id: int, config: dict):
+async def set_application_status(application, new_status, depth=0):
+    """Обновляет статус заявки и запускает цепочку функций нового статуса"""
+    application.status = new_status
+    # Сроки временных триггеров пересчитываются ниже с учетом запуска цепочки, а не в post_save
+    application._scheduled_status_id = new_status.id
+    # save(), а не aupdate(): сигналы post_save пересчитывают области видимости и поиск.
+    # Model.asave появится только в Django 4.2
+    await sync_to_async(application.save)()
+    from .scheduler import schedule_time_triggers
+    await sync_to_async(schedule_time_triggers)([application], timezone.now())
+
+    # Запуск обработки связанных функций
+    await process_status_functions(application, depth)
+
+
+async def bulk_move_applications(application_ids, new_status, queryset=None):
+    """
+    Переводит набор заявок в новый статус одним UPDATE и запускает цепочку функций
+    один раз на статус. Возвращает результат по каждой заявке в порядке application_ids.
+    queryset ограничивает заявки, которые можно переводить (область видимости
+    пользователя); остальные id возвращаются с ошибкой, как несуществующие.
+    """
+    queryset = Application.objects.all() if queryset is None else queryset
+    applications = [
+        application
+        async for application in queryset.filter(id__in=application_ids).select_related('status')
+    ]
+    results = {application_id: (False, "Заявка не найдена или нет доступа") for application_id in application_ids}
+
+    await bulk_set_application_status(applications, new_status, results)
+
+    final_statuses = {application.id: application.status_id for application in applications}
+    return [
+        {
+            "id": application_id,
+            "success": results[application_id][0],
+            "detail": results[application_id][1],
+            "status": final_statuses.get(application_id),
+        }
+        for application_id in dict.fromkeys(application_ids)
+    ]
+
+
+async def bulk_set_application_status(applications, new_status, results, depth=0):
+    """Обновляет статус набора заявок одним запросом и запускает функции нового статуса"""
+    if not applications:
+        return
+
+    # update() не заполняет auto_now, поэтому дата изменения проставляется явно
+    now = timezone.now()
+    await Application.objects.filter(id__in=[a.id for a in applications]).aupdate(status=new_status, date_sub=now)
+    for application in applications:
+        application.status = new_status
+        application.date_sub = now
+        results[application.id] = (True, "Статус успешно изменен")
+
+    # update() не вызывает post_save, поэтому сроки временных триггеров пересчитываются
+    # и версия закешированных ответов (crm.caching) увеличивается явно
+    from .scheduler import schedule_time_triggers
+    await sync_to_async(schedule_time_triggers)(applications, now)
+    await sync_to_async(bump_version_on_commit)(Application)
+
+    await bulk_process_status_functions(applications, results, depth)
+
+
+async def bulk_process_status_functions(applications, results, depth=0):
+    """Цепочка функций для заявок в одном статусе: план берется один раз на мероприятие"""
+    by_event = {}
+    for application in applications:
+        by_event.setdefault(application.event_id, []).append(application)
+
+    # Заявки разных мероприятий обрабатываются параллельно
+    await asyncio.gather(*(
+        bulk_run_plan(event_applications, results, depth)
+        for event_applications in by_event.values()
+    ))
+
+
+async def bulk_run_plan(applications, results, depth=0):
+    plan = await sync_to_async(get_plan)(applications[0].event_id, applications[0].status_id)
+
+    active = applications
+    for group in split_steps(plan):
+        if not active:
+            break
+        if group[0].action in CONCURRENT_ACTIONS:
+            await gather_limited([bulk_execute_robot(step, active, results, depth) for step in group])
+        elif group[0].type_function == "robot":
+            await bulk_execute_robot(group[0], active, results, depth)
+        else:
+            # Дальше по цепочке идут только заявки, для которых условие выполнено
+            active = [application for application in active if await check_trigger(group[0], application)]
+            await sync_to_async(forget_passed_trigger)(group[0], active)
+
+
+async def bulk_execute_robot(step, applications, results, depth=0):
+    try:
+        await BULK_ROBOT_HANDLERS[step.action](step, applications, results, depth)
+    except Exception as e:
+        # Статус уже изменен, ошибку робота добавляем к результату
+        for application in applications:
+            success, message = results[application.id]
+            results[application.id] = (success, f"{message}; ошибка выполнения: {str(e)}")
+
+
+async def send_telegram_notification(application, config: dict):
     """Асинхронная отправка сообщения через Telegram Bot API"""
     try:
-        # Создание асинхронного HTTP-клиента
-        async with httpx.AsyncClient() as client:
-            # Получение объекта заявки
-            application = await async_get(id=application_id)
-            # Формирование сообщения из шаблона
-            message = config.get('message', 'Статус изменен: {status}').format(
-                status=application.status.name
-            )
-
-            # Отправка запроса к Telegram API
-            url = f"https://api.telegram.org/bot{config['bot_token']}/sendMessage"
-            response = await client.post(
-                url,
-                json={
-                    "chat_id": config['chat_id'],
-                    "text": message,
-                    "parse_mode": "HTML"
-                }
-            )
-            # Проверка статуса ответа
-            response.raise_for_status()
-            return True, "Уведомление отправлено"
+        # Формирование сообщения из шаблона
+        message = config.get('message', 'Статус изменен: {status}').format(
+            status=application.status.name
+        )
+        await post_telegram_message(config, message)
+        return True, "Уведомление отправлено"
 
     except Exception as e:
         # Обработка ошибок отправки
         return False, f"Ошибка отправки: {str(e)}"
 
 
-async def process_status_functions(application):
-    """Обработка цепочки функций, связанных с текущим статусом"""
-    # Получение списка функций, отсортированных по позиции
-    functions = await sync_to_async(list)(
-        FunctionOrder.objects.filter(
-            status_order__status=application.status
-        ).order_by('position').select_related('robot', 'trigger')
+async def send_telegram_batch(applications, config: dict):
+    """Одно сообщение в Telegram на группу заявок, перешедших в статус"""
+    message = config.get('message', 'Статус изменен: {status}').format(
+        status=applications[0].status.name
     )
+    if len(applications) > 1:
+        message += "\nЗаявки: " + ", ".join(f"#{application.id}" for application in applications)
+    await post_telegram_message(config, message)
 
-    # Последовательное выполнение функций
-    for function in functions:
-        if function.type_function == "robot":
-            await execute_robot(function, application)
-        elif function.type_function == "trigger":
-            await check_trigger(function, application)
+
+async def post_telegram_message(config: dict, message: str):
+    """Отправка запроса к Telegram API через общий клиент"""
+    response = await get_http_client().post(
+        telegram_url('sendMessage', config['bot_token']),
+        json={
+            "chat_id": config['chat_id'],
+            "text": message,
+            "parse_mode": "HTML"
+        }
+    )
+    # Проверка статуса ответа
+    response.raise_for_status()
+
+
+async def process_status_functions(application, depth=0):
+    """Обработка цепочки функций, связанных с текущим статусом"""
+    # Скомпилированный план берется из кеша, запросы к БД только при первой компиляции
+    plan = await sync_to_async(get_plan)(application.event_id, application.status_id)
+    await run_steps(plan, application, depth)
 
 
-async def execute_robot(function_order, application):
+async def run_steps(steps, application, depth=0):
+    """Выполнение шагов цепочки (в т.ч. продолжение после сработавшего триггера)"""
+    for group in split_steps(steps):
+        if group[0].action in CONCURRENT_ACTIONS:
+            # Независимые роботы группы выполняются параллельно
+            await gather_limited([execute_robot(step, application, depth) for step in group])
+        elif group[0].type_function == "robot":
+            # move_status не занимает слот семафора: вложенная цепочка сама запускает роботов
+            await execute_robot(group[0], application, depth)
+        elif not await check_trigger(group[0], application):
+            # Условие триггера не выполнено — остальные функции цепочки не запускаются
+            break
+        else:
+            await sync_to_async(forget_passed_trigger)(group[0], [application])
+
+
+def forget_passed_trigger(step, applications):
+    """Пройденный цепочкой временной триггер не должен сработать по расписанию (crm.scheduler)"""
+    if step.action == "time_expiration" and applications:
+        ScheduledTrigger.objects.filter(
+            application__in=applications, function_order_id=step.function_id
+        ).delete()
+
+
+async def execute_robot(step, application, depth=0):
     """Выполнение действия, связанного с роботом"""
     try:
-        # Загрузка конфигурации из JSON
-        config = json.loads(function_order.config)
-
-        # Определение типа действия робота
-        if function_order.robot.action_type == "move_status":
-            # Вызов функции изменения статуса
-            result, message = await move_application_status(
-                application.id,
-                config['target_status']
-            )
-        elif function_order.robot.action_type == "notification":
-            # Вызов функции отправки уведомления
-            result, message = await send_telegram_notification(
-                application.id,
-                config
-            )
-
+        result, message = await step.handler(step, application, depth)
     except Exception as e:
         # Обработка ошибок выполнения
         result, message = False, f"Ошибка выполнения: {str(e)}"
+    return result, message
 
 
-async def check_trigger(function_order, application):
-    """Проверка условий триггера"""
-    try:
-        # Загрузка конфигурации триггера
-        config = json.loads(function_order.config)
+async def robot_move_status(step, application, depth):
+    if step.target_status is None:
+        return False, f"Статус {step.config.get('target_status')} не найден"
+    if depth >= MAX_CHAIN_DEPTH:
+        return False, "Превышена глубина цепочки смены статусов"
+    await set_application_status(application, step.target_status, depth + 1)
+    return True, "Статус успешно изменен"
 
-        # Определение обработчика для типа триггера
-        handler = {
-            "time_expiration": check_time_trigger,
-            "status_check": check_status_trigger,
-            "field_comparison": check_field_trigger
-        }.get(function_order.trigger.trigger_type)
 
-        # Проверка условия триггера
-        condition_met, _ = await handler(application, config)
+async def robot_notification(step, application, depth):
+    return await send_telegram_notification(application, step.config)
 
-        if condition_met:
-            # Запуск связанных действий при выполнении условия
-            for action in await sync_to_async(list)(function_order.trigger.actions.all()):
-                await execute_robot(action, application)
 
-    except Exception as e:
-        # Подавление ошибок проверки триггера
-        pass
+async def bulk_robot_move_status(step, applications, results, depth):
+    if step.target_status is None:
+        raise Status.DoesNotExist(f"Статус {step.config.get('target_status')} не найден")
+    if depth >= MAX_CHAIN_DEPTH:
+        raise RecursionError("Превышена глубина цепочки смены статусов")
+    await bulk_set_application_status(applications, step.target_status, results, depth + 1)
+
+
+async def bulk_robot_notification(step, applications, results, depth):
+    await send_telegram_batch(applications, step.config)
+
+
+async def check_trigger(step, application):
+    """Проверка условий триггера"""
+    try:
+        return bool(await step.handler(application, step.config))
+    except Exception:
+        # Ошибка в условии трактуется как невыполненное условие
+        return False
 
 
 async def check_time_trigger(application, config):
@@ -141,7 +395,7 @@ async def check_time_trigger(application, config):
     # Расчет временного интервала
     delta = timezone.timedelta(**{config['interval']: config['value']})
     # Получение значения поля из заявки
-    target_field = getattr(application, config.get('field', 'updated_at'))
+    target_field = getattr(application, config.get('field', 'date_sub'))
     # Проверка истечения времени
     return timezone.now() > target_field + delta
 
@@ -164,3 +418,30 @@ async def check_field_trigger(application, config):
     }[config['operator']]
     # Выполнение сравнения
     return operator(field_value, config['value'])
+
+
+async def check_test_trigger(application, config):
+    """Прохождение теста автором заявки (crm.grading): {"test": id, "passed": true}"""
+    from .grading import has_passed
+    passed = await sync_to_async(has_passed)(application.user_id, config['test'])
+    return passed == config.get('passed', True)
+
+
+# Обработчики по типу действия робота и типу условия триггера
+ROBOT_HANDLERS = {
+    "move_status": robot_move_status,
+    "notification": robot_notification,
+}
+
+# Те же действия для набора заявок (bulk_move_applications)
+BULK_ROBOT_HANDLERS = {
+    "move_status": bulk_robot_move_status,
+    "notification": bulk_robot_notification,
+}
+
+TRIGGER_HANDLERS = {
+    "time_expiration": check_time_trigger,
+    "status_check": check_status_trigger,
+    "field_comparison": check_field_trigger,
+    "test_result": check_test_trigger,
+}
@@ -0,0 +1,134 @@
+"""
+Маршрутизация чтения на реплику БД.
+
+ReplicaRoutingMiddleware отправляет чтение безопасных запросов (GET, HEAD, OPTIONS)
+на реплику (REPLICA_DATABASE), все остальное идет в основную базу:
+- запись всегда идет в основную базу, в том числе из сигналов и crm.robots_triggers;
+- после первой записи остаток запроса тоже читает из основной базы;
+- клиент, который что-то записал, еще REPLICA_STICKY_SECONDS читает из основной
+  базы, чтобы видеть свои изменения, пока реплика догоняет. Отметка — подписанная
+  cookie со временем записи: ее видят все воркеры, и она не требует ни общего кеша,
+  ни запросов к БД (кеш в БД читался бы с той же отстающей реплики);
+- вне запросов (команды manage.py, планировщик, outbox) все идет в основную базу.
+Если реплика не настроена, роутер ничего не меняет.
+"""
+import contextvars
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'primary_pin'
+PIN_SALT = 'crm.routers'
+
+_state = contextvars.ContextVar('crm_db_routing', default=None)
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    return alias if alias and alias in connections else None
+
+
+class RoutingState:
+    """Куда читает текущий запрос и была ли в нем запись"""
+
+    def __init__(self, read_alias):
+        self.read_alias = read_alias
+        self.wrote = False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        return state.read_alias if state is not None else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.read_alias = DEFAULT_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной базы, объекты из них можно связывать
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def is_pinned(request):
+    """Клиент недавно писал и должен читать из основной базы"""
+    value = request.COOKIES.get(PIN_COOKIE)
+    if not value:
+        return False
+    try:
+        signing.loads(value, salt=PIN_SALT, max_age=sticky_seconds())
+    except signing.BadSignature:  # В том числе истекшая отметка
+        return False
+    return True
+
+
+def pin(response):
+    """Отметка «читать из основной базы» на REPLICA_STICKY_SECONDS"""
+    response.set_cookie(
+        PIN_COOKIE, signing.dumps(True, salt=PIN_SALT), max_age=sticky_seconds(), httponly=True,
+        samesite=settings.SESSION_COOKIE_SAMESITE, secure=settings.SESSION_COOKIE_SECURE,
+    )
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        replica = replica_alias()
+        if replica is None:
+            return self.get_response(request)
+
+        state = self.state(request, replica)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            pin(response)
+        return response
+
+    async def __acall__(self, request):
+        # Состояние в contextvar: asgiref копирует контекст в поток синхронного представления
+        replica = replica_alias()
+        if replica is None:
+            return await self.get_response(request)
+
+        state = self.state(request, replica)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            pin(response)
+        return response
+
+    @staticmethod
+    def state(request, replica):
+        use_replica = request.method in SAFE_METHODS and not is_pinned(request)
+        return RoutingState(replica if use_replica else DEFAULT_DB_ALIAS)
@@ -0,0 +1,136 @@
+"""
+Планировщик триггеров time_expiration.
+
+Когда заявка попадает в статус, для каждого временного триггера его цепочки
+в таблицу ScheduledTrigger записывается рассчитанное время срабатывания (due_at).
+Команда manage.py run_time_triggers выбирает по индексу только наступившие строки
+и продолжает цепочку функций с шага, следующего за сработавшим триггером.
+
+Строка триггера, который цепочка уже прошла, удаляется (crm.robots_triggers.run_steps):
+при входе в статус для уже наступивших триггеров строки не записываются, а триггеры
+с одинаковым сроком продолжают цепочку один раз — первый из них проходит остальные.
+"""
+from asgiref.sync import async_to_sync, sync_to_async
+from django.utils import timezone
+
+from .clients import http_session
+from .models import Application, ScheduledTrigger
+from .robots_triggers import get_plan, check_trigger, run_steps
+
+TIME_TRIGGER = "time_expiration"
+
+
+def compute_due_at(application, config):
+    """Момент, когда check_time_trigger начнет возвращать True"""
+    value = getattr(application, config.get('field', 'date_sub'), None)
+    if value is None:
+        return None
+    return value + timezone.timedelta(**{config['interval']: config['value']})
+
+
+def plan_due_times(application, entered_at=None):
+    """
+    Сроки временных триггеров цепочки текущего статуса заявки: {function_id: due_at}.
+    Триггер не может сработать раньше предыдущих временных триггеров той же цепочки.
+    entered_at — момент входа в статус, сразу после которого выполняется цепочка:
+    триггеры, наступившие к этому моменту, до которых идут только роботы и такие же
+    триггеры, цепочка пройдет сама, и их сроки не возвращаются.
+    """
+    due_times = {}
+    previous = None
+    passing = entered_at is not None
+    for step in get_plan(application.event_id, application.status_id):
+        if step.action != TIME_TRIGGER:
+            # Результат других условий заранее неизвестен
+            passing = passing and step.type_function == 'robot'
+            continue
+        try:
+            due_at = compute_due_at(application, step.config)
+        except (KeyError, TypeError):
+            due_at = None  # Некорректная конфигурация — триггер никогда не сработает
+        if due_at is None:
+            passing = False
+            continue
+        if previous is not None:
+            due_at = max(due_at, previous)
+        previous = due_at
+        passing = passing and due_at < entered_at
+        if not passing:
+            due_times[step.function_id] = due_at
+    return due_times
+
+
+def schedule_time_triggers(applications, entered_at=None):
+    """
+    Пересчитывает сроки временных триггеров для заявок в их текущем статусе.
+    entered_at передается, когда после смены статуса запускается цепочка функций (см. plan_due_times)
+    """
+    applications = list(applications)
+    ScheduledTrigger.objects.filter(application__in=applications).delete()
+
+    ScheduledTrigger.objects.bulk_create([
+        ScheduledTrigger(application=application, function_order_id=function_id, due_at=due_at)
+        for application in applications
+        for function_id, due_at in plan_due_times(application, entered_at).items()
+    ])
+    for application in applications:
+        # Статус, для которого записаны сроки (crm.signals.reschedule_time_triggers)
+        application._scheduled_status_id = application.status_id
+
+
+def schedule_new_trigger(function_order):
+    """Сроки добавленного временного триггера для заявок, которые уже находятся в его статусе"""
+    status_order = function_order.status_order
+    if status_order is None:
+        return
+    scheduled = []
+    for application in Application.objects.filter(status_id=status_order.status_id, event_id=status_order.event_id):
+        due_at = plan_due_times(application).get(function_order.id)
+        if due_at is not None:
+            scheduled.append(ScheduledTrigger(application=application, function_order=function_order, due_at=due_at))
+    ScheduledTrigger.objects.bulk_create(scheduled, ignore_conflicts=True)
+
+
+def run_due_triggers(now=None, batch_size=500):
+    """Обрабатывает наступившие триггеры. Возвращает количество обработанных строк"""
+    now = now or timezone.now()
+    due = list(
+        ScheduledTrigger.objects.filter(due_at__lte=now)
+        .select_related('application__status')
+        .order_by('due_at')[:batch_size]
+    )
+    async_to_sync(fire_triggers)(due)
+    return len(due)
+
+
+@http_session
+async def fire_triggers(due):
+    for scheduled in due:
+        await fire_trigger(scheduled)
+
+
+async def fire_trigger(scheduled):
+    application = scheduled.application
+    plan = await sync_to_async(get_plan)(application.event_id, application.status_id)
+    index = next((i for i, step in enumerate(plan) if step.function_id == scheduled.function_order_id), None)
+
+    if index is None:
+        # Заявка уже в другом статусе или функция удалена
+        await sync_to_async(scheduled.delete)()
+        return
+
+    if not await check_trigger(plan[index], application):
+        # Конфигурация или поле заявки изменились — переносим срок
+        due_at = (await sync_to_async(plan_due_times)(application)).get(scheduled.function_order_id)
+        if due_at is None:
+            await sync_to_async(scheduled.delete)()
+        else:
+            scheduled.due_at = due_at
+            await sync_to_async(scheduled.save)(update_fields=['due_at'])
+        return
+
+    # Строку мог удалить другой обработчик: цепочка уже прошла этот триггер
+    # (например, сработал предыдущий триггер с тем же сроком) — шаги не повторяются
+    deleted, _ = await sync_to_async(ScheduledTrigger.objects.filter(pk=scheduled.pk).delete)()
+    if deleted:
+        await run_steps(plan[index + 1:], application)
@@ -0,0 +1,140 @@
+"""
+Материализованная область видимости профилей.
+
+Для каждого профиля в таблице AccessScope хранятся мероприятия, направления,
+проекты и команды, которые он видит:
+- организатор мероприятия видит мероприятие и все его направления, проекты и команды;
+- руководитель направления (роль или Direction.leader) — направление, его проекты и команды;
+- куратор проекта (роль) — проект и все его команды;
+- куратор и участники команды — команду и ее проект.
+
+Области пересчитываются сигналами (crm.signals) только для затронутых профилей,
+поэтому списки фильтруются одним подзапросом по индексу (scope_queryset),
+без обхода ролей и иерархии мероприятие → направление → проект → команда.
+Администратор видит все. Полная перестройка: manage.py rebuild_access_scopes.
+"""
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+
+from plan.models import Project, Team
+from .models import AccessScope, Direction, Event, Role
+from .utils import has_role
+
+
+def scope_content_types():
+    """{модель: id ContentType} для моделей, на которые строится область видимости"""
+    types = ContentType.objects.get_for_models(Event, Direction, Project, Team)
+    return {model: content_type.id for model, content_type in types.items()}
+
+
+def compute_scopes(profile_ids):
+    """Рассчитывает области видимости профилей: {profile_id: {(content_type_id, object_id), ...}}"""
+    profile_ids = set(profile_ids)
+    types = scope_content_types()
+    by_type = {content_type_id: model for model, content_type_id in types.items()}
+    # Объекты, видимые профилю вместе со всем, что ниже по иерархии: {модель: {profile_id: {id}}}
+    granted = {model: defaultdict(set) for model in types}
+    # Объекты, видимые без вложенных (команда участника и ее проект)
+    scopes = defaultdict(set)
+
+    roles = Role.objects.filter(user_id__in=profile_ids, content_type__in=by_type).values_list(
+        'user_id', 'content_type_id', 'object_id'
+    )
+    for profile_id, content_type_id, object_id in roles:
+        granted[by_type[content_type_id]][profile_id].add(object_id)
+
+    for profile_id, direction_id in Direction.objects.filter(leader_id__in=profile_ids).values_list('leader_id', 'id'):
+        granted[Direction][profile_id].add(direction_id)
+
+    members = [
+        *Team.objects.filter(curator_id__in=profile_ids).values_list('curator_id', 'id', 'project_id'),
+        *Team.students.through.objects.filter(profile_id__in=profile_ids).values_list(
+            'profile_id', 'team_id', 'team__project_id'
+        ),
+    ]
+    for profile_id, team_id, project_id in members:
+        scopes[profile_id].add((types[Team], team_id))
+        if project_id is not None:
+            scopes[profile_id].add((types[Project], project_id))
+
+    # Спускаемся по иерархии: по одному запросу на уровень
+    for parent, child, lookup in ((Event, Direction, 'event_id'),
+                                  (Direction, Project, 'direction_id'),
+                                  (Project, Team, 'project_id')):
+        parent_ids = set().union(*granted[parent].values())
+        children = defaultdict(set)
+        for parent_id, child_id in child.objects.filter(**{f'{lookup}__in': parent_ids}).values_list(lookup, 'id'):
+            children[parent_id].add(child_id)
+        for profile_id, ids in granted[parent].items():
+            for parent_id in ids:
+                granted[child][profile_id] |= children[parent_id]
+
+    for model, profiles in granted.items():
+        for profile_id, ids in profiles.items():
+            scopes[profile_id].update((types[model], object_id) for object_id in ids)
+    return {profile_id: scopes[profile_id] for profile_id in profile_ids}
+
+
+def refresh_scopes(profile_ids):
+    """Приводит AccessScope профилей к рассчитанному состоянию, меняя только отличающиеся строки"""
+    profile_ids = {profile_id for profile_id in profile_ids if profile_id is not None}
+    if not profile_ids:
+        return
+
+    desired = compute_scopes(profile_ids)
+    stale = []
+    existing = defaultdict(set)
+    rows = AccessScope.objects.filter(profile_id__in=profile_ids).values_list(
+        'id', 'profile_id', 'content_type_id', 'object_id'
+    )
+    for scope_id, profile_id, content_type_id, object_id in rows:
+        if (content_type_id, object_id) in desired[profile_id]:
+            existing[profile_id].add((content_type_id, object_id))
+        else:
+            stale.append(scope_id)
+
+    if stale:
+        AccessScope.objects.filter(id__in=stale).delete()
+    AccessScope.objects.bulk_create([
+        AccessScope(profile_id=profile_id, content_type_id=content_type_id, object_id=object_id)
+        for profile_id, scope in desired.items()
+        for content_type_id, object_id in scope - existing[profile_id]
+    ], ignore_conflicts=True)
+
+
+def scope_holders(*objects):
+    """Профили, в области видимости которых есть любой из объектов"""
+    holders = set()
+    for obj in objects:
+        if obj is not None and obj.pk is not None:
+            holders.update(AccessScope.objects.filter(
+                content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk
+            ).values_list('profile_id', flat=True))
+    return holders
+
+
+def visible_ids(user, model):
+    """Подзапрос id объектов model, видимых пользователю"""
+    return AccessScope.objects.filter(
+        profile_id=user.pk, content_type=ContentType.objects.get_for_model(model)
+    ).values('object_id')
+
+
+def scope_queryset(queryset, user, lookups, *conditions):
+    """
+    Оставляет в queryset только строки, видимые пользователю.
+    lookups — {поле queryset: модель области}, строка видна при совпадении любого из полей,
+    например {'project': Project} для задач. conditions — дополнительные Q, дающие доступ
+    (например, собственные заявки пользователя).
+    """
+    if has_role(user, 'admin'):
+        return queryset
+
+    condition = Q(pk__in=[])
+    for lookup, model in lookups.items():
+        condition |= Q(**{f'{lookup}__in': visible_ids(user, model)})
+    for extra in conditions:
+        condition |= extra
+    return queryset.filter(condition)
@@ -0,0 +1,293 @@
+"""
+Полнотекстовый поиск по профилям, задачам, проектам и заявкам.
+
+Для каждого объекта в таблице SearchDocument хранится нормализованный текст
+(нижний регистр, «ё» → «е»), который сигналы (crm.signals) обновляют при сохранении
+и удалении. Над таблицей строится индекс:
+- SQLite — FTS5 (токенизатор unicode61 понимает кириллицу), синхронизируется триггерами;
+- PostgreSQL — GIN по to_tsvector('simple', text);
+- остальные СУБД — поиск подстроки по SearchDocument без индекса.
+Каждое слово запроса ищется по префиксу, результаты упорядочены по релевантности.
+Фильтры ?search= списков (FullTextSearchFilter, фильтр задач) отбирают строки
+подзапросом к индексу (matching_ids) — без ограничения числа совпадений.
+Поиск API (search) проверяет область видимости пользователя в том же запросе к
+индексу, до сортировки и LIMIT: скрытые объекты не вытесняют видимые из выдачи.
+Полная перестройка: manage.py rebuild_search_index.
+"""
+import re
+from collections import namedtuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from plan.models import Project, Task
+from .models import Application, Direction, Event, Profile, SearchDocument
+from .scopes import scope_queryset
+
+MAX_TERMS = 8
+
+SearchType = namedtuple('SearchType', ['model', 'document', 'select_related', 'scope'])
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().replace('ё', 'е').split())
+
+
+def query_terms(query):
+    return re.findall(r'\w+', normalize(query))[:MAX_TERMS]
+
+
+def _join(*values):
+    return ' '.join(str(value) for value in values if value not in (None, ''))
+
+
+def profile_title(profile):
+    return _join(profile.surname, profile.name, profile.patronymic) or f'Профиль {profile.pk}'
+
+
+def profile_document(profile):
+    return profile_title(profile), _join(profile.telegram, profile.email, profile.university, profile.job,
+                                         profile.course)
+
+
+def task_document(task):
+    return task.name, task.description
+
+
+def project_document(project):
+    return project.name, project.description
+
+
+def application_document(application):
+    return profile_title(application.user), _join(application.message, application.comment)
+
+
+SEARCH_TYPES = {
+    'profile': SearchType(Profile, profile_document, (), None),
+    'task': SearchType(Task, task_document, (), lambda queryset, user: scope_queryset(
+        queryset, user, {'project': Project}
+    )),
+    'project': SearchType(Project, project_document, (), lambda queryset, user: scope_queryset(
+        queryset, user, {'id': Project}
+    )),
+    'application': SearchType(Application, application_document, ('user',), lambda queryset, user: scope_queryset(
+        queryset, user, {'event': Event, 'direction': Direction}, Q(user_id=user.pk)
+    )),
+}
+MODEL_TYPES = {search_type.model: name for name, search_type in SEARCH_TYPES.items()}
+
+
+def build_document(obj):
+    title, body = SEARCH_TYPES[MODEL_TYPES[type(obj)]].document(obj)
+    title = str(title or '')[:300]
+    return SearchDocument(
+        content_type=ContentType.objects.get_for_model(obj),
+        object_id=obj.pk,
+        title=title,
+        text=normalize(_join(title, body)),
+    )
+
+
+def index_object(obj):
+    document = build_document(obj)
+    SearchDocument.objects.update_or_create(
+        content_type=document.content_type, object_id=document.object_id,
+        defaults={'title': document.title, 'text': document.text},
+    )
+
+
+def remove_object(obj):
+    SearchDocument.objects.filter(content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk).delete()
+
+
+def rebuild_index(batch_size=1000):
+    """Заново строит документы всех объектов. Возвращает их количество"""
+    SearchDocument.objects.all().delete()
+    total = 0
+    for search_type in SEARCH_TYPES.values():
+        queryset = search_type.model.objects.select_related(*search_type.select_related).order_by('pk')
+        batch = []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            batch.append(build_document(obj))
+            if len(batch) >= batch_size:
+                total += len(SearchDocument.objects.bulk_create(batch))
+                batch = []
+        total += len(SearchDocument.objects.bulk_create(batch))
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO crm_searchdocument_fts(crm_searchdocument_fts) VALUES ('optimize')")
+    return total
+
+
+def _fts_match(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _tsquery(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _document_condition(scopes, prefix=''):
+    """
+    Условие WHERE по типам документов: (content_type_id = %s AND object_id IN (<видимые id>)) OR ...
+    scopes — {content_type_id: queryset видимых объектов или None, если видны все}
+    """
+    clauses, params = [], []
+    for content_type_id, visible in scopes.items():
+        clause = f'{prefix}content_type_id = %s'
+        params.append(content_type_id)
+        if visible is not None:
+            sql, visible_params = visible.values('pk').query.sql_with_params()
+            clause += f' AND {prefix}object_id IN ({sql})'
+            params.extend(visible_params)
+        clauses.append(f'({clause})')
+    return ' OR '.join(clauses), params
+
+
+def _search_sqlite(terms, scopes, limit):
+    condition, params = _document_condition(scopes, 'd.')
+    with connection.cursor() as cursor:
+        # bm25 тем меньше, чем документ релевантнее; совпадение в заголовке весит больше
+        cursor.execute(
+            f"""
+            SELECT d.content_type_id, d.object_id, d.title, -bm25(crm_searchdocument_fts, 10.0, 1.0) AS score
+            FROM crm_searchdocument_fts
+            JOIN crm_searchdocument d ON d.id = crm_searchdocument_fts.rowid
+            WHERE crm_searchdocument_fts MATCH %s AND ({condition})
+            ORDER BY score DESC
+            LIMIT %s
+            """,
+            [_fts_match(terms), *params, limit],
+        )
+        return cursor.fetchall()
+
+
+def _search_postgres(terms, scopes, limit):
+    tsquery = _tsquery(terms)
+    condition, params = _document_condition(scopes)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT content_type_id, object_id, title,
+                   ts_rank(to_tsvector('simple', text), to_tsquery('simple', %s)) AS score
+            FROM crm_searchdocument
+            WHERE to_tsvector('simple', text) @@ to_tsquery('simple', %s) AND ({condition})
+            ORDER BY score DESC
+            LIMIT %s
+            """,
+            [tsquery, tsquery, *params, limit],
+        )
+        return cursor.fetchall()
+
+
+def _matching_documents(terms, content_type_ids):
+    documents = SearchDocument.objects.filter(content_type_id__in=content_type_ids)
+    for term in terms:
+        documents = documents.filter(text__contains=term)
+    return documents
+
+
+def _search_fallback(terms, scopes, limit):
+    condition = Q(pk__in=[])
+    for content_type_id, visible in scopes.items():
+        condition |= Q(content_type_id=content_type_id) & (
+            Q() if visible is None else Q(object_id__in=visible.values('pk'))
+        )
+    rows = _matching_documents(terms, list(scopes)).filter(condition).order_by('title').values_list(
+        'content_type_id', 'object_id', 'title'
+    )[:limit]
+    return [(*row, 0.0) for row in rows]
+
+
+def _matches_sqlite(terms, content_type_id):
+    return RawSQL(
+        """
+        SELECT d.object_id
+        FROM crm_searchdocument_fts
+        JOIN crm_searchdocument d ON d.id = crm_searchdocument_fts.rowid
+        WHERE crm_searchdocument_fts MATCH %s AND d.content_type_id = %s
+        """,
+        [_fts_match(terms), content_type_id],
+    )
+
+
+def _matches_postgres(terms, content_type_id):
+    return RawSQL(
+        """
+        SELECT object_id FROM crm_searchdocument
+        WHERE to_tsvector('simple', text) @@ to_tsquery('simple', %s) AND content_type_id = %s
+        """,
+        [_tsquery(terms), content_type_id],
+    )
+
+
+def _matches_fallback(terms, content_type_id):
+    return _matching_documents(terms, [content_type_id]).values('object_id')
+
+
+BACKENDS = {
+    'sqlite': _search_sqlite,
+    'postgresql': _search_postgres,
+}
+MATCH_BACKENDS = {
+    'sqlite': _matches_sqlite,
+    'postgresql': _matches_postgres,
+}
+
+
+def search_documents(query, types=None, limit=20, user=None):
+    """
+    Совпадения [(тип, id, заголовок, релевантность)] по убыванию релевантности.
+    user — только объекты из его области видимости
+    """
+    terms = query_terms(query)
+    types = [name for name in (types or SEARCH_TYPES) if name in SEARCH_TYPES]
+    if not terms or not types:
+        return []
+
+    content_types = ContentType.objects.get_for_models(*(SEARCH_TYPES[name].model for name in types))
+    names, scopes = {}, {}
+    for name in types:
+        search_type = SEARCH_TYPES[name]
+        visible = None
+        if user is not None and search_type.scope is not None:
+            visible = search_type.scope(search_type.model.objects.all(), user)
+            if not visible.query.has_filters():
+                visible = None  # Администратору видно все
+        content_type_id = content_types[search_type.model].id
+        names[content_type_id] = name
+        scopes[content_type_id] = visible
+    if not scopes:
+        return []
+    rows = BACKENDS.get(connection.vendor, _search_fallback)(terms, scopes, limit)
+    return [(names[content_type_id], object_id, title, score) for content_type_id, object_id, title, score in rows]
+
+
+def matching_ids(query, search_type):
+    """Подзапрос id всех объектов типа, совпавших с запросом; None, если в запросе нет слов"""
+    terms = query_terms(query)
+    if not terms:
+        return None
+    content_type = ContentType.objects.get_for_model(SEARCH_TYPES[search_type].model)
+    return MATCH_BACKENDS.get(connection.vendor, _matches_fallback)(terms, content_type.id)
+
+
+def search(query, user, types=None, limit=20):
+    """Поиск для API: только объекты, видимые пользователю"""
+    return [
+        {'type': name, 'id': object_id, 'title': title, 'score': score}
+        for name, object_id, title, score in search_documents(query, types, limit, user)
+    ]
+
+
+class FullTextSearchFilter(SearchFilter):
+    """?search= по полнотекстовому индексу вместо icontains. Тип объектов берется из view.search_type"""
+
+    def filter_queryset(self, request, queryset, view):
+        ids = matching_ids(request.query_params.get(self.search_param, ''), view.search_type)
+        if ids is None:
+            return queryset
+        return queryset.filter(pk__in=ids)
@@ -0,0 +1,242 @@
+"""
+Генератор синтетических данных для замеров производительности (manage.py seed_scale).
+
+Данные воспроизводимы: при одном и том же seed и размерах получается тот же набор.
+Строки вставляются через bulk_create, поэтому сигналы не срабатывают — области
+видимости (crm.scopes), поисковый индекс (crm.search), лента изменений проектов
+(plan.changes) и версии справочников (crm.caching) пересчитываются в конце явно.
+"""
+import random
+from collections import namedtuple
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from plan.changes import backfill_changes
+from plan.models import Project, Stage, Team, Task, Comment, Checklist, ChecklistItem, Meeting
+from .caching import bump_version, rows_of
+from .models import Profile, Role, Specialization, Status, Status_order, Event, Direction, Application, OrgChat
+from .scopes import refresh_scopes
+from .search import rebuild_index
+
+BATCH_SIZE = 1000
+
+Sizes = namedtuple('Sizes', [
+    'profiles',         # всего профилей
+    'events',           # мероприятий
+    'directions',       # направлений на мероприятие
+    'projects',         # проектов на направление
+    'teams',            # команд на проект
+    'students',         # участников в команде
+    'tasks',            # корневых задач на проект
+    'subtasks',         # подзадач на корневую задачу
+    'comments',         # комментариев на задачу
+    'checklist_items',  # пунктов чек-листа на задачу
+    'applications',     # заявок на мероприятие
+])
+
+PRESETS = {
+    'small': Sizes(profiles=300, events=2, directions=2, projects=3, teams=2, students=5, tasks=20, subtasks=2,
+                   comments=1, checklist_items=2, applications=100),
+    'medium': Sizes(profiles=3000, events=4, directions=4, projects=5, teams=2, students=6, tasks=100, subtasks=2,
+                    comments=2, checklist_items=3, applications=1000),
+    'large': Sizes(profiles=10000, events=8, directions=5, projects=6, teams=3, students=6, tasks=150, subtasks=3,
+                   comments=2, checklist_items=4, applications=3000),
+}
+
+SURNAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков',
+            'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров', 'Павлов', 'Козлов']
+NAMES = ['Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Артём', 'Илья', 'Кирилл', 'Михаил',
+         'Анна', 'Мария', 'Елена', 'Дарья', 'Алина', 'Ирина', 'Екатерина', 'Полина', 'Ольга', 'Софья']
+UNIVERSITIES = ['УрФУ', 'УГГУ', 'УрГЭУ', 'УГМУ', 'УрГПУ']
+SPECIALIZATIONS = ['Backend', 'Frontend', 'Аналитика', 'Дизайн', 'Тестирование', 'Менеджмент']
+TASK_VERBS = ['Подготовить', 'Сверстать', 'Спроектировать', 'Проверить', 'Описать', 'Настроить', 'Согласовать']
+TASK_OBJECTS = ['макет', 'API', 'отчет', 'презентацию', 'базу данных', 'тесты', 'документацию', 'деплой']
+STAGES = [("Запланировано", "#AE4B88"), ("В работе", "#4B56AE"), ("На проверке", "#6BAE4B"), ("Завершено", "#AE644B")]
+# Воронка заявок: статус и доля заявок в нем
+FUNNEL = [("Новая", True, 40), ("На рассмотрении", True, 25), ("Принята", True, 25), ("Отклонена", False, 10)]
+
+
+def bulk_create(model, objects):
+    created = model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    if created and created[0].pk is None:
+        # СУБД не возвращает id из bulk_create (MySQL) — берем последние вставленные строки
+        ids = list(model.objects.order_by('-pk').values_list('pk', flat=True)[:len(created)])
+        for obj, pk in zip(created, reversed(ids)):
+            obj.pk = pk
+    return created
+
+
+class Seeder:
+    def __init__(self, sizes, seed=0, stdout=None):
+        self.sizes = sizes
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.now = timezone.now()
+        self.stdout = stdout
+        self.counts = {}
+
+    def log(self, model, objects):
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(objects)
+        if self.stdout is not None:
+            self.stdout.write(f'{model.__name__}: {len(objects)}')
+        return objects
+
+    def create(self, model, objects):
+        return self.log(model, bulk_create(model, objects))
+
+    def through(self, field, rows):
+        """Строки промежуточной таблицы ManyToMany: [(id слева, id справа)]"""
+        through = field.remote_field.through
+        left, right = field.m2m_field_name(), field.m2m_reverse_field_name()
+        self.create(through, [through(**{f'{left}_id': a, f'{right}_id': b}) for a, b in rows])
+
+    def run(self):
+        profiles = self.create_profiles()
+        statuses = self.create_reference_data()
+        for index in range(self.sizes.events):
+            self.create_event(index, profiles, statuses)
+
+        # bulk_create обходит сигналы — пересчитываем производные данные
+        profile_ids = [profile.pk for profile in profiles]
+        for start in range(0, len(profile_ids), BATCH_SIZE):
+            refresh_scopes(profile_ids[start:start + BATCH_SIZE])
+        rebuild_index()
+        backfill_changes(BATCH_SIZE)
+        for model in (Event, Direction, Application, Specialization, Status, OrgChat, Profile,
+                      rows_of(Direction), rows_of(Application)):
+            bump_version(model)
+        return self.counts
+
+    def create_profiles(self):
+        password = make_password('password')
+        prefix = f'seed{self.seed}'
+        users = self.create(User, [User(username=f'{prefix}-admin', password=password, is_staff=True,
+                                        is_superuser=True)] + [
+            User(username=f'{prefix}-{index}', password=password) for index in range(self.sizes.profiles)
+        ])
+        profiles = self.create(Profile, [
+            Profile(
+                user_id=user.pk,
+                surname=self.random.choice(SURNAMES),
+                name=self.random.choice(NAMES),
+                course=self.random.randint(1, 6),
+                university=self.random.choice(UNIVERSITIES),
+                telegram=f'@{user.username}',
+            )
+            for user in users
+        ])
+        self.create(Role, [Role(user_id=profiles[0].pk, role_type='admin')] + [
+            Role(user_id=profile.pk, role_type='projectant') for profile in profiles[1:]
+        ])
+        return profiles[1:]
+
+    def create_reference_data(self):
+        for name in SPECIALIZATIONS:
+            Specialization.objects.get_or_create(name=name)
+        self.specializations = list(Specialization.objects.filter(name__in=SPECIALIZATIONS).order_by('name'))
+        return [Status.objects.get_or_create(name=name, defaults={'is_positive': positive})[0]
+                for name, positive, _ in FUNNEL]
+
+    def create_event(self, index, profiles, statuses):
+        sizes, rnd = self.sizes, self.random
+        start = (self.now + timedelta(days=rnd.randint(-60, 60))).date()
+        event = self.create(Event, [Event(
+            name=f'Мероприятие {index + 1}', description='Проектный практикум', stage=rnd.choice(Event.STAGES)[0],
+            start=start, end=start + timedelta(days=90), end_app=start + timedelta(days=14),
+        )])[0]
+        self.through(Event.specializations.field, [(event.pk, s.pk) for s in rnd.sample(self.specializations, 3)])
+        self.create(Status_order, [Status_order(event=event, status=status, number=number)
+                                   for number, status in enumerate(statuses, start=1)])
+        self.create(OrgChat, [OrgChat(event=event, type='ТГ', name='Организаторы', description='Общий чат',
+                                      link='https://t.me/example')])
+        self.create(Role, [Role(user_id=rnd.choice(profiles).pk, role_type='organizer',
+                                content_type=ContentType.objects.get_for_model(Event), object_id=event.pk)])
+
+        directions = self.create(Direction, [
+            Direction(event=event, name=f'Направление {number + 1}', leader=rnd.choice(profiles))
+            for number in range(sizes.directions)
+        ])
+        for direction in directions:
+            self.create_projects(direction, profiles)
+
+        weights = [share for _, _, share in FUNNEL]
+        self.create(Application, [
+            Application(
+                user=rnd.choice(profiles), event=event, direction=rnd.choice(directions),
+                specialization=rnd.choice(self.specializations),
+                status=rnd.choices(statuses, weights=weights)[0], message='Хочу участвовать',
+            )
+            for _ in range(sizes.applications)
+        ])
+
+    def create_projects(self, direction, profiles):
+        sizes, rnd = self.sizes, self.random
+        projects = self.create(Project, [
+            Project(direction=direction, name=f'Проект {direction.pk}-{number + 1}', description='Описание проекта')
+            for number in range(sizes.projects)
+        ])
+        stages = self.create(Stage, [
+            Stage(project=project, name=name, color=color, position=position)
+            for project in projects
+            for position, (name, color) in enumerate(STAGES, start=1)
+        ])
+        stages_by_project = {}
+        for stage in stages:
+            stages_by_project.setdefault(stage.project_id, []).append(stage)
+
+        teams = self.create(Team, [
+            Team(curator=rnd.choice(profiles), name=f'Команда {project.pk}-{number + 1}', project=project)
+            for project in projects
+            for number in range(sizes.teams)
+        ])
+        members = {team.pk: rnd.sample(profiles, min(sizes.students, len(profiles))) for team in teams}
+        self.through(Team.students.field, [(team_id, p.pk) for team_id, students in members.items() for p in students])
+        self.create(Role, [Role(user_id=team.curator_id, role_type='curator',
+                                content_type=ContentType.objects.get_for_model(Project), object_id=team.project_id)
+                           for team in teams])
+
+        project_members = {}
+        for team in teams:
+            project_members.setdefault(team.project_id, []).extend(members[team.pk])
+        self.create(Meeting, [
+            Meeting(project=project, name='Планерка', datetime=self.now + timedelta(days=number * 7))
+            for project in projects
+            for number in range(2)
+        ])
+        for project in projects:
+            self.create_tasks(project, stages_by_project[project.pk], project_members[project.pk] or profiles)
+
+    def task(self, project, stages, people, parent=None):
+        rnd = self.random
+        start = self.now - timedelta(days=rnd.randint(0, 30))
+        return Task(
+            creator=rnd.choice(people), responsible_user=rnd.choice(people), project=project,
+            status=rnd.choice(stages), parent_task=parent, is_completed=rnd.random() < 0.3,
+            name=f'{rnd.choice(TASK_VERBS)} {rnd.choice(TASK_OBJECTS)}', description='Описание задачи',
+            start=start, end=start + timedelta(days=rnd.randint(1, 21)),
+        )
+
+    def create_tasks(self, project, stages, people):
+        sizes, rnd = self.sizes, self.random
+        roots = self.create(Task, [self.task(project, stages, people) for _ in range(sizes.tasks)])
+        subtasks = self.create(Task, [
+            self.task(project, stages, people, parent=root) for root in roots for _ in range(sizes.subtasks)
+        ])
+        tasks = roots + subtasks
+
+        self.through(Task.performers.field, [(task.pk, rnd.choice(people).pk) for task in tasks])
+        self.create(Comment, [
+            Comment(task=task, author=rnd.choice(people), content='Комментарий к задаче')
+            for task in tasks for _ in range(sizes.comments)
+        ])
+        if sizes.checklist_items:
+            checklists = self.create(Checklist, [Checklist(task=task, name='Чек-лист') for task in tasks])
+            self.create(ChecklistItem, [
+                ChecklistItem(checklist=checklist, description=f'Пункт {number + 1}',
+                              is_completed=rnd.random() < 0.5)
+                for checklist in checklists for number in range(sizes.checklist_items)
+            ])
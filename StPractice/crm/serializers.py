@@ -2,6 +2,35 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from .models import *
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from .utils import get_query_list
+
+
+class DynamicFieldsMixin:
+    """
+    Выбор полей через параметры запроса:
+    ?fields=name,start — вернуть только перечисленные поля;
+    ?expand=directions — добавить вложенные объекты, описанные в Meta.expandable_fields
+    как {имя: (класс сериализатора, параметры)}.
+    Вложенные сериализаторы, объявленные в классе, создаются без context и не затрагиваются.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        expand = get_query_list(request, 'expand') & set(expandable)
+        for name in expand:
+            serializer_class, options = expandable[name]
+            self.fields[name] = serializer_class(**options)
+
+        fields = get_query_list(request, 'fields')
+        if fields:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
 
 
 class TelegramMessageSerializer(serializers.Serializer):
@@ -45,7 +74,8 @@ class UserSerializer(serializers.ModelSerializer):
 
 class ProfileSerializer(serializers.ModelSerializer):
     # user = UserSerializer(read_only=True)
-    user_id = serializers.IntegerField(source='user.id', read_only=True)
+    # pk профиля совпадает с id пользователя, поэтому User не подгружается
+    user_id = serializers.IntegerField(source='pk', read_only=True)
 
     class Meta:
         model = Profile
@@ -182,6 +212,41 @@ class ApplicationUpdateSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class ApplicationBulkStatusSerializer(serializers.Serializer):
+    applications = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=5000,
+    )
+    status = serializers.PrimaryKeyRelatedField(queryset=Status.objects.all())
+
+
+class ParticipantImportRowSerializer(serializers.Serializer):
+    """Строка массового импорта участников (crm.imports). Связанные объекты — по названию"""
+    username = serializers.CharField(max_length=150, required=False, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(max_length=100, required=False)
+    password = serializers.CharField(min_length=8, required=False)
+    surname = serializers.CharField(max_length=100, required=False)
+    name = serializers.CharField(max_length=100, required=False)
+    patronymic = serializers.CharField(max_length=100, required=False)
+    telegram = serializers.CharField(max_length=100, required=False)
+    vk = serializers.CharField(max_length=100, required=False)
+    university = serializers.CharField(max_length=100, required=False)
+    job = serializers.CharField(max_length=100, required=False)
+    course = serializers.IntegerField(min_value=1, max_value=10, required=False)
+    direction = serializers.CharField(max_length=100, required=False)
+    specialization = serializers.CharField(max_length=100, required=False)
+    status = serializers.CharField(max_length=100, required=False)
+    message = serializers.CharField(max_length=1000, required=False)
+
+    def validate(self, attrs):
+        # Логин по умолчанию — email, как при регистрации (RegisterSerializer)
+        attrs['username'] = attrs.get('username') or attrs.get('email')
+        if not attrs['username']:
+            raise serializers.ValidationError({'username': 'Нужен username или email'})
+        return attrs
+
+
 class TestSerializer(serializers.ModelSerializer):
     class Meta:
         model = Test
@@ -206,6 +271,21 @@ class TrueAnswerSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class TestAttemptAnswerSerializer(serializers.Serializer):
+    question = serializers.IntegerField(min_value=1)
+    answer = serializers.CharField(max_length=100, allow_blank=True, trim_whitespace=False)
+
+
+class TestAttemptSerializer(serializers.Serializer):
+    answers = serializers.ListField(child=TestAttemptAnswerSerializer(), allow_empty=False, max_length=1000)
+
+    def validate_answers(self, answers):
+        questions = [item['question'] for item in answers]
+        if len(set(questions)) != len(questions):
+            raise serializers.ValidationError('На каждый вопрос — один ответ')
+        return answers
+
+
 class EventSerializer(serializers.ModelSerializer):
     # creator = ProfileSerializer(read_only=True)
 
@@ -230,6 +310,33 @@ class EventSerializer(serializers.ModelSerializer):
             "applications", "event_id"]
 
 
+class EventListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Компактное представление для списка мероприятий: скалярные поля и счетчики"""
+    event_id = serializers.IntegerField(read_only=True, source="id")
+    applications_count = serializers.IntegerField(read_only=True)
+    directions_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Event
+        fields = [
+            "event_id",
+            "name",
+            "specializations",
+            "description",
+            "stage",
+            "start",
+            "end",
+            "end_app",
+            "applications_count",
+            "directions_count"]
+        expandable_fields = {
+            "specializationsSet": (SpecializationSerializer,
+                                   {"read_only": True, "many": True, "source": "specializations"}),
+            "directions": (DirectionSerializer, {"read_only": True, "many": True}),
+            "applications": (ApplicationSerializer, {"read_only": True, "many": True}),
+        }
+
+
 class EventCreateSerializer(serializers.ModelSerializer):
     # user = ProfileSerializer(read_only=True)
     # specializations = SpecializationSerializer(read_only=True, many=True)
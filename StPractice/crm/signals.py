@@ -1,57 +1,244 @@
 from datetime import datetime
 
-from django.db.models.signals import post_save
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_init, post_save, pre_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 
-from crm.utils import generate_verification_token
-from plan.models import Profile
-from crm.models import Contact, Role
-from django.core.mail import send_mail
-from django.urls import reverse
+from crm.utils import generate_verification_token, clear_role_cache
+from plan.changes import record_change
+from plan.events import publish_change
+from plan.models import Profile, Project, Team, Task, Comment, Checklist, ChecklistItem, Meeting, Stage
+from crm.models import Contact, Role, FunctionOrder, Robot, Trigger, Status_order, Status, Application, Event, \
+    Direction, Specialization, OrgChat, Test, Question, True_Answer
+from crm.robots_triggers import invalidate_plans
+from crm.scheduler import TIME_TRIGGER, schedule_new_trigger, schedule_time_triggers
+from crm.grading import regrade
+from crm.onboarding import onboard_users
+from crm.outbox import enqueue, verification_email
+from crm.scopes import refresh_scopes, scope_holders
+from crm.search import index_object, remove_object
+from crm.caching import bump_version_on_commit, rows_of
 
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        profile = Profile.objects.create(user=instance)
-        if instance.is_superuser:
-            Role.objects.get_or_create(user=profile,
-                                       role_type='admin',
-                                       content_type=None,
-                                       object_id=None)
-        else:
-            Role.objects.get_or_create(user=profile,
-                                       role_type='projectant',
-                                       content_type=None,
-                                       object_id=None)
-
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def onboard_new_user(sender, instance, created, raw=False, **kwargs):
+    # Только при создании: профиль, роль и почтовый контакт (crm.onboarding)
+    if created and not raw:
+        onboard_users([instance])
 
 
-@receiver(post_save, sender=User)
-def assign_email_address(sender, instance, **kwargs):
-    if instance.email:
-        Contact.objects.create(profile=Profile.objects.get(user=instance), type="Почта", data=instance.email, )
+@receiver(pre_save, sender=Contact)
+def set_verification_token(sender, instance, **kwargs):
+    # Токен выдается до вставки, чтобы не сохранять новый контакт второй раз
+    if instance._state.adding and instance.type == 'Почта' and not instance.is_verified \
+            and not instance.verified_token:
+        instance.verified_token = generate_verification_token()
+        instance.token_created_at = timezone.now()
 
 
 @receiver(post_save, sender=Contact)
 def send_verification_email(sender, instance, created, **kwargs):
-    if created and not instance.is_verified and not instance.profile.user.is_superuser:
-        instance.verified_token = generate_verification_token()
-        instance.token_created_at = timezone.now()
-        instance.save()
-        verification_url = reverse('verify-email') + f'?token={instance.verified_token}'
-        full_url = f"https://crm.meetuppoint.ru{verification_url}"
-
-        send_mail(
-            'Подтверждение email',
-            f'Перейдите по ссылке для подтверждения: {full_url}',
-            'no-reply@meetuppoint.ru',
-            recipient_list=[instance.data],
-            fail_silently=False,
-        )
+    if created and instance.type == 'Почта' and not instance.is_verified \
+            and not User.objects.filter(pk=instance.profile_id, is_superuser=True).exists():
+        enqueue('email', **verification_email(instance))
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role_cache(sender, instance, **kwargs):
+    clear_role_cache(instance.user_id)
+    # Профиль, через который изменили роль, не должен держать старый набор ролей
+    if Role.user.is_cached(instance):
+        instance.user.__dict__.pop('_roles_cache', None)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def refresh_role_scopes(sender, instance, **kwargs):
+    refresh_scopes([instance.user_id])
+
+
+@receiver(post_save, sender=Direction)
+def refresh_direction_scopes(sender, instance, **kwargs):
+    # Прежний руководитель уже видит направление, новый и организаторы мероприятия — через event
+    refresh_scopes(scope_holders(instance, instance.event) | {instance.leader_id})
+
+
+@receiver(post_save, sender=Project)
+def refresh_project_scopes(sender, instance, **kwargs):
+    refresh_scopes(scope_holders(instance, instance.direction))
+
+
+@receiver(post_save, sender=Team)
+def refresh_team_scopes(sender, instance, **kwargs):
+    refresh_scopes(scope_holders(instance, instance.project) | {instance.curator_id})
+
+
+@receiver(m2m_changed, sender=Team.students.through)
+def refresh_team_students_scopes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        refresh_scopes([instance.pk])
+    else:
+        # После clear бывшие участники остаются держателями области команды
+        refresh_scopes(pk_set or scope_holders(instance))
+
+
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Direction)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Team)
+def drop_deleted_scopes(sender, instance, **kwargs):
+    # Роли на удаленный объект не удаляются каскадом (GenericForeignKey)
+    Role.objects.filter(content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk).delete()
+    refresh_scopes(scope_holders(instance))
+
+
+@receiver(post_save, sender=FunctionOrder)
+@receiver(post_delete, sender=FunctionOrder)
+@receiver(post_save, sender=Robot)
+@receiver(post_delete, sender=Robot)
+@receiver(post_save, sender=Trigger)
+@receiver(post_delete, sender=Trigger)
+@receiver(post_save, sender=Status_order)
+@receiver(post_delete, sender=Status_order)
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+def invalidate_automation_plans(sender, **kwargs):
+    # Скомпилированные цепочки функций статусов (crm.robots_triggers) больше не актуальны
+    invalidate_plans()
+
+
+@receiver(post_save, sender=FunctionOrder)
+def schedule_added_time_trigger(sender, instance, created, raw=False, **kwargs):
+    # Заявки, уже находящиеся в статусе, тоже ждут нового временного триггера
+    if created and not raw and instance.trigger_id and instance.trigger.type_condition == TIME_TRIGGER:
+        schedule_new_trigger(instance)
+
+
+@receiver(post_init, sender=Application)
+def remember_scheduled_status(sender, instance, **kwargs):
+    # __dict__, а не атрибут: отложенное поле статуса не загружается лишним запросом
+    instance._scheduled_status_id = instance.__dict__.get('status_id')
+
+
+@receiver(post_save, sender=Application)
+def reschedule_time_triggers(sender, instance, created, **kwargs):
+    # Сроки пересчитываются только при смене статуса: обычное сохранение не должно
+    # заново планировать уже сработавшие триггеры. Изменение поля, от которого считается срок,
+    # учитывает сам планировщик при срабатывании (crm.scheduler.fire_trigger)
+    if created or instance.status_id != instance._scheduled_status_id:
+        schedule_time_triggers([instance])
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Application)
+def update_search_document(sender, instance, **kwargs):
+    index_object(instance)
+    if sender is Profile:
+        # В документе заявки хранится ФИО автора
+        for application in Application.objects.filter(user=instance).select_related('user'):
+            index_object(application)
+
+
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Application)
+def delete_search_document(sender, instance, **kwargs):
+    remove_object(instance)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Stage)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Checklist)
+@receiver(post_save, sender=ChecklistItem)
+@receiver(post_save, sender=Meeting)
+def record_project_change(sender, instance, raw=False, **kwargs):
+    # Лента изменений проекта (plan.changes) и push-канал (plan.events)
+    if not raw:
+        publish_change(record_change(instance))
+
+
+@receiver(pre_delete, sender=Task)
+@receiver(pre_delete, sender=Stage)
+@receiver(pre_delete, sender=Comment)
+@receiver(pre_delete, sender=Checklist)
+@receiver(pre_delete, sender=ChecklistItem)
+@receiver(pre_delete, sender=Meeting)
+def record_project_deletion(sender, instance, **kwargs):
+    publish_change(record_change(instance, deleted=True))
+
+
+@receiver(m2m_changed, sender=Task.performers.through)
+@receiver(m2m_changed, sender=Meeting.participants.through)
+def record_participants_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        publish_change(record_change(instance))
+    elif pk_set:
+        # profile.performers.add(task): instance — профиль, pk_set — задачи или встречи
+        for obj in model.objects.filter(pk__in=pk_set):
+            publish_change(record_change(obj))
+
+
+@receiver(post_save, sender=True_Answer)
+@receiver(post_delete, sender=True_Answer)
+def regrade_question_answers(sender, instance, **kwargs):
+    # Сохраненные ответы пересчитываются по новым правильным ответам (crm.grading)
+    regrade([instance.question_id])
+
+
+@receiver(post_save, sender=Question)
+def regrade_question(sender, instance, created, **kwargs):
+    # Мог измениться балл за вопрос
+    if not created:
+        regrade([instance.pk])
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Specialization)
+@receiver(post_delete, sender=Specialization)
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+@receiver(post_save, sender=Direction)
+@receiver(post_delete, sender=Direction)
+@receiver(post_save, sender=OrgChat)
+@receiver(post_delete, sender=OrgChat)
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=True_Answer)
+@receiver(post_delete, sender=True_Answer)
+def bump_cached_version(sender, **kwargs):
+    # Закешированные ответы справочников (crm.caching) больше не актуальны
+    bump_version_on_commit(sender)
+
+
+@receiver(post_save, sender=Direction)
+@receiver(post_delete, sender=Direction)
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def bump_rows_version(sender, created=True, **kwargs):
+    # Счетчики строк (список мероприятий) меняются только при создании и удалении
+    if created:
+        bump_version_on_commit(rows_of(sender))
+
+
+@receiver(m2m_changed, sender=Event.specializations.through)
+def bump_event_version(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_version_on_commit(Event)
@@ -1,3 +1,1671 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+import unittest
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from plan.models import Change, Project, Stage, Team, Task
+
+from . import clients, exports, grading, imports, metrics, outbox, profiling, robots_triggers, routers
+from .models import Event, Profile, Role, OutboundMessage, Status, Status_order, Application, Robot, Trigger, \
+    FunctionOrder, ScheduledTrigger, Direction, Specialization, Contact, AccessScope, SearchDocument, Test, Question, \
+    True_Answer, Answer
+from .imports import ParticipantImporter
+from .onboarding import onboard_users
+from .scheduler import run_due_triggers
+from .scopes import refresh_scopes, scope_content_types
+from .search import matching_ids, rebuild_index
+from .utils import has_role
+from .views import ApplicationFilter
+
+FAKE_TRANSPORTS = {channel: 'crm.tests.RecordingTransport' for channel in outbox.DEFAULT_TRANSPORTS}
+
+
+class RecordingTransport(outbox.FakeTransport):
+    """FakeTransport, созданные экземпляры которого доступны тесту"""
+    instances = []
+
+    def __init__(self):
+        super().__init__()
+        self.instances.append(self)
+
+    @classmethod
+    def sent_payloads(cls):
+        return [payload for transport in cls.instances for payload in transport.sent]
+
+
+class UnavailableTransport(RecordingTransport):
+    def open(self):
+        raise outbox.TransportError('Fake transport unavailable')
+
+
+def create_profile(username, **kwargs):
+    return User.objects.create_user(username=username, password='password', **kwargs).profile
+
+
+def create_event(name='Event'):
+    today = timezone.now().date()
+    return Event.objects.create(name=name, start=today, end=today, end_app=today)
+
+
+class RoleCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = create_event()
+        self.profile = create_profile('organizer')
+        Role.objects.create(user=self.profile, role_type='organizer',
+                            content_type=ContentType.objects.get_for_model(Event), object_id=self.event.id)
+        self.profile = Profile.objects.get(pk=self.profile.pk)
+
+    def test_roles_loaded_once_per_profile(self):
+        other_event = create_event('Other')
+
+        with self.assertNumQueries(1):
+            self.assertTrue(self.profile.is_organizer(self.event))
+            self.assertFalse(self.profile.is_organizer(other_event))
+            self.assertFalse(self.profile.is_admin())
+            self.assertTrue(has_role(self.profile, 'projectant'))
+
+    @mock.patch('crm.utils.cache_is_shared', return_value=True)
+    def test_shared_cache_used_by_other_instances(self, shared):
+        self.profile.is_admin()
+
+        other = Profile(pk=self.profile.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(other.is_organizer(self.event))
+
+    def test_process_memory_cache_not_used(self):
+        self.profile.is_admin()
+
+        other = Profile(pk=self.profile.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(other.is_organizer(self.event))
+
+    def test_role_changes_invalidate_cache(self):
+        self.assertFalse(self.profile.is_admin())
+
+        role = Role.objects.create(user=self.profile, role_type='admin')
+        self.assertTrue(self.profile.is_admin())
+
+        role.delete()
+        self.assertFalse(Profile(pk=self.profile.pk).is_admin())
+
+    def test_user_instance_resolves_profile_roles(self):
+        user = User.objects.get(pk=self.profile.pk)
+        self.assertTrue(has_role(user, 'organizer', self.event))
+
+
+@override_settings(OUTBOX_TRANSPORTS=FAKE_TRANSPORTS, OUTBOX_RATE_LIMITS={'telegram': 0, 'vk': 0, 'email': 0})
+class OutboxTests(TestCase):
+    def setUp(self):
+        RecordingTransport.instances = []
+        RecordingTransport.fail = False
+
+    def test_send_message_is_queued(self):
+        response = APIClient().post('/api/send-message/tg/', {'chat_id': '1', 'message': 'Привет'}, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        message = OutboundMessage.objects.get(id=response.json()['id'])
+        self.assertEqual(message.status, 'pending')
+        self.assertEqual(RecordingTransport.sent_payloads(), [])
+
+    def test_verification_email_is_queued(self):
+        create_profile('user@example.com', email='user@example.com')
+
+        message = OutboundMessage.objects.get(channel='email')
+        self.assertEqual(message.payload['recipient_list'], ['user@example.com'])
+
+    def test_worker_sends_batch(self):
+        for i in range(3):
+            outbox.enqueue('vk', recipient_id=i, message='text', random_id=i)
+
+        self.assertEqual(outbox.process_batch(), (3, 0))
+        self.assertEqual(len(RecordingTransport.sent_payloads()), 3)
+        self.assertFalse(OutboundMessage.objects.exclude(status='sent').exists())
+
+    def test_failed_message_is_retried_with_backoff(self):
+        message = outbox.enqueue('telegram', chat_id='1', message='text')
+        RecordingTransport.fail = True
+
+        self.assertEqual(outbox.process_batch(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'pending')
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # Пока задержка не истекла, сообщение не забирается повторно
+        self.assertEqual(outbox.process_batch(), (0, 0))
+
+        OutboundMessage.objects.filter(id=message.id).update(
+            attempts=outbox.MAX_ATTEMPTS - 1, next_attempt_at=timezone.now()
+        )
+        outbox.process_batch()
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'failed')
+
+    def test_unavailable_channel_is_retried(self):
+        email = outbox.enqueue_email('Тема', 'Текст', ['user@example.com'])
+        outbox.enqueue('vk', recipient_id=1, message='text', random_id=1)
+
+        with override_settings(OUTBOX_TRANSPORTS={**FAKE_TRANSPORTS, 'email': 'crm.tests.UnavailableTransport'}):
+            self.assertEqual(outbox.process_batch(), (1, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+
+            OutboundMessage.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+            self.assertEqual(async_to_sync(outbox.aprocess_batch)(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 2)
+        self.assertEqual(len(RecordingTransport.sent_payloads()), 1)
+
+
+class OnboardingTests(TestCase):
+    def test_new_user_onboarded_once(self):
+        user = User.objects.create_user(username='user@example.com', email='user@example.com', password='password')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(user.profile.pk, user.pk)
+        self.assertEqual(list(Role.objects.filter(user=user.profile).values_list('role_type', flat=True)),
+                         ['projectant'])
+        contact = Contact.objects.get(profile=user.profile)
+        self.assertEqual((contact.type, contact.data), ('Почта', 'user@example.com'))
+        email = OutboundMessage.objects.get(channel='email')
+        self.assertIn(contact.verified_token, email.payload['message'])
+        self.assertTrue(SearchDocument.objects.filter(
+            content_type=ContentType.objects.get_for_model(Profile), object_id=user.pk).exists())
+
+        # Вход обновляет last_login — больше ничего не создается и не сохраняется
+        user.last_login = timezone.now()
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+        user.save()
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertEqual(OutboundMessage.objects.count(), 1)
+
+    def test_superuser_gets_admin_role_without_email(self):
+        user = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+
+        self.assertTrue(has_role(user, 'admin'))
+        self.assertTrue(Contact.objects.filter(profile_id=user.pk).exists())
+        self.assertFalse(OutboundMessage.objects.exists())
+
+    def test_onboarding_is_idempotent(self):
+        user = User.objects.create_user(username='user', email='user@example.com')
+
+        onboarded = onboard_users([User.objects.get(pk=user.pk)])
+
+        self.assertEqual(onboarded, ([], []))
+        self.assertEqual(Role.objects.filter(user_id=user.pk).count(), 1)
+        self.assertEqual(Contact.objects.filter(profile_id=user.pk).count(), 1)
+
+    def test_bulk_onboarding_queries_do_not_grow(self):
+        users = User.objects.bulk_create([User(username=f'user{i}', email=f'user{i}@example.com') for i in range(21)])
+
+        with CaptureQueriesContext(connection) as one:
+            onboard_users(users[:1])
+        with CaptureQueriesContext(connection) as many:
+            onboard_users(users[1:])
+
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(Profile.objects.count(), 21)
+        self.assertEqual(OutboundMessage.objects.filter(channel='email').count(), 21)
+
+    def test_new_email_contact_saved_once(self):
+        profile = create_profile('user')
+
+        with CaptureQueriesContext(connection) as queries:
+            contact = Contact.objects.create(profile=profile, type='Почта', data='other@example.com')
+
+        self.assertIsNotNone(contact.verified_token)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.assertTrue(OutboundMessage.objects.filter(payload__recipient_list=['other@example.com']).exists())
+
+        Contact.objects.create(profile=profile, type='ТГ', data='@user')
+        self.assertEqual(OutboundMessage.objects.count(), 1)
+
+
+class AutomationTestMixin:
+    def setUp(self):
+        super().setUp()
+        robots_triggers.invalidate_plans()
+        self.event = create_event()
+        self.statuses = {name: Status.objects.create(name=name) for name in ['Новая', 'Принята', 'Отклонена']}
+        self.orders = {
+            name: Status_order.objects.create(event=self.event, status=status, number=number)
+            for number, (name, status) in enumerate(self.statuses.items(), start=1)
+        }
+        self.move_robot = Robot.objects.create(name='Перевод', type_action='move_status')
+        self.field_trigger = Trigger.objects.create(name='Одобрена', type_condition='field_comparison')
+
+    def add_function(self, status_name, position, robot=None, trigger=None, **config):
+        return FunctionOrder.objects.create(
+            status_order=self.orders[status_name], position=position,
+            type_function='robot' if robot else 'trigger', robot=robot, trigger=trigger, config=config,
+        )
+
+    def create_application(self, status_name='Новая', **kwargs):
+        return Application.objects.create(
+            user=create_profile(f'user{Application.objects.count()}'),
+            event=self.event, status=self.statuses[status_name], **kwargs,
+        )
+
+
+class AutomationPlanTests(AutomationTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_function('Новая', 1, trigger=self.field_trigger, field='is_approved', operator='==', value=True)
+        self.add_function('Новая', 2, robot=self.move_robot, target_status='Принята')
+
+    def process(self, application):
+        async_to_sync(robots_triggers.process_status_functions)(application)
+        application.refresh_from_db()
+        return application.status.name
+
+    def test_plan_is_compiled_once(self):
+        new_status = self.statuses['Новая']
+        plan = robots_triggers.get_plan(self.event.id, new_status.id)
+
+        self.assertEqual([step.action for step in plan], ['field_comparison', 'move_status'])
+        self.assertEqual(plan[1].target_status, self.statuses['Принята'])
+        with self.assertNumQueries(0):
+            self.assertIs(robots_triggers.get_plan(self.event.id, new_status.id), plan)
+
+    @override_settings(AUTOMATION_PLAN_TTL=0)
+    def test_plan_expires_without_invalidation(self):
+        new_status = self.statuses['Новая']
+        plan = robots_triggers.get_plan(self.event.id, new_status.id)
+        time.sleep(0.01)
+
+        self.assertIsNot(robots_triggers.get_plan(self.event.id, new_status.id), plan)
+
+    def test_trigger_gates_following_robots(self):
+        self.assertEqual(self.process(self.create_application(is_approved=False)), 'Новая')
+        self.assertEqual(self.process(self.create_application(is_approved=True)), 'Принята')
+
+    def test_plan_invalidated_on_function_change(self):
+        new_status = self.statuses['Новая']
+        robots_triggers.get_plan(self.event.id, new_status.id)
+
+        FunctionOrder.objects.get(position=2).delete()
+
+        self.assertEqual(len(robots_triggers.get_plan(self.event.id, new_status.id)), 1)
+
+
+class BulkStatusTests(AutomationTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        organizer = create_profile('organizer')
+        Role.objects.create(user=organizer, role_type='organizer',
+                            content_type=ContentType.objects.get_for_model(Event), object_id=self.event.id)
+        self.client = APIClient()
+        self.client.force_authenticate(organizer.user)
+        notification = Robot.objects.create(name='Уведомление', type_action='notification')
+        self.add_function('Принята', 1, robot=notification, bot_token='token', chat_id='1')
+
+    def move(self, ids, status_name):
+        return self.client.post('/api/application/bulk-status/', {
+            'applications': ids, 'status': self.statuses[status_name].id,
+        }, format='json')
+
+    def test_bulk_move_batches_queries_and_notifications(self):
+        ids = [self.create_application().id for _ in range(20)]
+
+        with mock.patch.object(robots_triggers, 'send_telegram_batch') as send:
+            # + роли пользователя для проверки области видимости
+            with self.assertNumQueries(6):
+                response = self.move(ids + [999999], 'Принята')
+
+        self.assertEqual(response.status_code, 200)
+        send.assert_called_once()
+        self.assertEqual(len(send.call_args.args[0]), 20)
+        results = response.data['results']
+        self.assertEqual([result['id'] for result in results], ids + [999999])
+        self.assertTrue(all(result['success'] for result in results[:-1]))
+        self.assertFalse(results[-1]['success'])
+        self.assertEqual(Application.objects.filter(status=self.statuses['Принята']).count(), 20)
+
+    def test_bulk_move_runs_chain_per_status(self):
+        self.add_function('Отклонена', 1, trigger=self.field_trigger, field='is_link', operator='==', value=True)
+        self.add_function('Отклонена', 2, robot=self.move_robot, target_status='Новая')
+        linked = self.create_application(is_link=True)
+        other = self.create_application()
+
+        response = self.move([linked.id, other.id], 'Отклонена')
+
+        statuses = {result['id']: result['status'] for result in response.data['results']}
+        self.assertEqual(statuses, {linked.id: self.statuses['Новая'].id, other.id: self.statuses['Отклонена'].id})
+        linked.refresh_from_db()
+        self.assertEqual(linked.status, self.statuses['Новая'])
+
+    def test_applications_outside_scope_are_rejected(self):
+        own = self.create_application()
+        foreign = Application.objects.create(user=create_profile('foreign'), event=create_event('Other'),
+                                             status=self.statuses['Новая'])
+
+        response = self.move([own.id, foreign.id], 'Отклонена')
+
+        self.assertEqual([result['success'] for result in response.data['results']], [True, False])
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.status, self.statuses['Новая'])
+
+        self.client.force_authenticate(create_profile('participant').user)
+        response = self.move([own.id], 'Принята')
+        self.assertFalse(response.data['results'][0]['success'])
+
+
+class TimeTriggerSchedulerTests(AutomationTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        time_trigger = Trigger.objects.create(name='Прошел час', type_condition='time_expiration')
+        self.trigger_function = self.add_function('Новая', 1, trigger=time_trigger, interval='hours', value=1)
+        self.add_function('Новая', 2, robot=self.move_robot, target_status='Отклонена')
+
+    def test_due_time_stored_on_status_entry(self):
+        application = self.create_application()
+
+        scheduled = ScheduledTrigger.objects.get(application=application)
+        self.assertEqual(scheduled.function_order, self.trigger_function)
+        self.assertEqual(scheduled.due_at, application.date_sub + timezone.timedelta(hours=1))
+
+    def test_tick_only_scans_due_rows(self):
+        self.create_application()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(run_due_triggers(), 0)
+
+    def test_due_trigger_resumes_chain(self):
+        application = self.create_application()
+        past = timezone.now() - timezone.timedelta(hours=2)
+        Application.objects.filter(id=application.id).update(date_sub=past)
+        ScheduledTrigger.objects.filter(application=application).update(due_at=past + timezone.timedelta(hours=1))
+
+        self.assertEqual(run_due_triggers(), 1)
+
+        application.refresh_from_db()
+        self.assertEqual(application.status.name, 'Отклонена')
+        self.assertFalse(ScheduledTrigger.objects.exists())
+
+    def test_added_trigger_is_scheduled_for_waiting_applications(self):
+        application = self.create_application()
+        time_trigger = Trigger.objects.create(name='Прошло два часа', type_condition='time_expiration')
+
+        function = self.add_function('Новая', 3, trigger=time_trigger, interval='hours', value=2)
+
+        scheduled = ScheduledTrigger.objects.get(application=application, function_order=function)
+        self.assertEqual(scheduled.due_at, application.date_sub + timezone.timedelta(hours=2))
+
+
+class TimeTriggerChainTests(AutomationTestMixin, TestCase):
+    """Шаги после временного триггера выполняются один раз"""
+
+    def setUp(self):
+        super().setUp()
+        self.time_trigger = Trigger.objects.create(name='Прошел час', type_condition='time_expiration')
+        self.notification = Robot.objects.create(name='Уведомление', type_action='notification')
+        self.sent = []
+
+    async def fake_post(self, config, message):
+        self.sent.append(config['chat_id'])
+
+    def add_notification(self, status_name, position, chat_id):
+        return self.add_function(status_name, position, robot=self.notification, bot_token='token', chat_id=chat_id)
+
+    def expire(self, application):
+        past = timezone.now() - timezone.timedelta(hours=2)
+        Application.objects.filter(id=application.id).update(date_sub=past)
+        ScheduledTrigger.objects.filter(application=application).update(due_at=past + timezone.timedelta(hours=1))
+
+    def test_trigger_due_at_entry_is_not_scheduled(self):
+        self.add_function('Принята', 1, trigger=self.time_trigger, interval='hours', value=0)
+        self.add_notification('Принята', 2, 'accepted')
+        waiting = self.add_function('Принята', 3, trigger=self.time_trigger, interval='hours', value=1)
+        application = self.create_application()
+
+        with mock.patch.object(robots_triggers, 'post_telegram_message', self.fake_post):
+            async_to_sync(robots_triggers.move_application_status)(application.id, 'Принята')
+
+        self.assertEqual(self.sent, ['accepted'])
+        scheduled = ScheduledTrigger.objects.filter(application=application)
+        self.assertQuerysetEqual(scheduled.values_list('function_order', flat=True), [waiting.id])
+
+    def test_save_after_firing_does_not_reschedule(self):
+        self.add_function('Новая', 1, trigger=self.time_trigger, interval='hours', value=1)
+        self.add_notification('Новая', 2, 'expired')
+        application = self.create_application()
+        self.expire(application)
+
+        with mock.patch.object(robots_triggers, 'post_telegram_message', self.fake_post):
+            self.assertEqual(run_due_triggers(), 1)
+        application.refresh_from_db()
+        application.comment = 'Проверено'
+        application.save()
+
+        self.assertEqual(self.sent, ['expired'])
+        self.assertFalse(ScheduledTrigger.objects.exists())
+
+    def test_triggers_with_same_due_time_continue_chain_once(self):
+        self.add_function('Новая', 1, trigger=self.time_trigger, interval='hours', value=1)
+        self.add_function('Новая', 2, trigger=self.time_trigger, interval='minutes', value=30)
+        self.add_notification('Новая', 3, 'expired')
+        application = self.create_application()
+        self.assertEqual(len(set(ScheduledTrigger.objects.values_list('due_at', flat=True))), 1)
+        self.expire(application)
+
+        with mock.patch.object(robots_triggers, 'post_telegram_message', self.fake_post):
+            self.assertEqual(run_due_triggers(), 2)
+
+        self.assertEqual(self.sent, ['expired'])
+        self.assertFalse(ScheduledTrigger.objects.exists())
+
+
+class ConcurrentRobotsTests(AutomationTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        notification = Robot.objects.create(name='Уведомление', type_action='notification')
+        for position in range(1, 6):
+            self.add_function('Новая', position, robot=notification, bot_token='token', chat_id=str(position))
+        self.add_function('Новая', 6, robot=self.move_robot, target_status='Принята')
+        self.running = self.max_running = 0
+        self.sent_before_move = None
+
+    async def fake_post(self, config, message):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+
+    async def run_chain(self, application):
+        original_move = robots_triggers.ROBOT_HANDLERS['move_status']
+
+        async def move(step, application, depth):
+            self.sent_before_move = self.running == 0 and self.max_running > 0
+            return await original_move(step, application, depth)
+
+        with mock.patch.object(robots_triggers, 'post_telegram_message', self.fake_post), \
+                mock.patch.dict(robots_triggers.ROBOT_HANDLERS, {'move_status': move}):
+            robots_triggers.invalidate_plans()
+            await robots_triggers.process_status_functions(application)
+
+    @override_settings(AUTOMATION_CONCURRENCY=2)
+    def test_notifications_run_concurrently_before_move(self):
+        application = self.create_application()
+
+        async_to_sync(self.run_chain)(application)
+
+        self.assertEqual(self.max_running, 2)
+        self.assertTrue(self.sent_before_move)
+        application.refresh_from_db()
+        self.assertEqual(application.status.name, 'Принята')
+
+    def test_http_client_shared_within_loop(self):
+        async def clients():
+            return robots_triggers.get_http_client() is robots_triggers.get_http_client()
+
+        self.assertTrue(async_to_sync(clients)())
+
+    def test_http_session_closes_its_client(self):
+        @clients.http_session
+        async def session():
+            client = robots_triggers.get_http_client()
+            inner = await asyncio.gather(*(asyncio.sleep(0, robots_triggers.get_http_client()) for _ in range(2)))
+            return client, inner
+
+        client, inner = async_to_sync(session)()
+
+        self.assertTrue(all(other is client for other in inner))
+        self.assertTrue(client.is_closed)
+
+
+class StubAPIServer:
+    """
+    Локальная заглушка Telegram Bot API и VK API: отвечает с задержкой delay
+    и запоминает запросы и наибольшее число одновременных запросов
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []
+        self.running = self.max_running = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                with stub.lock:
+                    stub.running += 1
+                    stub.max_running = max(stub.max_running, stub.running)
+                    stub.requests.append((self.path, body))
+                    number = len(stub.requests)
+                time.sleep(stub.delay)
+                with stub.lock:
+                    stub.running -= 1
+                if '/sendMessage' in self.path:
+                    data = {'ok': True, 'result': {'message_id': number}}
+                else:
+                    data = {'response': number}
+                content = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(OUTBOX_TRANSPORTS={}, OUTBOX_RATE_LIMITS={'telegram': 0, 'vk': 0, 'email': 0},
+                   TELEGRAM_BOT_TOKEN='token', VK_CONFIG={'ACCESS_TOKEN': 'token', 'API_VERSION': '5.131'})
+class AsyncMessagingTests(AutomationTestMixin, TestCase):
+    def stub(self, delay=0.0):
+        server = StubAPIServer(delay)
+        settings = override_settings(TELEGRAM_API_URL=server.url, VK_API_URL=server.url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        return server
+
+    def test_async_worker_sends_batch_concurrently(self):
+        for i in range(10):
+            outbox.enqueue('vk', recipient_id=i + 1, message='text', random_id=i)
+            outbox.enqueue('telegram', chat_id=str(i), message='text')
+
+        with self.stub(delay=0.2) as server:
+            started = time.perf_counter()
+            self.assertEqual(async_to_sync(outbox.aprocess_batch)(), (20, 0))
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(server.requests), 20)
+        self.assertGreater(server.max_running, 1)
+        self.assertLess(elapsed, 20 * 0.2 / 2)
+        self.assertFalse(OutboundMessage.objects.exclude(status='sent').exists())
+
+    def test_async_worker_respects_concurrency_limit(self):
+        for i in range(6):
+            outbox.enqueue('telegram', chat_id=str(i), message='text')
+
+        with self.stub(delay=0.05) as server, override_settings(OUTBOX_CONCURRENCY=2):
+            self.assertEqual(async_to_sync(outbox.aprocess_batch)(), (6, 0))
+
+        self.assertEqual(server.max_running, 2)
+
+    def test_robot_notification_posts_to_api(self):
+        notification = Robot.objects.create(name='Уведомление', type_action='notification')
+        self.add_function('Новая', 1, robot=notification, bot_token='bot-token', chat_id='42',
+                          message='Статус: {status}')
+        application = self.create_application()
+
+        with self.stub() as server:
+            async_to_sync(robots_triggers.process_status_functions)(application)
+
+        path, body = server.requests[0]
+        self.assertEqual(path, '/botbot-token/sendMessage')
+        self.assertEqual(json.loads(body), {'chat_id': '42', 'text': 'Статус: Новая', 'parse_mode': 'HTML'})
+
+    def test_messaging_endpoints_are_async(self):
+        from .views import TelegramBotAPI, VKMessagesAPI, bot_webhook
+
+        for view in (TelegramBotAPI.as_view(), VKMessagesAPI.as_view(), bot_webhook):
+            self.assertTrue(asyncio.iscoroutinefunction(view))
+
+    def test_send_message_queued_through_asgi(self):
+        async def post():
+            telegram = await self.async_client.post(
+                '/api/send-message/tg/', {'chat_id': '1', 'message': 'Привет'}, content_type='application/json')
+            vk = await self.async_client.post(
+                '/api/send-message/vk/', {'recipient_id': 5, 'message': 'Привет'}, content_type='application/json')
+            invalid = await self.async_client.post(
+                '/api/send-message/vk/', {'message': 'Привет'}, content_type='application/json')
+            return telegram, vk, invalid
+
+        telegram, vk, invalid = async_to_sync(post)()
+
+        self.assertEqual(telegram.status_code, 202)
+        self.assertEqual(vk.status_code, 202)
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn('recipient_id', invalid.json())
+        self.assertEqual(OutboundMessage.objects.get(id=vk.json()['id']).payload['recipient_id'], 5)
+
+        with self.stub() as server:
+            self.assertEqual(async_to_sync(outbox.aprocess_batch)(), (2, 0))
+        self.assertEqual(sorted(path.split('?')[0] for path, _ in server.requests),
+                         ['/bottoken/sendMessage', '/messages.send'])
+
+    def test_webhook_replies_through_asgi(self):
+        async def post():
+            return await self.async_client.post('/api/bot/tg/webhook/', {'text': 'ping'},
+                                                content_type='application/json')
+
+        response = async_to_sync(post)()
+
+        self.assertEqual(response.json(), {'response': 'Вы написали: ping'})
+        self.assertEqual(self.client.post('/api/bot/tg/webhook/', 'not json',
+                                          content_type='application/json').status_code, 400)
+
+
+class EventListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(create_profile('viewer').user)
+        self.status = Status.objects.create(name='Новая')
+        self.specialization = Specialization.objects.create(name='Backend')
+
+    def create_events(self, count):
+        for i in range(Event.objects.count(), Event.objects.count() + count):
+            event = create_event(f'Event {i}')
+            event.specializations.add(self.specialization)
+            direction = Direction.objects.create(event=event, name='Direction')
+            for j in range(3):
+                Application.objects.create(user=create_profile(f'user{i}-{j}'), event=event,
+                                           direction=direction, status=self.status)
+
+    def get(self, **params):
+        response = self.client.get('/api/events/', {'limit': 100, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_list_is_compact_by_default(self):
+        self.create_events(2)
+
+        with self.assertNumQueries(3):
+            event = self.get()[0]
+
+        self.assertNotIn('applications', event)
+        self.assertEqual(event['applications_count'], 3)
+        self.assertEqual(event['directions_count'], 1)
+        self.assertEqual(event['specializations'], [self.specialization.id])
+
+    def test_expand_is_prefetched_in_constant_queries(self):
+        self.create_events(2)
+        with self.assertNumQueries(6):
+            self.get(expand='applications,directions')
+
+        self.create_events(3)
+        with self.assertNumQueries(6):
+            events = self.get(expand='applications,directions')
+
+        self.assertEqual(len(events[0]['applications']), 3)
+        self.assertEqual(events[0]['applications'][0]['status']['name'], 'Новая')
+        self.assertEqual(events[0]['directions'][0]['name'], 'Direction')
+
+    def test_fields_selects_subset(self):
+        self.create_events(1)
+
+        event = self.get(fields='event_id,name', expand='directions')[0]
+
+        self.assertEqual(set(event), {'event_id', 'name', 'directions'})
+
+
+
+class AccessScopeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = create_event()
+        self.direction = Direction.objects.create(event=self.event, name='Direction')
+        self.project = Project.objects.create(direction=self.direction, name='Project')
+        self.curator = create_profile('curator')
+        self.team = Team.objects.create(curator=self.curator, name='Team', project=self.project)
+        self.other_team = Team.objects.create(curator=self.curator, name='Other team', project=self.project)
+        self.status = Status.objects.create(name='Новая')
+
+    def scope(self, profile):
+        types = {content_type_id: model for model, content_type_id in scope_content_types().items()}
+        return {
+            (types[content_type_id], object_id)
+            for content_type_id, object_id in AccessScope.objects.filter(profile=profile).values_list(
+                'content_type_id', 'object_id'
+            )
+        }
+
+    def list_ids(self, profile, url):
+        client = APIClient()
+        client.force_authenticate(profile.user)
+        response = client.get(url, {'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        return {row.get('id', row.get('project_id')) for row in response.data['results']}
+
+    def test_organizer_sees_event_hierarchy(self):
+        organizer = create_profile('organizer')
+        Role.objects.create(user=organizer, role_type='organizer',
+                            content_type=ContentType.objects.get_for_model(Event), object_id=self.event.id)
+
+        self.assertEqual(self.scope(organizer), {
+            (Event, self.event.id), (Direction, self.direction.id), (Project, self.project.id),
+            (Team, self.team.id), (Team, self.other_team.id),
+        })
+
+        # Новые объекты ниже по иерархии попадают в область организатора
+        project = Project.objects.create(direction=self.direction, name='New project')
+        self.assertIn((Project, project.id), self.scope(organizer))
+
+    def test_student_sees_only_own_team_and_project(self):
+        student = create_profile('student')
+        self.team.students.add(student)
+        self.assertEqual(self.scope(student), {(Team, self.team.id), (Project, self.project.id)})
+
+        self.team.students.remove(student)
+        self.assertEqual(self.scope(student), set())
+
+        student.teams.add(self.other_team)
+        self.assertEqual(self.scope(student), {(Team, self.other_team.id), (Project, self.project.id)})
+
+    def test_direction_leader_change_moves_scope(self):
+        first, second = create_profile('first'), create_profile('second')
+        self.direction.leader = first
+        self.direction.save()
+        self.assertIn((Direction, self.direction.id), self.scope(first))
+
+        self.direction.leader = second
+        self.direction.save()
+        self.assertEqual(self.scope(first), set())
+        self.assertIn((Project, self.project.id), self.scope(second))
+
+    def test_deleted_objects_leave_scope(self):
+        organizer = create_profile('organizer')
+        Role.objects.create(user=organizer, role_type='organizer',
+                            content_type=ContentType.objects.get_for_model(Event), object_id=self.event.id)
+
+        self.project.delete()
+        self.assertEqual(self.scope(organizer), {(Event, self.event.id), (Direction, self.direction.id)})
+
+        self.event.delete()
+        self.assertEqual(self.scope(organizer), set())
+        self.assertFalse(Role.objects.filter(user=organizer, role_type='organizer').exists())
+
+    def test_refresh_rebuilds_missing_rows(self):
+        AccessScope.objects.filter(profile=self.curator).delete()
+        refresh_scopes([self.curator.pk])
+        self.assertEqual(self.scope(self.curator), {
+            (Team, self.team.id), (Team, self.other_team.id), (Project, self.project.id),
+        })
+
+    def test_list_endpoints_are_scoped(self):
+        student, outsider = create_profile('student'), create_profile('outsider')
+        self.team.students.add(student)
+        own = Application.objects.create(user=outsider, event=self.event, status=self.status)
+        leader = create_profile('leader')
+        self.direction.leader = leader
+        self.direction.save()
+        directed = Application.objects.create(user=student, event=self.event, direction=self.direction,
+                                              status=self.status)
+
+        self.assertEqual(self.list_ids(student, '/api/teams/'), {self.team.id})
+        self.assertEqual(self.list_ids(student, '/api/project/'), {self.project.id})
+        self.assertEqual(self.list_ids(outsider, '/api/teams/'), set())
+        self.assertEqual(self.list_ids(outsider, '/api/application/'), {own.id})
+        self.assertEqual(self.list_ids(leader, '/api/application/'), {directed.id})
+
+        admin = User.objects.create_superuser(username='admin', password='password').profile
+        self.assertEqual(self.list_ids(admin, '/api/teams/'), {self.team.id, self.other_team.id})
+
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ApplicationExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = create_event()
+        self.status = Status.objects.create(name='Новая')
+        self.organizer = create_profile('organizer')
+        Role.objects.create(user=self.organizer, role_type='organizer',
+                            content_type=ContentType.objects.get_for_model(Event), object_id=self.event.id)
+        direction = Direction.objects.create(event=self.event, name='Direction')
+        self.team = Team.objects.create(curator=self.organizer, name='Команда', project=Project.objects.create(
+            direction=direction, name='Project'))
+        self.applications = [
+            Application.objects.create(user=create_profile(f'user{i}'), event=self.event,
+                                       status=self.status, team=self.team if i == 0 else None,
+                                       message='Текст, "с кавычками"' if i == 0 else None)
+            for i in range(5)
+        ]
+        Profile.objects.filter(pk=self.applications[0].user_id).update(surname='Иванов')
+        Application.objects.create(user=create_profile('other'), event=create_event('Other'), status=self.status)
+        self.client = APIClient()
+        self.client.force_authenticate(self.organizer.user)
+
+    def export(self, **params):
+        response = self.client.get(f'/api/events/{self.event.id}/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response
+
+    def test_csv_streams_event_applications(self):
+        response = self.export()
+
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="event-{self.event.id}-applications.csv"')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0][:3], ['ID заявки', 'ID пользователя', 'Статус'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [application.id for application in self.applications])
+        self.assertEqual(rows[1][8], 'Текст, "с кавычками"')
+        self.assertEqual(rows[1][6], 'Нет')
+
+    def test_csv_formulas_are_escaped(self):
+        Application.objects.filter(id=self.applications[1].id).update(message='=HYPERLINK("http://evil")')
+        Application.objects.filter(id=self.applications[2].id).update(message='-1+2')
+
+        response = self.export()
+
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[2][8], '\'=HYPERLINK("http://evil")')
+        self.assertEqual(rows[3][8], "'-1+2")
+        self.assertEqual(rows[1][8], 'Текст, "с кавычками"')
+
+    def test_rows_read_in_chunks(self):
+        response = self.export()
+
+        # 5 заявок порциями по 2: три запроса, выполняются только при чтении ответа
+        with self.assertNumQueries(3):
+            b''.join(response.streaming_content)
+
+    def test_joined_profile_and_team_columns(self):
+        response = self.export(include='team,profile')
+
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        header = rows[0]
+        self.assertLess(header.index('Фамилия'), header.index('Команда'))
+        self.assertEqual(rows[1][header.index('Фамилия')], 'Иванов')
+        self.assertEqual(rows[1][header.index('Команда')], 'Команда')
+        self.assertEqual(rows[1][header.index('Проект команды')], 'Project')
+        self.assertEqual(rows[2][header.index('Команда')], '')
+
+    def test_xlsx_export(self):
+        response = self.export(file_format='xlsx', include='team')
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        rows = sheet.findall('.//s:row', namespace)
+        self.assertEqual(len(rows), 6)
+        first = {cell.get('r'): cell for cell in rows[1]}
+        self.assertEqual(first['A2'].find('s:v', namespace).text, str(self.applications[0].id))
+        self.assertEqual(first['G2'].get('t'), 'b')
+        self.assertEqual(''.join(first['I2'].itertext()), 'Текст, "с кавычками"')
+
+    def test_streams_under_asgi(self):
+        # Обработчик вызывается без ThreadSensitiveContext, чтобы запросы шли в транзакции теста
+        token = str(RefreshToken.for_user(self.organizer.user).access_token)
+        scope = {'type': 'http', 'method': 'GET', 'path': f'/api/events/{self.event.id}/export/',
+                 'query_string': b'', 'server': ('testserver', 80),
+                 'headers': [(b'authorization', f'Bearer {token}'.encode())]}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(exports.StreamingASGIHandler().handle)(scope, receive, send)
+
+        self.assertEqual(messages[0]['status'], 200)
+        rows = b''.join(message.get('body', b'') for message in messages).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(rows), 6)
+
+    def test_scope_and_validation(self):
+        client = APIClient()
+        client.force_authenticate(create_profile('stranger').user)
+        response = client.get(f'/api/events/{self.event.id}/export/')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8-sig').count('\n'), 1)
+
+        self.assertEqual(self.client.get(f'/api/events/{self.event.id}/export/', {'file_format': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/events/{self.event.id}/export/', {'include': 'tasks'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/events/999999/export/').status_code, 404)
+
+
+class ParticipantImportTests(TestCase):
+    CSV = (
+        'username,email,surname,name,course,direction,specialization,status,message\n'
+        ',ivanov@example.com,Иванов,Иван,2,Backend,Python,,Хочу в команду\n'
+        ',petrova@example.com,Петрова,Анна,,,,Принята,\n'
+        ',not-an-email,Сидоров,Петр,,,,,\n'
+        ',smirnov@example.com,Смирнов,Олег,,Дизайн,,,\n'
+        ',ivanov@example.com,Иванов,Иван,,,,,\n'
+        'existing,,,,,,,,\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.event = create_event()
+        self.direction = Direction.objects.create(event=self.event, name='Backend')
+        self.specialization = Specialization.objects.create(name='Python')
+        self.event.specializations.add(self.specialization)
+        self.statuses = [Status.objects.create(name=name) for name in ('Новая', 'Принята')]
+        for number, status in enumerate(self.statuses, start=1):
+            Status_order.objects.create(event=self.event, status=status, number=number)
+        self.existing = create_profile('existing')
+
+    def run_import(self, content, file_format='csv', event=None, **kwargs):
+        return ParticipantImporter(event or self.event, **kwargs).run(
+            imports.read_rows(io.BytesIO(content.encode()), file_format)
+        )
+
+    def test_csv_import_creates_participants_in_bulk(self):
+        report = self.run_import(self.CSV)
+
+        self.assertEqual(report['rows'], 6)
+        self.assertEqual(report['created'], {'users': 2, 'applications': 3, 'emails': 2})
+        self.assertEqual([(error['line'], list(error['errors'])) for error in report['errors']],
+                         [(4, ['email']), (5, ['direction']), (6, ['username'])])
+
+        profile = Profile.objects.get(user__username='ivanov@example.com')
+        self.assertEqual((profile.surname, profile.course, profile.email), ('Иванов', 2, 'ivanov@example.com'))
+        self.assertFalse(profile.user.has_usable_password())
+        self.assertTrue(has_role(profile, 'projectant'))
+        contact = Contact.objects.get(profile=profile)
+        self.assertIsNotNone(contact.verified_token)
+        email = OutboundMessage.objects.get(channel='email', payload__recipient_list=['ivanov@example.com'])
+        self.assertIn(contact.verified_token, email.payload['message'])
+
+        application = Application.objects.get(user=profile)
+        self.assertEqual((application.direction, application.specialization, application.status),
+                         (self.direction, self.specialization, self.statuses[0]))
+        self.assertEqual(Application.objects.get(user__user__username='petrova@example.com').status,
+                         self.statuses[1])
+        self.assertTrue(Application.objects.filter(user=self.existing, event=self.event).exists())
+        for obj in (profile, application):
+            self.assertTrue(SearchDocument.objects.filter(
+                content_type=ContentType.objects.get_for_model(obj), object_id=obj.pk).exists())
+
+    def test_chunk_queries_do_not_grow_with_rows(self):
+        def rows(start, count):
+            return 'email,surname\n' + ''.join(f'user{i}@example.com,Фамилия\n' for i in range(start, start + count))
+
+        self.run_import(rows(1000, 1))  # ContentType и прочие справочники попадают в кеш
+
+        with CaptureQueriesContext(connection) as small:
+            self.run_import(rows(0, 5), chunk_size=100)
+        with CaptureQueriesContext(connection) as large:
+            self.run_import(rows(100, 50), chunk_size=100)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Profile.objects.filter(surname='Фамилия').count(), 56)
+
+    def test_repeated_application_reported(self):
+        self.run_import('email\nivanov@example.com\n')
+
+        report = self.run_import('email\nivanov@example.com\n')
+
+        self.assertEqual(report['created']['applications'], 0)
+        self.assertEqual(report['errors'][0]['errors'], {'username': 'Заявка на мероприятие уже подана'})
+
+    def test_admin_api_imports_jsonl(self):
+        admin = create_profile('admin')
+        Role.objects.create(user=admin, role_type='admin')
+        content = (
+            '{"username": "user1", "email": "user1@example.com", "password": "secret-password"}\n'
+            'not json\n'
+            '\n'
+            '{"username": "user2", "course": "первый"}\n'
+        )
+        client = APIClient()
+        client.force_authenticate(admin.user)
+
+        response = client.post('/api/import/participants/', {
+            'file': SimpleUploadedFile('participants.jsonl', content.encode()),
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], {'users': 1, 'applications': 0, 'emails': 1})
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 4])
+        self.assertTrue(User.objects.get(username='user1').check_password('secret-password'))
+
+        client.force_authenticate(self.existing.user)
+        self.assertEqual(client.post('/api/import/participants/', {}, format='multipart').status_code, 403)
+
+    def test_command_imports_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as file:
+            file.write(self.CSV)
+        self.addCleanup(os.remove, file.name)
+        stdout, stderr = StringIO(), StringIO()
+
+        call_command('import_participants', file.name, event=self.event.id, chunk_size=2, stdout=stdout, stderr=stderr)
+
+        self.assertIn('заявок: 3', stdout.getvalue())
+        self.assertEqual(stderr.getvalue().count('Строка'), 3)
+
+
+class GradingTests(AutomationTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.test = Test.objects.create(event=self.event, name='Python', entry=60)
+        self.questions = [
+            Question.objects.create(test=self.test, name=f'Вопрос {number}', count=count)
+            for number, count in enumerate([1, 2, 2], start=1)
+        ]
+        for question, answers in zip(self.questions, [['Список', 'list'], ['Кортеж'], ['Ёлка']]):
+            for answer in answers:
+                True_Answer.objects.create(question=question, true_answer=answer)
+
+    def attempt(self, *answers):
+        return {question.pk: answer for question, answer in zip(self.questions, answers)}
+
+    def test_answers_are_normalized(self):
+        self.assertEqual(grading.normalize_answer('  Ёлка,  ЗЕЛЕНАЯ! '), 'елка, зеленая')
+
+    def test_attempt_is_graded(self):
+        profile = create_profile('student')
+
+        result = grading.grade_attempts(self.test, {profile.pk: self.attempt('LIST', 'кортеж.', 'сосна')})[profile.pk]
+
+        self.assertEqual((result.score, result.max_score, result.percent, result.passed), (3, 5, 60.0, True))
+        self.assertEqual(sorted(Answer.objects.filter(user=profile).values_list('count', flat=True)), [0, 1, 2])
+
+    def test_new_attempt_replaces_answers(self):
+        profile = create_profile('student')
+        grading.grade_attempts(self.test, {profile.pk: self.attempt('list', 'нет', 'нет')})
+
+        result = grading.grade_attempts(self.test, {profile.pk: self.attempt('нет', 'кортеж', 'елка')})[profile.pk]
+
+        self.assertEqual((result.score, result.passed), (4, True))
+        self.assertEqual(Answer.objects.filter(user=profile).count(), 3)
+
+    def test_unknown_question_is_rejected(self):
+        other = Question.objects.create(test=Test.objects.create(event=self.event, name='Другой', entry=50),
+                                        name='Чужой вопрос', count=1)
+        profile = create_profile('student')
+
+        with self.assertRaises(ValueError):
+            grading.grade_attempts(self.test, {profile.pk: {other.pk: 'ответ'}})
+        self.assertFalse(Answer.objects.exists())
+
+    def test_queries_do_not_depend_on_attempts(self):
+        profiles = [create_profile(f'student{number}') for number in range(20)]
+
+        def grade(count):
+            attempts = {profile.pk: self.attempt('list', 'кортеж', 'нет') for profile in profiles[:count]}
+            with CaptureQueriesContext(connection) as queries:
+                grading.grade_attempts(self.test, attempts)
+            return len(queries)
+
+        self.assertEqual(grade(2), grade(20))
+
+    def test_regrade_on_true_answer_change(self):
+        profile = create_profile('student')
+        grading.grade_attempts(self.test, {profile.pk: self.attempt('массив', 'кортеж', 'нет')})
+
+        True_Answer.objects.create(question=self.questions[0], true_answer='Массив')
+
+        self.assertTrue(grading.has_passed(profile.pk, self.test.pk))
+        self.assertEqual(grading.regrade(), 0)
+
+    def test_regrade_command(self):
+        profile = create_profile('student')
+        grading.grade_attempts(self.test, {profile.pk: self.attempt('list', 'кортеж', 'елка')})
+        Answer.objects.filter(user=profile).update(count=0)
+
+        out = StringIO()
+        call_command('grade_tests', '--question', str(self.questions[0].pk), stdout=out)
+
+        self.assertIn('Изменено ответов: 1', out.getvalue())
+        self.assertEqual(grading.test_results([self.test.pk])[0].score, 1)
+
+    def test_attempt_endpoint(self):
+        profile = create_profile('student')
+        client = APIClient()
+        client.force_authenticate(profile.user)
+        url = f'/api/tests/{self.test.pk}/attempt/'
+        self.assertEqual(client.get(url).status_code, 404)
+
+        response = client.post(url, {'answers': [
+            {'question': self.questions[0].pk, 'answer': 'list'},
+            {'question': self.questions[1].pk, 'answer': 'tuple'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['score'], 1)
+        self.assertFalse(client.get(url).json()['passed'])
+        response = client.post(url, {'answers': [{'question': 0, 'answer': 'list'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_leaderboard_is_cached(self):
+        leader, runner_up = create_profile('leader'), create_profile('runner_up')
+        Profile.objects.filter(pk=leader.pk).update(surname='Иванов', name='Иван')
+        with self.captureOnCommitCallbacks(execute=True):
+            grading.grade_attempts(self.test, {
+                leader.pk: self.attempt('list', 'кортеж', 'елка'),
+                runner_up.pk: self.attempt('list', 'нет', 'нет'),
+            })
+        client = APIClient()
+        client.force_authenticate(leader.user)
+        url = f'/api/events/{self.event.pk}/leaderboard/'
+
+        response = client.get(url, HTTP_ACCEPT='application/json')
+        results = response.json()['results']
+        self.assertEqual([(row['user_id'], row['place'], row['passed']) for row in results],
+                         [(leader.pk, 1, 1), (runner_up.pk, 2, 0)])
+        self.assertIn('Иванов', results[0]['name'])
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url, HTTP_ACCEPT='application/json',
+                                        HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            grading.grade_attempts(self.test, {runner_up.pk: self.attempt('list', 'кортеж', 'елка')})
+        response = client.get(url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][1]['score'], 5)
+
+        response = client.get(url, {'limit': -1}, HTTP_ACCEPT='application/json')
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_passed_test_resumes_automation(self):
+        test_trigger = Trigger.objects.create(name='Тест пройден', type_condition='test_result')
+        self.add_function('Новая', 1, trigger=test_trigger, test=self.test.pk)
+        self.add_function('Новая', 2, robot=self.move_robot, target_status='Принята')
+        application = self.create_application()
+        self.assertEqual(application.status.name, 'Новая')
+
+        grading.submit_attempts(self.test, {application.user_id: self.attempt('нет', 'нет', 'нет')})
+        application.refresh_from_db()
+        self.assertEqual(application.status.name, 'Новая')
+
+        grading.submit_attempts(self.test, {application.user_id: self.attempt('list', 'кортеж', 'нет')})
+        application.refresh_from_db()
+        self.assertEqual(application.status.name, 'Принята')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = create_event()
+        self.project = Project.objects.create(
+            direction=Direction.objects.create(event=self.event, name='Direction'), name='Мобильное приложение'
+        )
+        self.author = create_profile('author')
+        self.author.surname, self.author.name = 'Иванов', 'Пётр'
+        self.author.save()
+        self.team = Team.objects.create(curator=self.author, name='Team', project=self.project)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.author.user)
+
+    def create_task(self, name, description=''):
+        now = timezone.now()
+        return Task.objects.create(creator=self.author, project=self.project, name=name, description=description,
+                                   responsible_user=self.author, start=now, end=now)
+
+    def search(self, q, **params):
+        response = self.client.get('/api/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['id']) for result in response.data['results']]
+
+    def test_prefix_and_yo_insensitive(self):
+        self.assertEqual(self.search('ИВАН петр', types='profile'), [('profile', self.author.pk)])
+        self.assertEqual(self.search('моб прил'), [('project', self.project.id)])
+
+    def test_title_matches_rank_higher(self):
+        in_description = self.create_task('Встреча', 'Подготовить отчет для куратора')
+        in_title = self.create_task('Отчет по спринту')
+
+        self.assertEqual(self.search('отчет', types='task'), [('task', in_title.id), ('task', in_description.id)])
+
+    def test_index_follows_changes(self):
+        task = self.create_task('Дизайн')
+        task.name = 'Верстка'
+        task.save()
+        self.assertEqual(self.search('дизайн'), [])
+        self.assertEqual(self.search('верстка'), [('task', task.id)])
+
+        task.delete()
+        self.assertEqual(self.search('верстка'), [])
+
+    def test_application_reindexed_with_author(self):
+        application = Application.objects.create(user=self.author, event=self.event,
+                                                 status=Status.objects.create(name='Новая'))
+        self.author.surname = 'Петров'
+        self.author.save()
+        self.assertEqual(self.search('петров', types='application'), [('application', application.id)])
+
+    def test_results_respect_access_scope(self):
+        task = self.create_task('Секретная задача')
+        outsider = create_profile('outsider')
+        self.client.force_authenticate(outsider.user)
+
+        self.assertEqual(self.search('секретная'), [])
+        self.client.force_authenticate(self.author.user)
+        self.assertEqual(self.search('секретная'), [('task', task.id)])
+
+    def test_hidden_matches_do_not_crowd_out_visible(self):
+        visible = self.create_task('Встреча', 'Подготовить отчет')
+        hidden = Project.objects.create(direction=self.project.direction, name='Чужой проект')
+        now = timezone.now()
+        Task.objects.bulk_create([
+            Task(creator=self.author, project=hidden, name=f'Отчет {number}', description='',
+                 responsible_user=self.author, start=now, end=now)
+            for number in range(150)
+        ])
+        rebuild_index()
+        student = create_profile('student')
+        self.team.students.add(student)
+        self.client.force_authenticate(student.user)
+
+        self.assertEqual(self.search('отчет', types='task', limit=1), [('task', visible.id)])
+
+    def test_profiles_list_search(self):
+        create_profile('other')
+        response = self.client.get('/api/profiles/', {'search': 'иван'})
+        self.assertEqual([profile['user_id'] for profile in response.data['results']], [self.author.pk])
+
+    def test_list_filter_is_not_truncated(self):
+        content_type = ContentType.objects.get_for_model(Task)
+        SearchDocument.objects.bulk_create([
+            SearchDocument(content_type=content_type, object_id=object_id, title='Отчет', text='отчет')
+            for object_id in range(1, 1502)
+        ])
+
+        ids = matching_ids('отчет', 'task')
+        self.assertEqual(SearchDocument.objects.filter(content_type=content_type, object_id__in=ids).count(), 1501)
+        self.assertIsNone(matching_ids('!!', 'task'))
+
+    def test_rebuild_command(self):
+        task = self.create_task('Отчет')
+        SearchDocument.objects.all().delete()
+        self.assertEqual(self.search('отчет'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('отчет'), [('task', task.id)])
+
+    def test_unknown_type(self):
+        response = self.client.get('/api/search/', {'q': 'отчет', 'types': 'event'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(create_profile('viewer').user)
+        Specialization.objects.create(name='Backend')
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_ACCEPT='application/json', **headers)
+
+    def test_if_none_match_returns_304_without_queries(self):
+        response = self.get('/api/specialization/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.get('/api/specialization/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_rendered_bytes_are_cached(self):
+        first = self.get('/api/specialization/')
+        with self.assertNumQueries(0):
+            second = self.get('/api/specialization/')
+        self.assertEqual(first.content, second.content)
+
+    def test_change_bumps_version(self):
+        etag = self.get('/api/specialization/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Specialization.objects.create(name='Frontend')
+
+        response = self.get('/api/specialization/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_query_params_are_part_of_etag(self):
+        self.assertNotEqual(self.get('/api/specialization/')['ETag'],
+                            self.get('/api/specialization/', QUERY_STRING='limit=1')['ETag'])
+
+    def test_event_counts_follow_applications(self):
+        event = create_event()
+        status = Status.objects.create(name='Новая')
+        self.assertEqual(self.get('/api/events/').json()['results'][0]['applications_count'], 0)
+
+        application = Application.objects.create(user=create_profile('applicant'), event=event, status=status)
+        response = self.get('/api/events/')
+        self.assertEqual(response.json()['results'][0]['applications_count'], 1)
+
+        # Изменение заявки не меняет счетчики — компактный список остается в кеше
+        application.comment = 'Отзыв'
+        application.save()
+        create_profile('another')
+        self.assertEqual(self.get('/api/events/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        other = Status.objects.create(name='Принята')
+        self.get('/api/events/', QUERY_STRING='expand=applications')
+        # Массовая смена статуса идет через update() без post_save
+        async_to_sync(robots_triggers.bulk_move_applications)([application.id], other)
+        events = self.get('/api/events/', QUERY_STRING='expand=applications').json()['results']
+        self.assertEqual(events[0]['applications'][0]['status']['name'], 'Принята')
+
+    def test_browsable_api_is_not_cached(self):
+        response = self.client.get('/api/specialization/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.user = create_profile('viewer').user
+
+    def scrape(self, **headers):
+        if not headers:
+            self.client.force_authenticate(self.staff)
+        return self.client.get('/api/metrics', **headers)
+
+    def test_requests_are_aggregated_per_route(self):
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            self.client.get('/api/specialization/', HTTP_ACCEPT='application/json')
+        self.client.get(f'/api/profiles/{self.user.pk}')
+
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('crm_http_requests_total{route="api/specialization/",method="GET",status="200"} 2', text)
+        self.assertIn('crm_db_queries_count{route="api/profiles/<int:pk>",method="GET"} 1', text)
+        self.assertIn('crm_http_request_duration_seconds_bucket{route="api/specialization/",method="GET",le="+Inf"} 2',
+                      text)
+        self.assertRegex(text, r'crm_render_duration_seconds_sum\{route="api/profiles/<int:pk>",method="GET"\} '
+                               r'[0-9.e-]+')
+
+    def test_access(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        self.client.force_authenticate(None)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_workers_are_merged_through_directory(self):
+        self.client.force_authenticate(self.user)
+        self.client.get('/api/specialization/', HTTP_ACCEPT='application/json')
+        other = metrics.MetricsRegistry()
+        other.observe('api/specialization/', 'GET', 200, {'db_queries': 3})
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, 'other-worker.json'), 'w') as file:
+                json.dump(other.snapshot(), file)
+            text = self.scrape().content.decode()
+
+        self.assertIn('crm_http_requests_total{route="api/specialization/",method="GET",status="200"} 2', text)
+
+    @override_settings(SLOW_REQUEST_MS=0, SLOW_REQUEST_TOP_SQL=1)
+    def test_slow_request_log_lists_top_sql(self):
+        self.client.force_authenticate(self.user)
+        with self.assertLogs('crm.metrics', 'WARNING') as logs:
+            self.client.get(f'/api/profiles/{self.user.pk}')
+        self.assertIn('api/profiles/<int:pk>', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class RequestProfilerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(PROFILER_DIR=directory.name, PROFILER_MAX_ENTRIES=2)
+        override.enable()
+        self.addCleanup(override.disable)
+        Specialization.objects.create(name='Backend')
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/specialization/', HTTP_X_PROFILE='1', HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        meta, stats_path, snapshot_path = profiling.load_profile(response['X-Profile-Id'])
+        self.assertEqual(meta['route'], 'api/specialization/')
+        self.assertGreater(meta['queries'], 0)
+        self.assertIn('crm_specialization', ' '.join(statement['sql'] for statement in meta['sql']))
+        self.assertTrue(stats_path.exists() and snapshot_path.exists())
+
+        stdout = StringIO()
+        call_command('request_profiles', meta['id'], '--limit', '5', stdout=stdout)
+        self.assertIn('Функции (cumulative)', stdout.getvalue())
+        self.assertIn('crm_specialization', stdout.getvalue())
+
+    def test_jwt_staff_and_query_flag(self):
+        token = RefreshToken.for_user(self.staff).access_token
+        response = self.client.get('/api/specialization/?_profile=1', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertIn('X-Profile-Id', response)
+
+    def test_non_staff_is_not_profiled(self):
+        self.client.force_authenticate(create_profile('viewer').user)
+        response = self.client.get('/api/specialization/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_ring_buffer_keeps_latest(self):
+        self.client.force_authenticate(self.staff)
+        ids = [self.client.get('/api/specialization/', HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(3)]
+
+        self.assertEqual([meta['id'] for meta in profiling.list_profiles()], ids[:0:-1])
+        stdout = StringIO()
+        call_command('request_profiles', stdout=stdout)
+        self.assertIn(ids[-1], stdout.getvalue())
+        self.assertNotIn(ids[0], stdout.getvalue())
+
+
+class ReplicaRouterTests(TestCase):
+    """Основная база — тестовая БД, реплика — отдельный файл SQLite с теми же миграциями"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Реплика подключается только на время этих тестов, поэтому databases задается здесь,
+        # а не атрибутом класса (его раньше читают системные проверки test runner)
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = dict(connections.settings['default'],
+                                               NAME=os.path.join(cls.replica_dir.name, 'replica.sqlite3'))
+        call_command('migrate', database='replica', verbosity=0)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_profile('viewer').user
+        # Реплика отстает: пользователь уже есть, а специальность «Primary» еще не доехала
+        User.objects.using('replica').bulk_create([User(pk=self.user.pk, username=self.user.username)])
+        Specialization.objects.create(name='Primary')
+        Specialization.objects.using('replica').create(name='Replica')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def names(self, client, query=''):
+        response = client.get('/api/specialization/', QUERY_STRING=query, HTTP_ACCEPT='application/json')
+        return [item['name'] for item in response.json()['results']]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.names(self.client_for(self.user)), ['Replica'])
+
+    def test_writer_reads_from_primary_after_write(self):
+        client = self.client_for(self.user)
+        response = client.post('/api/specialization/', {'name': 'Новая'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Specialization.objects.using('default').filter(name='Новая').exists())
+        self.assertFalse(Specialization.objects.using('replica').filter(name='Новая').exists())
+
+        self.assertEqual(self.names(client), ['Primary', 'Новая'])
+        # Другой клиент не писал и продолжает читать с реплики
+        # (другие параметры — чтобы не получить готовый ответ из кеша crm.caching)
+        other = User.objects.create_user(username='other')
+        User.objects.using('replica').bulk_create([User(pk=other.pk, username=other.username)])
+        self.assertEqual(self.names(self.client_for(other), 'limit=5'), ['Replica'])
+
+        # Окно REPLICA_STICKY_SECONDS истекло: браузер удалил cookie
+        cache.clear()
+        del client.cookies[routers.PIN_COOKIE]
+        self.assertEqual(self.names(client), ['Replica'])
+
+    def test_forged_pin_is_ignored(self):
+        client = self.client_for(self.user)
+        client.cookies[routers.PIN_COOKIE] = 'forged'
+
+        self.assertEqual(self.names(client), ['Replica'])
+
+    def test_write_inside_safe_request_goes_to_primary(self):
+        token = routers._state.set(routers.RoutingState('replica'))
+        try:
+            self.assertEqual(Specialization.objects.count(), 1)
+            self.assertEqual(Specialization.objects.get().name, 'Replica')
+            Specialization.objects.create(name='Из сигнала')
+            # После записи чтение из основной базы
+            self.assertEqual(sorted(Specialization.objects.values_list('name', flat=True)), ['Primary', 'Из сигнала'])
+        finally:
+            routers._state.reset(token)
+        self.assertFalse(Specialization.objects.using('replica').filter(name='Из сигнала').exists())
+
+    def test_outside_requests_everything_uses_primary(self):
+        self.assertEqual(Specialization.objects.db, 'default')
+        self.assertEqual(sorted(Specialization.objects.values_list('name', flat=True)), ['Primary'])
+
+
+class SeedScaleTests(TestCase):
+    sizes = ['--profiles', '20', '--events', '1', '--directions', '2', '--projects', '1', '--teams', '1',
+             '--students', '2', '--tasks', '3', '--subtasks', '1', '--applications', '10']
+
+    def test_seed_creates_consistent_dataset(self):
+        call_command('seed_scale', *self.sizes, stdout=StringIO())
+
+        self.assertEqual(Profile.objects.count(), 21)
+        self.assertEqual(Application.objects.count(), 10)
+        self.assertEqual(Task.objects.count(), 2 * (3 + 3))
+        self.assertEqual(Task.objects.filter(parent_task__isnull=False).count(), 6)
+        # Производные данные пересчитаны, хотя bulk_create обходит сигналы
+        curator = Team.objects.first().curator
+        self.assertTrue(AccessScope.objects.filter(profile=curator).exists())
+        self.assertEqual(SearchDocument.objects.filter(
+            content_type=ContentType.objects.get_for_model(Task)).count(), 12)
+        self.assertEqual(Change.objects.filter(object_type='task', action='upsert').count(), 12)
+        self.assertEqual(Change.objects.filter(object_type='stage').count(), Stage.objects.count())
+
+    def test_same_seed_twice_is_rejected(self):
+        call_command('seed_scale', *self.sizes, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('seed_scale', *self.sizes, stdout=StringIO())
+
+
+class BenchmarkTests(TestCase):
+    def test_report_covers_get_routes(self):
+        call_command('seed_scale', *SeedScaleTests.sizes, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command('benchmark_api', '--iterations', '2', '--warmup', '0', '--output', output,
+                         stdout=StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+
+            stdout = StringIO()
+            call_command('benchmark_api', '--iterations', '1', '--warmup', '0', '--route', 'events',
+                         '--output', os.path.join(directory, 'next.json'), '--compare', output, stdout=stdout)
+
+        events = report['routes']['events/']
+        self.assertEqual(events['status'], 200)
+        self.assertLessEqual(events['p50_ms'], events['p99_ms'])
+        self.assertEqual(report['routes']['tasks/<int:pk>/comments/']['status'], 200)
+        self.assertEqual(report['skipped']['events/create/'], 'нет GET')
+        self.assertEqual(report['dataset']['Application'], 10)
+        self.assertIn('Сравнение с', stdout.getvalue())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Разбор плана написан для EXPLAIN QUERY PLAN SQLite')
+class ExplainTestCase(TestCase):
+    """Проверяет, что запросы фильтров используют индексы, а не полный просмотр таблицы"""
+
+    def assertNoTableScan(self, queryset):
+        plan = queryset.explain()
+        scans = [line for line in plan.splitlines() if re.search(r'\bSCAN (TABLE )?\w+$', line.strip())]
+        self.assertFalse(scans, f'Полный просмотр таблицы:\n{plan}')
+
+    def filter(self, filterset_class, params, queryset=None):
+        filterset = filterset_class(params, queryset=queryset or filterset_class._meta.model.objects.all())
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        return filterset.qs
+
+
+class FilterIndexTests(ExplainTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(200)])
+        profiles = Profile.objects.bulk_create([Profile(user=user) for user in users])
+        cls.event = create_event()
+        statuses = [Status.objects.create(name=name) for name in ('Новая', 'Принята')]
+        cls.status = statuses[0]
+        Application.objects.bulk_create([
+            Application(user=profile, event=cls.event, status=statuses[i % 2]) for i, profile in enumerate(profiles)
+        ])
+        Role.objects.bulk_create([Role(user=profile, role_type='projectant') for profile in profiles])
+        Contact.objects.bulk_create([
+            Contact(profile=profile, type='Почта', data=f'{i}@example.com', verified_token=f'token{i}')
+            for i, profile in enumerate(profiles)
+        ])
+        cls.profile = profiles[0]
+
+    def test_application_filter_by_event_and_status(self):
+        self.assertNoTableScan(self.filter(ApplicationFilter, {'event': self.event.id, 'status': self.status.id}))
+
+    def test_role_lookups(self):
+        self.assertNoTableScan(Role.objects.filter(user_id=self.profile.pk))
+        self.assertNoTableScan(Role.objects.filter(user=self.profile, role_type='admin', content_type__isnull=True))
+        self.assertNoTableScan(Role.objects.filter(
+            content_type=ContentType.objects.get_for_model(Event), object_id=self.event.id, role_type='organizer'
+        ))
+
+    def test_token_lookups(self):
+        self.assertNoTableScan(Contact.objects.filter(verified_token='token1', type='Почта'))
+        self.assertNoTableScan(Profile.objects.filter(password_reset_token='token1'))
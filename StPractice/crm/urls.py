@@ -17,13 +17,20 @@ urlpatterns = [
     path('events/create/', EventAPICreate.as_view()),
     path('events/<int:pk>', EventAPIUpdate.as_view()),
     path('events/delete/<int:pk>', EventAPIDestroy.as_view()),
+    path('events/<int:pk>/export/', EventApplicationsExportAPIView.as_view()),
+    path('events/<int:pk>/leaderboard/', EventLeaderboardAPIView.as_view()),
     path('application/', ApplicationAPIList.as_view()),
     path('application/create/', ApplicationAPICreate.as_view()),
     path('application/<int:pk>', ApplicationAPIUpdate.as_view()),
+    path('application/bulk-status/', ApplicationBulkStatusAPIView.as_view()),
     path('application/delete/<int:pk>', ApplicationAPIDestroy.as_view()),
+    path('import/participants/', ParticipantImportAPIView.as_view()),
+    path('tests/<int:pk>/attempt/', TestAttemptAPIView.as_view()),
     path('profile/', ProfileAPI.as_view()),
     path('profile/update/', ProfileAPIUpdate.as_view()),
     path('profiles/', ProfilesAPIList.as_view()),
+    path('search/', SearchAPIView.as_view()),
+    path('metrics', MetricsAPIView.as_view()),
     path('profiles/<int:pk>', ProfilesAPIUpdate.as_view()),
     path('orgChat/create', OrgChatCreateAPIView.as_view()),
     path('orgChat/list', OrgChatListAPIView.as_view()),
@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.crypto import get_random_string
 from datetime import datetime, timedelta
 
+from crm.caching import cache_is_shared
+
 
 def generate_verification_token():
     return get_random_string(64)
@@ -19,25 +25,68 @@ def get_password_reset_expiration():
     return datetime.now() + timedelta(hours=1)  # Токен действует 1 час
 
 
+def get_query_list(request, name):
+    """Значения параметра запроса вида ?name=a,b,c в виде множества"""
+    if request is None:
+        return set()
+    value = request.query_params.get(name, '')
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def count_subquery(model, field, **filters):
+    """Количество связанных строк коррелированным подзапросом (без JOIN и GROUP BY по основной таблице)"""
+    rows = model.objects.filter(**{field: OuterRef('pk')}, **filters).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count')), 0)
+
+
+def role_cache_key(profile_id):
+    return f'crm:roles:{profile_id}'
+
+
+def get_roles(user):
+    """
+    Возвращает все роли пользователя в виде множества (role_type, content_type_id, object_id).
+    Роли загружаются одним запросом и запоминаются на объекте пользователя (т.е. на время запроса),
+    а при ROLE_CACHE_TIMEOUT и общем для воркеров кеше (CACHES в settings) — ещё и в нем
+    до изменения Role (см. crm.signals). В памяти процесса роли не кешируются: сигнал
+    сбросил бы их только в том воркере, где изменили Role.
+    Принимает как Profile, так и User: pk профиля совпадает с id пользователя.
+    """
+    roles = getattr(user, '_roles_cache', None)
+    if roles is not None:
+        return roles
+
+    if user.pk is None:
+        roles = frozenset()
+    else:
+        timeout = getattr(settings, 'ROLE_CACHE_TIMEOUT', None) if cache_is_shared() else None
+        roles = cache.get(role_cache_key(user.pk)) if timeout else None
+        if roles is None:
+            from crm.models import Role
+            roles = frozenset(
+                Role.objects.filter(user_id=user.pk).values_list('role_type', 'content_type_id', 'object_id')
+            )
+            if timeout:
+                cache.set(role_cache_key(user.pk), roles, timeout)
+
+    user._roles_cache = roles
+    return roles
+
+
+def clear_role_cache(profile_id):
+    cache.delete(role_cache_key(profile_id))
+
+
 def has_role(user, role_type, obj=None):
     """
     Проверяет наличие роли у пользователя.
     Для глобальных ролей (admin) не требует объекта.
     Для объектных ролей требует указания объекта.
     """
-    filters = {
-        'user': user,
-        'role_type': role_type,
-    }
-
     if obj is not None:
-        filters.update({
-            'content_type': ContentType.objects.get_for_model(obj),
-            'object_id': obj.id
-        })
+        # get_for_model кешируется самим ContentTypeManager
+        key = (role_type, ContentType.objects.get_for_model(obj).id, obj.id)
     else:
-        filters['content_type__isnull'] = True
-        filters['object_id__isnull'] = True
+        key = (role_type, None, None)
 
-    from crm.models import Role
-    return Role.objects.filter(**filters).exists()
+    return key in get_roles(user)
@@ -2,13 +2,14 @@ import json
 import time
 from datetime import datetime
 
-from django.core.mail import send_mail
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
+from django.views import View
 from django.urls import reverse
 from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -21,18 +22,26 @@ from .models import *
 from .permissions import *
 from django_filters import BaseInFilter
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from django.contrib.auth import logout, authenticate, login
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-import httpx
-import requests
-from django.conf import settings
+from django.db.models import Prefetch, Q
 
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .utils import generate_password_reset_token
+from asgiref.sync import async_to_sync
+
+from . import exports, grading, imports
+from .caching import CachedResponseMixin, rows_of
+from .clients import http_session
+from .metrics import MetricsTokenAuthentication, collect, render
+from .outbox import aenqueue, enqueue_email
+from .pagination import ApplicationPagination, ProfilePagination
+from .scopes import scope_queryset
+from .search import search, SEARCH_TYPES, FullTextSearchFilter
+from .robots_triggers import bulk_move_applications
+from .utils import generate_password_reset_token, get_query_list, count_subquery
 
 
 def get_jwt_tokens(user):
@@ -43,7 +52,43 @@ def get_jwt_tokens(user):
     }
 
 
-class TelegramBotAPI(APIView):
+class AsyncJSONView(View):
+    """
+    Асинхронное представление без DRF (APIView в DRF 3.14 только синхронный): под ASGI
+    запрос не занимает поток, а запись в БД идет через асинхронный ORM.
+    Тело запроса — JSON или данные формы, ответ — JSON. CSRF не проверяется, как и у
+    APIView без сессионной аутентификации
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    @staticmethod
+    def get_data(request):
+        if request.content_type == 'application/json':
+            return json.loads(request.body or b'{}')
+        return request.POST.dict()
+
+    @staticmethod
+    def respond(data, status_code=status.HTTP_200_OK):
+        return JsonResponse(data, status=status_code, safe=False, json_dumps_params={'ensure_ascii': False})
+
+    async def validated(self, request, serializer_class):
+        """(validated_data, None) или (None, ответ 400)"""
+        try:
+            data = self.get_data(request)
+        except ValueError:
+            return None, self.respond({"detail": "Некорректный JSON"}, status.HTTP_400_BAD_REQUEST)
+        serializer = serializer_class(data=data)
+        if not serializer.is_valid():
+            return None, self.respond(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        return serializer.validated_data, None
+
+
+class TelegramBotAPI(AsyncJSONView):
     """
     API для отправки сообщений через Telegram бота
     POST /api/send-message/
@@ -53,59 +98,40 @@ class TelegramBotAPI(APIView):
         "parse_mode": "HTML"
     }
     """
-    permission_classes = [AllowAny]
 
-    def post(self, request):
-        serializer = TelegramMessageSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    async def post(self, request):
+        data, error = await self.validated(request, TelegramMessageSerializer)
+        if error is not None:
+            return error
+
+        # Отправка выполняется воркером очереди (manage.py outbox_worker)
+        message = await aenqueue(
+            'telegram',
+            chat_id=data['chat_id'],
+            message=data['message'],
+            parse_mode=data['parse_mode'],
+        )
+        return self.respond({"status": "queued", "id": message.id}, status.HTTP_202_ACCEPTED)
 
-        data = serializer.validated_data
-        bot_token = settings.TELEGRAM_BOT_TOKEN
 
+class BotWebhookView(AsyncJSONView):
+    async def post(self, request):
         try:
-            response = httpx.post(
-                f"https://api.telegram.org/bot{bot_token}/sendMessage",
-                json={
-                    "chat_id": data['chat_id'],
-                    "text": data['message'],
-                    "parse_mode": data['parse_mode']
-                },
-                timeout=10
-            )
-            response.raise_for_status()
-
-            return Response({
-                "status": "success",
-                "message_id": response.json()['result']['message_id']
-            }, status=status.HTTP_200_OK)
+            data = self.get_data(request)  # Данные от пользователя (JSON, FormData и т.д.)
+        except ValueError:
+            return self.respond({"detail": "Некорректный JSON"}, status.HTTP_400_BAD_REQUEST)
+        user_message = data.get('text', '') if isinstance(data, dict) else ''
 
-        except httpx.HTTPStatusError as e:
-            return Response({
-                "status": "error",
-                "detail": f"HTTP error: {e.response.text}"
-            }, status=e.response.status_code)
+        # Обработка сообщения (логика бота)
+        response_text = f"Вы написали: {user_message}"
 
-        except Exception as e:
-            return Response({
-                "status": "error",
-                "detail": str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def bot_webhook(request):
-    data = request.data  # Данные от пользователя (JSON, FormData и т.д.)
-    user_message = data.get('text', '')
+        return self.respond({'response': response_text})
 
-    # Обработка сообщения (логика бота)
-    response_text = f"Вы написали: {user_message}"
 
-    return Response({'response': response_text})
+bot_webhook = BotWebhookView.as_view()
 
 
-class VKMessagesAPI(APIView):
+class VKMessagesAPI(AsyncJSONView):
     """
     API для отправки сообщений через ВКонтакте
     POST /api/vk/send-message/
@@ -116,59 +142,22 @@ class VKMessagesAPI(APIView):
         "attachment": "photo123_456"     # опционально
     }
     """
-    permission_classes = [AllowAny]
-
-    def post(self, request):
-        serializer = VKMessageSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        data = serializer.validated_data
-        vk_config = settings.VK_CONFIG
-
-        try:
-            response = self.send_vk_message(
-                recipient_id=data['recipient_id'],
-                message=data['message'],
-                keyboard=data.get('keyboard'),
-                attachment=data.get('attachment'),
-                access_token=vk_config['ACCESS_TOKEN'],
-                api_version=vk_config['API_VERSION']
-            )
-
-            if 'error' in response:
-                return Response(response['error'], status=status.HTTP_400_BAD_REQUEST)
-
-            return Response({'message_id': response['response']}, status=status.HTTP_200_OK)
-
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-    def send_vk_message(self, recipient_id, message, access_token, api_version, **kwargs):
-        params = {
-            'access_token': access_token,
-            'v': api_version,
-            'random_id': self.generate_random_id(),
-            'message': message,
-        }
-
-        # Определяем тип получателя
-        if recipient_id > 2000000000:
-            params['peer_id'] = recipient_id  # для бесед
-        else:
-            params['user_id'] = recipient_id  # для пользователей
-
-        if kwargs.get('keyboard'):
-            params['keyboard'] = json.dumps(kwargs['keyboard'])
-
-        if kwargs.get('attachment'):
-            params['attachment'] = kwargs['attachment']
-
-        response = requests.post(
-            'https://api.vk.com/method/messages.send',
-            params=params
+    async def post(self, request):
+        data, error = await self.validated(request, VKMessageSerializer)
+        if error is not None:
+            return error
+
+        # Отправка выполняется воркером очереди (manage.py outbox_worker)
+        message = await aenqueue(
+            'vk',
+            recipient_id=data['recipient_id'],
+            message=data['message'],
+            keyboard=data.get('keyboard'),
+            attachment=data.get('attachment'),
+            random_id=self.generate_random_id(),
         )
-        return response.json()
+        return self.respond({"status": "queued", "id": message.id}, status.HTTP_202_ACCEPTED)
 
     @staticmethod
     def generate_random_id():
@@ -224,12 +213,47 @@ class EventAPIViews(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated,)
 
 
-class EventAPIList(generics.ListAPIView):
+class EventAPIList(CachedResponseMixin, generics.ListAPIView):
+    """
+    Список мероприятий: по умолчанию скалярные поля и счетчики.
+    Вложенные данные — по запросу: ?expand=directions,applications,specializationsSet
+    """
     queryset = Event.objects.all()
-    serializer_class = EventSerializer
+    serializer_class = EventListSerializer
     permission_classes = (IsAuthenticated,)
     # filter_backends = [SearchFilter]
     # search_fields = ['name']
+    # Компактный список выводит поля мероприятия и счетчики направлений и заявок
+    cache_models = (Event, rows_of(Direction), rows_of(Application))
+    expand_cache_models = {
+        'specializationsSet': (Specialization,),
+        'directions': (Direction,),
+        # Во вложенных заявках выводятся профили и статусы
+        'applications': (Application, Profile, Status),
+    }
+
+    def get_cache_models(self):
+        expand = get_query_list(self.request, 'expand')
+        return (*self.cache_models,
+                *(model for field, models in self.expand_cache_models.items() if field in expand for model in models))
+
+    def get_queryset(self):
+        queryset = Event.objects.annotate(
+            applications_count=count_subquery(Application, 'event'),
+            directions_count=count_subquery(Direction, 'event'),
+        ).prefetch_related('specializations').order_by('id')
+
+        expand = get_query_list(self.request, 'expand')
+        if 'directions' in expand:
+            queryset = queryset.prefetch_related('directions')
+        if 'applications' in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                'applications',
+                queryset=Application.objects.select_related(
+                    'user', 'event', 'direction', 'specialization', 'status'
+                ).prefetch_related('event__specializations'),
+            ))
+        return queryset
 
 
 class EventAPICreate(generics.CreateAPIView):
@@ -250,16 +274,17 @@ class EventAPIDestroy(generics.RetrieveDestroyAPIView):
     permission_classes = (IsAuthenticated,)
 
 
-class DirectionAPIViews(viewsets.ModelViewSet):
+class DirectionAPIViews(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Direction.objects.all()
     serializer_class = DirectionSerializer
     permission_classes = (IsAuthenticated,)
+    cache_models = (Direction,)
 
 
 class ApplicationFilter(filters.FilterSet):
     name = filters.CharFilter(field_name='name', lookup_expr='icontains')
-    status = filters.CharFilter(field_name='status', lookup_expr='iexact')
-    event = filters.NumberFilter(field_name='event__id', lookup_expr='iexact')
+    status = filters.NumberFilter(field_name='status')
+    event = filters.NumberFilter(field_name='event')
     # deadline = filters.DateFilter(field_name='deadline')
     user = filters.NumberFilter(field_name='user__user_id')  # фильтр по автору
     created_after = filters.DateFilter(field_name='datetime', lookup_expr='gte')  # начальная дата
@@ -281,16 +306,110 @@ class ApplicationAPIViews(viewsets.ModelViewSet):
     serializer_class = ApplicationSerializer
     permission_classes = (IsAuthenticated,)
 
+    def get_queryset(self):
+        # Та же видимость, что у списка заявок: заявки своих мероприятий и направлений и собственные
+        return scope_queryset(super().get_queryset(), self.request.user, {'event': Event, 'direction': Direction},
+                              Q(user_id=self.request.user.pk))
+
 
 class ApplicationAPIList(generics.ListAPIView):
     queryset = Application.objects.all()
     serializer_class = ApplicationSerializer
     permission_classes = (IsAuthenticated,)
     filterset_class = ApplicationFilter
+    pagination_class = ApplicationPagination
+
+    def get_queryset(self):
+        # Организаторы и руководители направлений видят заявки своих мероприятий, остальные — только свои
+        return scope_queryset(super().get_queryset(), self.request.user, {'event': Event, 'direction': Direction},
+                              Q(user_id=self.request.user.pk))
     # filter_backends = [SearchFilter]
     # search_fields = ['name']
 
 
+class EventApplicationsExportAPIView(APIView):
+    """
+    Потоковая выгрузка заявок мероприятия
+    GET /api/events/<id>/export/?file_format=xlsx&include=profile,team
+    file_format — csv (по умолчанию) или xlsx; include — дополнительные столбцы профиля и команды.
+    Видимость та же, что у списка заявок, без собственных заявок пользователя
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in exports.FORMATS:
+            raise ValidationError({'file_format': f'Допустимые значения: {", ".join(exports.FORMATS)}'})
+        include = get_query_list(request, 'include')
+        unknown = set(include) - set(exports.EXTRA_COLUMNS)
+        if unknown:
+            raise ValidationError({'include': f'Неизвестные группы: {", ".join(sorted(unknown))}'})
+
+        event = get_object_or_404(Event, pk=pk)
+        queryset = scope_queryset(Application.objects.filter(event=event), request.user,
+                                  {'event': Event, 'direction': Direction})
+        columns = exports.application_columns(include)
+        rows = exports.iter_rows(queryset, [field for field, _ in columns])
+
+        response = StreamingHttpResponse(exports.stream_export(file_format, columns, rows),
+                                         content_type=exports.FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="event-{event.pk}-applications.{file_format}"'
+        return response
+
+
+class TestAttemptAPIView(APIView):
+    """
+    Попытка прохождения теста текущим участником
+    GET /api/tests/<id>/attempt/ — результат последней попытки
+    POST /api/tests/<id>/attempt/ — все ответы попытки одним запросом, прежние ответы заменяются
+    {
+        "answers": [{"question": 1, "answer": "Ответ"}, ...]
+    }
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk):
+        test = get_object_or_404(Test, pk=pk)
+        results = grading.test_results([test.pk], [request.user.pk])
+        if not results:
+            return Response({'detail': 'Попыток еще не было'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(results[0]._asdict())
+
+    def post(self, request, pk):
+        test = get_object_or_404(Test, pk=pk)
+        serializer = TestAttemptSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        answers = {item['question']: item['answer'] for item in serializer.validated_data['answers']}
+        try:
+            results = grading.submit_attempts(test, {request.user.pk: answers})
+        except ValueError as e:
+            raise ValidationError({'answers': str(e)})
+        return Response(results[request.user.pk]._asdict(), status=status.HTTP_201_CREATED)
+
+
+class EventLeaderboardAPIView(CachedResponseMixin, APIView):
+    """
+    Таблица лидеров мероприятия по тестам
+    GET /api/events/<id>/leaderboard/?limit=50
+    """
+    permission_classes = (IsAuthenticated,)
+    cache_models = (Event, Test, Question, True_Answer, Answer, Profile)
+
+    def get(self, request, pk):
+        try:
+            limit = max(min(int(request.query_params.get('limit', 50)), 500), 1)
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+
+        def build():
+            # Проверка мероприятия внутри build, чтобы попадание в кеш обходилось без запросов
+            event = get_object_or_404(Event, pk=pk)
+            return Response(grading.leaderboard(event.pk, limit))
+
+        return self.cached_response(request, build)
+
+
 class ApplicationAPICreate(generics.CreateAPIView):
     queryset = Application.objects.all()
     serializer_class = ApplicationCreateSerializer
@@ -306,6 +425,59 @@ class ApplicationAPIUpdate(generics.RetrieveUpdateAPIView):
     permission_classes = (IsAuthenticated,)
 
 
+class ApplicationBulkStatusAPIView(APIView):
+    """
+    Массовый перевод заявок в статус (организаторы мероприятий и руководители направлений)
+    POST /api/application/bulk-status/
+    {
+        "applications": [1, 2, 3],
+        "status": 5
+    }
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = ApplicationBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Переводить можно только заявки мероприятий и направлений, которыми пользователь руководит
+        applications = scope_queryset(Application.objects.all(), request.user, {'event': Event, 'direction': Direction})
+        results = async_to_sync(http_session(bulk_move_applications))(
+            serializer.validated_data['applications'],
+            serializer.validated_data['status'],
+            applications,
+        )
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class ParticipantImportAPIView(APIView):
+    """
+    Массовый импорт участников и заявок (только для администраторов)
+    POST /api/import/participants/ (multipart/form-data)
+    file — CSV или JSONL, event — id мероприятия для заявок (необязательно),
+    format — csv или jsonl (по умолчанию по расширению файла).
+    Ответ — число созданных записей и ошибки по номерам строк
+    """
+    permission_classes = (IsAdministrator,)
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'Файл не передан'})
+        file_format = request.data.get('format') or imports.detect_format(upload.name)
+        if file_format not in imports.FORMATS:
+            raise ValidationError({'format': f'Допустимые значения: {", ".join(imports.FORMATS)}'})
+        event = None
+        if request.data.get('event'):
+            event = get_object_or_404(Event, pk=request.data['event'])
+
+        try:
+            report = imports.ParticipantImporter(event).run(imports.read_rows(upload, file_format))
+        except UnicodeDecodeError:
+            raise ValidationError({'file': 'Файл должен быть в кодировке UTF-8'})
+        return Response(report, status=status.HTTP_200_OK)
+
+
 class ApplicationAPIDestroy(generics.RetrieveDestroyAPIView):
     queryset = Application.objects.all()
     serializer_class = ApplicationSerializer
@@ -317,16 +489,18 @@ class ApplicationAPIDestroy(generics.RetrieveDestroyAPIView):
 #     serializer_class = App_reviewSerializer
 #     permission_classes = (IsAuthenticated,)
 
-class status_AppAPIViews(viewsets.ModelViewSet):
+class status_AppAPIViews(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Status.objects.all()
     serializer_class = Status_AppSerializer
     permission_classes = (IsAuthenticated,)
+    cache_models = (Status,)
 
 
-class SpecializationAPIViews(viewsets.ModelViewSet):
+class SpecializationAPIViews(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Specialization.objects.all()
     serializer_class = SpecializationSerializer
     permission_classes = (IsAuthenticated,)
+    cache_models = (Specialization,)
 
 
 class RoleAPIViews(viewsets.ModelViewSet):
@@ -364,8 +538,44 @@ class ProfilesAPIList(generics.ListAPIView):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = (IsAuthenticated,)
-    filter_backends = [SearchFilter]
-    search_fields = ['name', 'surname', 'course']
+    filter_backends = [FullTextSearchFilter]
+    pagination_class = ProfilePagination
+    search_type = 'profile'
+
+
+class SearchAPIView(APIView):
+    """
+    Полнотекстовый поиск по профилям, задачам, проектам и заявкам
+    GET /api/search/?q=иван&types=profile,task&limit=20
+    """
+    permission_classes = (IsAuthenticated,)
+    max_limit = 100
+
+    def get(self, request):
+        types = get_query_list(request, 'types') or None
+        unknown = (types or set()) - set(SEARCH_TYPES)
+        if unknown:
+            return Response({"error": f"Неизвестные типы: {', '.join(sorted(unknown))}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit должен быть числом"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = search(request.query_params.get('q', ''), request.user, types, max(limit, 1))
+        return Response({"results": results})
+
+
+class MetricsAPIView(APIView):
+    """
+    Метрики запросов в текстовом формате Prometheus (crm.metrics)
+    GET /api/metrics
+    """
+    authentication_classes = [MetricsTokenAuthentication, *APIView.authentication_classes]
+    permission_classes = (CanReadMetrics,)
+
+    def get(self, request):
+        return HttpResponse(render(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 #
@@ -551,16 +761,18 @@ class OrgChatCreateAPIView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class OrgChatListAPIView(generics.ListAPIView):
+class OrgChatListAPIView(CachedResponseMixin, generics.ListAPIView):
     queryset = OrgChat.objects.all()
     serializer_class = OrgChatSerializer
     permission_classes = [IsAuthenticated]
+    cache_models = (OrgChat,)
 
 
-class OrgChatDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class OrgChatDetailAPIView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = OrgChat.objects.all()
     serializer_class = OrgChatSerializer
     permission_classes = [IsAuthenticated]
+    cache_models = (OrgChat,)
 
 
 @api_view(['GET'])
@@ -704,12 +916,11 @@ class PasswordResetRequestView(APIView):
             reset_url = '/password-reset/confirm/' + f'?token={profile.password_reset_token}'
             full_url = f"https://meetuppoint.ru{reset_url}"
 
-            send_mail(
+            enqueue_email(
                 'Восстановление пароля',
                 f'Для сброса пароля перейдите по ссылке: {full_url}',
-                'no-reply@meetuppoint.ru',
                 recipient_list=[email],
-                fail_silently=False,
+                from_email='no-reply@meetuppoint.ru',
             )
 
             return Response({'status': 'reset email sent'})
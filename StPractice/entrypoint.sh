@@ -7,4 +7,5 @@ until nc -z db 3306; do
 done
 
 python manage.py migrate --noinput
+python manage.py createcachetable
 exec "$@"
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Лента изменений проекта: задачи, этапы, комментарии, чек-листы и встречи,
+измененные после sync-токена (GET /api/project/<pk>/changes/?since=<токен>).
+Те же строки раздает подписчикам push-канал plan.events.
+
+Сигналы (crm.signals) при сохранении и удалении объекта заменяют его строку в
+таблице Change: у объекта одна строка с последним действием (upsert или delete)
+в каждом проекте, и новая строка получает больший id. Если задачу перенесли в
+другой проект, прежний проект получает строку delete задачи, ее комментариев
+и чек-листов, а новый — их строки upsert. Поэтому лента — выборка по индексу
+(project, id) после id из токена, и каждый объект в ней встречается один раз,
+сколько бы раз его ни меняли. Пункты чек-листа и участники задач и встреч
+считаются изменением чек-листа, задачи или встречи. Объекты загружаются пачкой
+на каждый тип, число запросов не зависит от числа изменений.
+
+Токен для клиента непрозрачен: подписанные id проекта и последней отданной строки.
+Строки моложе CHANGES_SETTLE_SECONDS в токен не засчитываются и придут еще раз:
+транзакция, получившая меньший id, могла еще не завершиться. Повторная доставка
+безопасна — upsert всегда приходит с текущим состоянием объекта.
+
+Записи об удалении старше CHANGES_RETENTION_DAYS удаляет manage.py prune_changes,
+а токен старше этого срока отклоняется (410) — клиент загружает проект заново
+запросом без since, который отдает текущее состояние всех объектов.
+Массовые update() и bulk_create обходят сигналы и в ленту не попадают: после
+массовой вставки (например, crm.seeding) строки ленты дописывает backfill_changes.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Change, Checklist, ChecklistItem, Comment, Meeting, Stage, Task
+from .serializers import CheckListSerializer, CommentSerializer, MeetingSerializer, StageSerializer, \
+    TaskChangeSerializer
+
+TOKEN_SALT = 'plan.changes'
+
+ChangeType = namedtuple('ChangeType', ['model', 'queryset', 'serializer'])
+
+CHANGE_TYPES = {
+    'task': ChangeType(Task, lambda: Task.objects.prefetch_related('performers'), TaskChangeSerializer),
+    'stage': ChangeType(Stage, lambda: Stage.objects.prefetch_related(
+        Prefetch('task_set', queryset=Task.objects.only('id', 'status_id'))
+    ), StageSerializer),
+    'comment': ChangeType(Comment, lambda: Comment.objects.select_related('author'), CommentSerializer),
+    'checklist': ChangeType(Checklist, lambda: Checklist.objects.prefetch_related('items'), CheckListSerializer),
+    'meeting': ChangeType(Meeting, lambda: Meeting.objects.prefetch_related('participants'), MeetingSerializer),
+}
+TYPE_NAMES = {change_type.model: name for name, change_type in CHANGE_TYPES.items()}
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'CHANGES_RETENTION_DAYS', 30))
+
+
+def _project_of(obj, field):
+    """id проекта через связанный объект: без запроса, если он уже загружен"""
+    descriptor = getattr(type(obj), field)
+    if descriptor.is_cached(obj):
+        return getattr(obj, field).project_id
+    related_id = getattr(obj, f'{field}_id')
+    return descriptor.field.related_model.objects.filter(pk=related_id).values_list('project_id', flat=True).first()
+
+
+def changed_object(obj):
+    """(тип, id, id проекта) строки ленты для объекта; None, если проекта у объекта нет"""
+    if isinstance(obj, ChecklistItem):
+        project_id = Checklist.objects.filter(pk=obj.checklist_id).values_list('task__project_id', flat=True).first()
+        return ('checklist', obj.checklist_id, project_id) if project_id else None
+    if isinstance(obj, Comment):
+        project_id = _project_of(obj, 'task') if obj.task_id else obj.meeting_id and _project_of(obj, 'meeting')
+    elif isinstance(obj, Checklist):
+        project_id = _project_of(obj, 'task')
+    else:
+        project_id = obj.project_id
+    return (TYPE_NAMES[type(obj)], obj.pk, project_id) if project_id else None
+
+
+def record_change(obj, deleted=False):
+    """
+    Заменяет строки ленты объекта и возвращает список новых строк Change (пустой — ничего не записано).
+    Строка upsert объекта в другом проекте означает, что объект туда больше не входит:
+    она заменяется строкой delete. У перенесенной задачи так же записываются
+    комментарии и чек-листы — их проект определяется через задачу.
+    Удаление записывается до удаления из БД (pre_delete):
+    при каскадном удалении порядок удаления моделей не гарантирован, а проект
+    комментария или чек-листа находится через задачу.
+    Удаление пункта чек-листа — изменение чек-листа, если тот не удаляется сам
+    """
+    target = changed_object(obj)
+    if target is None:
+        return []
+    object_type, object_id, project_id = target
+    action = 'delete' if deleted else 'upsert'
+    if isinstance(obj, ChecklistItem):
+        action = 'upsert'
+        # id не переиспользуются: строка delete чек-листа остается последней
+        if deleted and Change.objects.filter(project_id=project_id, object_type=object_type, object_id=object_id,
+                                             action='delete').exists():
+            return []
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                rows = Change.objects.filter(object_type=object_type, object_id=object_id)
+                moved_from = list(
+                    rows.exclude(project_id=project_id).filter(action='upsert').values_list('project_id', flat=True)
+                )
+                rows.filter(project_id__in=[project_id, *moved_from]).delete()
+                changes = [
+                    Change.objects.create(project_id=previous, object_type=object_type, object_id=object_id,
+                                          action='delete')
+                    for previous in moved_from
+                ]
+                changes.append(Change.objects.create(project_id=project_id, object_type=object_type,
+                                                     object_id=object_id, action=action))
+            break
+        except IntegrityError:
+            # Тот же объект параллельно изменили в другой транзакции
+            if attempt:
+                raise
+    if moved_from and isinstance(obj, Task) and not deleted:
+        # Комментарии и чек-листы задачи (задача в них уже загружена — без запроса проекта)
+        for child in [*obj.comments.all(), *obj.checklist.all()]:
+            changes += record_change(child)
+    return changes
+
+
+def make_token(project_id, change_id):
+    return signing.dumps([project_id, change_id], salt=TOKEN_SALT)
+
+
+def read_token(token, project_id):
+    """id последней полученной клиентом строки ленты"""
+    try:
+        token_project, change_id = signing.loads(token, salt=TOKEN_SALT, max_age=retention())
+    except signing.SignatureExpired:
+        raise ExpiredToken(token)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidToken(token)
+    if token_project != project_id:
+        raise InvalidToken(token)
+    return change_id
+
+
+def serialize_objects(object_type, ids):
+    """{id: данные} существующих объектов типа одной выборкой"""
+    change_type = CHANGE_TYPES[object_type]
+    objects = change_type.queryset().in_bulk(ids)
+    return {item['id']: item for item in change_type.serializer(list(objects.values()), many=True).data}
+
+
+def serialize_changes(rows):
+    """Строки Change в элементы ленты {'type', 'id', 'action', 'data'} в том же порядке"""
+    upserts = defaultdict(list)
+    for row in rows:
+        if row.action == 'upsert':
+            upserts[row.object_type].append(row.object_id)
+    data = {object_type: serialize_objects(object_type, ids) for object_type, ids in upserts.items()}
+
+    results = []
+    for row in rows:
+        item = data.get(row.object_type, {}).get(row.object_id)
+        if item is None:
+            # Объект удален после выборки ленты — его строка delete придет следующей страницей
+            results.append({'type': row.object_type, 'id': row.object_id, 'action': 'delete'})
+        else:
+            results.append({'type': row.object_type, 'id': row.object_id, 'action': 'upsert', 'data': item})
+    return results
+
+
+def settled_position(rows, after):
+    """
+    id, до которого строки прочитаны без риска пропуска: не дальше первой строки
+    моложе CHANGES_SETTLE_SECONDS, ведь меньший id может быть у незавершенной транзакции
+    """
+    settled = timezone.now() - timedelta(seconds=getattr(settings, 'CHANGES_SETTLE_SECONDS', 5))
+    fresh = next((row.id for row in rows if row.changed_at > settled), None)
+    if fresh is not None:
+        return max(after, fresh - 1)
+    return rows[-1].id if rows else after
+
+
+def changes_since(project_id, token=None, limit=None):
+    """Страница ленты проекта: {'changes': [...], 'sync_token': ..., 'has_more': ...}"""
+    limit = limit or getattr(settings, 'CHANGES_PAGE_SIZE', 500)
+    after = 0 if token is None else read_token(token, project_id)
+
+    changes = Change.objects.filter(project_id=project_id, id__gt=after).order_by('id')
+    if token is None:
+        changes = changes.filter(action='upsert')  # Первой загрузке удаления не нужны
+    rows = list(changes[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    last_id = rows[-1].id if has_more else settled_position(rows, after)
+    return {'changes': serialize_changes(rows), 'sync_token': make_token(project_id, last_id), 'has_more': has_more}
+
+
+def prune_changes():
+    """Удаляет устаревшие записи об удалении. Возвращает их количество"""
+    deleted, _ = Change.objects.filter(action='delete', changed_at__lt=timezone.now() - retention()).delete()
+    return deleted
+
+
+def backfill_changes(batch_size=1000):
+    """
+    Строки upsert для объектов, у которых нет строки в ленте (созданных в обход
+    сигналов). Возвращает количество записанных строк
+    """
+    sources = [
+        ('task', Task.objects.values_list('pk', 'project_id')),
+        ('stage', Stage.objects.values_list('pk', 'project_id')),
+        ('comment', Comment.objects.filter(task__isnull=False).values_list('pk', 'task__project_id')),
+        ('comment', Comment.objects.filter(task__isnull=True, meeting__isnull=False)
+         .values_list('pk', 'meeting__project_id')),
+        ('checklist', Checklist.objects.values_list('pk', 'task__project_id')),
+        ('meeting', Meeting.objects.values_list('pk', 'project_id')),
+    ]
+    created = 0
+    for object_type, rows in sources:
+        recorded = Change.objects.filter(object_type=object_type).values('object_id')
+        batch = []
+        for object_id, project_id in rows.exclude(pk__in=recorded).order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(Change(project_id=project_id, object_type=object_type, object_id=object_id,
+                                action='upsert'))
+            if len(batch) >= batch_size:
+                created += len(Change.objects.bulk_create(batch, ignore_conflicts=True))
+                batch = []
+        created += len(Change.objects.bulk_create(batch, ignore_conflicts=True))
+    return created
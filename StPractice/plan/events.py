@@ -0,0 +1,332 @@
+"""
+Push-канал изменений проекта: Server-Sent Events (GET /api/project/<id>/events/).
+
+События — строки ленты plan.changes (задачи, этапы, комментарии, чек-листы и
+встречи): id события SSE — id строки Change, данные — элемент ленты
+{"type", "id", "action", "data"}. Сигналы (crm.signals) после фиксации
+транзакции передают новые строки брокеру, а он раздает их подписчикам проекта:
+данные сериализуются один раз на все подключения и только если подписчики есть.
+
+У каждого подключения своя ограниченная очередь (EVENTS_QUEUE_SIZE). Клиент,
+который не успевает забирать события, отключается: EventSource переподключается
+с заголовком Last-Event-ID, и пропущенное досылается из ленты по индексу
+(project, id) — каждый объект один раз, в текущем состоянии. Если пропущено
+больше CHANGES_PAGE_SIZE строк, приходит событие resync с id последней строки
+проекта и соединение закрывается: клиент загружает проект заново через ленту
+изменений, а переподключение продолжается уже после этого id. Пока событий нет, раз в
+EVENTS_HEARTBEAT_SECONDS уходит комментарий-пульс, чтобы прокси не закрывали
+соединение.
+
+Брокер задается настройкой EVENTS_BROKER:
+- plan.events.LocalBroker — рассылка внутри процесса, хватает одного воркера;
+- plan.events.DatabaseBroker — для нескольких воркеров: процесс раз в
+  EVENTS_POLL_SECONDS одним запросом читает новые строки Change проектов своих
+  подписчиков, поэтому доходят и изменения, сделанные другими воркерами.
+
+Django 4.1 перебирает потоковый ответ синхронно прямо в event loop, поэтому
+поток отдает не view, а ASGI-приложение EventStreamApp, которое StPractice.asgi
+ставит перед Django; под WSGI канал недоступен, остается лента изменений.
+Авторизация — access-токен JWT в заголовке Authorization или в параметре
+?token= (EventSource не умеет задавать заголовки).
+
+Клиент, загрузивший проект через ленту изменений, открывает поток с параметром
+?since=<sync_token> последнего ответа ленты: токен хранит id последней
+полученной строки Change, то есть ту же позицию, что и Last-Event-ID, и поток
+досылает все, что изменилось после него. Устаревший токен — ответ 410, как в ленте.
+Заголовок Last-Event-ID (переподключение EventSource) важнее параметра since.
+"""
+import asyncio
+import logging
+import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken as InvalidJWT, TokenError
+
+from crm.scopes import scope_queryset
+from .changes import ExpiredToken, InvalidToken, read_token, serialize_changes, settled_position
+from .models import Change, Project
+
+EVENTS_PATH = re.compile(r'^/api/project/(?P<pk>\d+)/events/$')
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Подписка одного подключения: очередь событий в event loop подключения"""
+
+    def __init__(self, project_id, loop, size):
+        self.project_id = project_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def put(self, event):
+        """Вызывается в потоке event loop; переполнение заменяет очередь сигналом отключения None"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    def deliver(self, event):
+        """Передает событие из любого потока"""
+        try:
+            self.loop.call_soon_threadsafe(self.put, event)
+        except RuntimeError:
+            pass  # Event loop подключения уже закрыт
+
+
+class LocalBroker:
+    """Рассылка событий подписчикам внутри процесса"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, project_id, loop=None):
+        subscription = Subscription(project_id, loop or asyncio.get_running_loop(),
+                                    getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+        with self.lock:
+            self.subscribers[project_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.project_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscribers.pop(subscription.project_id, None)
+
+    def projects(self):
+        with self.lock:
+            return list(self.subscribers)
+
+    def publish(self, rows):
+        """Раздает строки Change подписчикам их проектов: события (id строки, элемент ленты)"""
+        with self.lock:
+            targets = {row.project_id: list(self.subscribers.get(row.project_id, ())) for row in rows}
+        rows = [row for row in rows if targets[row.project_id]]
+        if not rows:
+            return
+        for row, item in zip(rows, serialize_changes(rows)):
+            for subscription in targets[row.project_id]:
+                subscription.deliver((row.id, item))
+
+    def committed(self, rows):
+        """Строки Change, записанные зафиксированной транзакцией этого процесса"""
+        self.publish(rows)
+
+
+class DatabaseBroker(LocalBroker):
+    """
+    Брокер для нескольких воркеров: новые строки Change читаются из БД опросом,
+    один опрос на процесс. Строки моложе CHANGES_SETTLE_SECONDS перечитываются,
+    пока не «устоятся», уже разосланные отсеиваются по id
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.position = None
+        self.delivered = set()
+        self.pollers = {}
+
+    def committed(self, rows):
+        pass  # Строки прочитает опрос — так же, как строки других воркеров
+
+    def subscribe(self, project_id, loop=None):
+        subscription = super().subscribe(project_id, loop)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            return subscription  # Вне event loop опрос запускают вызовом poll_once
+        self.pollers = {poller_loop: poller for poller_loop, poller in self.pollers.items() if not poller.done()}
+        if running not in self.pollers:
+            self.pollers[running] = asyncio.ensure_future(self.poll())
+        return subscription
+
+    async def poll(self):
+        while self.projects():
+            try:
+                await sync_to_async(self.poll_once)()
+            except Exception:
+                logger.exception('Не удалось прочитать новые изменения проектов')
+            await asyncio.sleep(getattr(settings, 'EVENTS_POLL_SECONDS', 1))
+
+    def poll_once(self):
+        if self.position is None:
+            self.position = Change.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        projects = self.projects()
+        if not projects:
+            return
+        rows = list(
+            Change.objects.filter(project_id__in=projects, id__gt=self.position).order_by('id')
+            [:getattr(settings, 'CHANGES_PAGE_SIZE', 500)]
+        )
+        self.publish([row for row in rows if row.id not in self.delivered])
+        self.delivered.update(row.id for row in rows)
+        self.position = settled_position(rows, self.position)
+        self.delivered = {change_id for change_id in self.delivered if change_id > self.position}
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'EVENTS_BROKER', 'plan.events.LocalBroker'))()
+
+
+def publish_change(changes):
+    """Передает брокеру строки Change (plan.changes.record_change) после фиксации транзакции"""
+    if changes:
+        transaction.on_commit(lambda: get_broker().committed(changes))
+
+
+def replay(project_id, last_event_id):
+    """Строки после Last-Event-ID: [(id, элемент ленты)] или None, если их больше страницы ленты"""
+    limit = getattr(settings, 'CHANGES_PAGE_SIZE', 500)
+    rows = list(Change.objects.filter(project_id=project_id, id__gt=last_event_id).order_by('id')[:limit + 1])
+    if len(rows) > limit:
+        return None
+    return [(row.id, item) for row, item in zip(rows, serialize_changes(rows))]
+
+
+def last_position(project_id):
+    """id последней строки ленты проекта — позиция, с которой продолжает поток после resync"""
+    return Change.objects.filter(project_id=project_id).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def format_event(data, event_id=None, event=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {JSONRenderer().render(data).decode()}')
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def authenticate(headers, query):
+    """Пользователь по access-токену JWT или None"""
+    raw_token = query.get('token', [None])[0]
+    if raw_token is None:
+        header = headers.get(b'authorization', b'').split()
+        if len(header) == 2 and header[0].lower() == b'bearer':
+            raw_token = header[1].decode()
+    if not raw_token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidJWT, TokenError, AuthenticationFailed):
+        return None
+
+
+def can_view(user, project_id):
+    return scope_queryset(Project.objects.filter(pk=project_id), user, {'id': Project}).exists()
+
+
+class EventStreamApp:
+    """ASGI-обертка: отдает поток событий проекта, остальные запросы передает приложению Django"""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        match = EVENTS_PATH.match(scope.get('path', '')) if scope['type'] == 'http' else None
+        if match is None:
+            return await self.application(scope, receive, send)
+        await self.stream(scope, receive, send, int(match['pk']))
+
+    @staticmethod
+    async def reply(send, status, data):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': JSONRenderer().render(data)})
+
+    async def stream(self, scope, receive, send, project_id):
+        if scope['method'] != 'GET':
+            return await self.reply(send, 405, {'detail': 'Метод не поддерживается'})
+        headers = dict(scope['headers'])
+        query = parse_qs(scope.get('query_string', b'').decode())
+        user = await sync_to_async(authenticate)(headers, query)
+        if user is None:
+            return await self.reply(send, 401, {'detail': 'Нужен access-токен JWT'})
+        if not await sync_to_async(can_view)(user, project_id):
+            return await self.reply(send, 404, {'error': 'Project not found.'})
+
+        last_event_id = headers.get(b'last-event-id', b'').decode() or query.get('last_event_id', [''])[0]
+        since = query.get('since', [None])[0]
+        if not last_event_id and since:
+            try:
+                last_event_id = str(await sync_to_async(read_token)(since, project_id))
+            except ExpiredToken:
+                return await self.reply(send, 410, {'error': 'Sync token expired.'})
+            except InvalidToken:
+                return await self.reply(send, 400, {'since': 'Некорректный токен синхронизации'})
+        broker = get_broker()
+        # Подписка до досылки: события, записанные во время нее, не потеряются
+        subscription = broker.subscribe(project_id)
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            retry = getattr(settings, 'EVENTS_RETRY_MS', 3000)
+            await send({'type': 'http.response.body', 'body': f'retry: {retry}\n\n'.encode(), 'more_body': True})
+
+            replayed = set()
+            if last_event_id.isdigit():
+                events = await sync_to_async(replay)(project_id, int(last_event_id))
+                if events is None:
+                    # id события сдвигает Last-Event-ID, иначе переподключение снова получит resync
+                    position = await sync_to_async(last_position)(project_id)
+                    await send({'type': 'http.response.body',
+                                'body': format_event({}, event_id=position, event='resync')})
+                    return
+                for event_id, item in events:
+                    replayed.add(event_id)
+                    await send({'type': 'http.response.body', 'body': format_event(item, event_id),
+                                'more_body': True})
+
+            heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+            while True:
+                get = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait({get, disconnect}, timeout=heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    get.cancel()
+                    if disconnect in done:
+                        return
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                    continue
+                event = get.result()
+                if event is None:
+                    # Очередь переполнена — клиент переподключится с Last-Event-ID
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+                event_id, item = event
+                if event_id not in replayed:
+                    await send({'type': 'http.response.body', 'body': format_event(item, event_id),
+                                'more_body': True})
+        finally:
+            broker.unsubscribe(subscription)
+            disconnect.cancel()
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
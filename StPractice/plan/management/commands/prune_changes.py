@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from plan.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из ленты изменений проектов записи об удалении старше CHANGES_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Удалено записей: {prune_changes()}')
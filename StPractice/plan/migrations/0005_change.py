@@ -0,0 +1,65 @@
+# Generated by Django 4.1 on 2026-10-18 15:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_changes(apps, schema_editor):
+    """Существующие объекты попадают в первую загрузку ленты без since"""
+    Change = apps.get_model('plan', 'Change')
+    Task = apps.get_model('plan', 'Task')
+    Comment = apps.get_model('plan', 'Comment')
+    Checklist = apps.get_model('plan', 'Checklist')
+    Meeting = apps.get_model('plan', 'Meeting')
+
+    sources = [
+        ('task', Task.objects.values_list('pk', 'project_id')),
+        ('comment', Comment.objects.filter(task__isnull=False).values_list('pk', 'task__project_id')),
+        ('comment', Comment.objects.filter(task__isnull=True, meeting__isnull=False)
+         .values_list('pk', 'meeting__project_id')),
+        ('checklist', Checklist.objects.values_list('pk', 'task__project_id')),
+        ('meeting', Meeting.objects.values_list('pk', 'project_id')),
+    ]
+    for object_type, rows in sources:
+        batch = []
+        for object_id, project_id in rows.order_by('pk').iterator(chunk_size=1000):
+            batch.append(Change(project_id=project_id, object_type=object_type, object_id=object_id,
+                                action='upsert'))
+            if len(batch) >= 1000:
+                Change.objects.bulk_create(batch)
+                batch = []
+        Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0004_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(max_length=20, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('action', models.CharField(choices=[('upsert', 'Создан или изменен'), ('delete', 'Удален')], max_length=10, verbose_name='Действие')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+                ('project', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='plan.project')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['project', 'id'], name='change_project_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['action', 'changed_at'], name='change_action_changed_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('object_type', 'object_id'), name='unique_change_object'),
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def backfill_stage_changes(apps, schema_editor):
+    """Этапы попали в ленту изменений позже остальных объектов проекта"""
+    Change = apps.get_model('plan', 'Change')
+    Stage = apps.get_model('plan', 'Stage')
+
+    batch = []
+    for object_id, project_id in Stage.objects.order_by('pk').values_list('pk', 'project_id').iterator(chunk_size=1000):
+        batch.append(Change(project_id=project_id, object_type='stage', object_id=object_id, action='upsert'))
+        if len(batch) >= 1000:
+            Change.objects.bulk_create(batch)
+            batch = []
+    Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0005_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_stage_changes, migrations.RunPython.noop),
+    ]
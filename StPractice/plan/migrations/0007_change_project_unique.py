@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plan', '0006_stage_changes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='change',
+            name='unique_change_object',
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('project', 'object_type', 'object_id'),
+                                               name='unique_change_project_object'),
+        ),
+    ]
@@ -60,6 +60,11 @@ class Meeting(models.Model):
     datetime = models.DateTimeField(verbose_name="Дата и время начала")
     participants = models.ManyToManyField(Profile, related_name="participants", verbose_name="Участники")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'datetime'], name='meeting_project_datetime_idx'),
+        ]
+
     def __str__(self):
         return f'{self.name}'
 
@@ -92,6 +97,13 @@ class Task(models.Model):
         verbose_name="Родительская задача",
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='task_created_at_id_idx'),
+            models.Index(fields=['project', 'status'], name='task_project_status_idx'),
+            models.Index(fields=['responsible_user', 'end'], name='task_responsible_end_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -121,4 +133,31 @@ class Comment(models.Model):
     is_go = models.BooleanField(verbose_name="Приду",default=False)
     author = models.ForeignKey(Profile, on_delete=models.CASCADE)
     content = models.TextField(verbose_name="Текст", max_length=10000)
-    datetime = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    datetime = models.DateTimeField(auto_now_add=True)
+
+class Change(models.Model):
+    """Последнее изменение объекта проекта для ленты изменений (см. plan.changes)"""
+    ACTION_CHOICES = (
+        ("upsert", "Создан или изменен"),
+        ("delete", "Удален"),
+    )
+
+    # Без внешнего ключа в БД: записи об удалении переживают удаление самого проекта
+    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    object_type = models.CharField(verbose_name="Тип объекта", max_length=20)
+    object_id = models.PositiveIntegerField(verbose_name="ID объекта")
+    action = models.CharField(verbose_name="Действие", max_length=10, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(verbose_name="Дата изменения", auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # В проекте, откуда объект перенесли, остается его строка delete
+            models.UniqueConstraint(fields=['project', 'object_type', 'object_id'], name='unique_change_project_object'),
+        ]
+        indexes = [
+            models.Index(fields=['project', 'id'], name='change_project_id_idx'),
+            models.Index(fields=['action', 'changed_at'], name='change_action_changed_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.object_type} #{self.object_id}: {self.action}'
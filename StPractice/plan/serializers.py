@@ -1,7 +1,7 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from crm.models import Profile
-from crm.serializers import ProfileSerializer, DirectionSerializer
+from crm.serializers import ProfileSerializer, DirectionSerializer, DynamicFieldsMixin
 from .models import *
 
 
@@ -44,6 +44,17 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'author_info', 'content', 'task', 'author']
 
 
+class TaskChangeSerializer(serializers.ModelSerializer):
+    """Задача в ленте изменений (plan.changes): комментарии и подзадачи приходят отдельными изменениями"""
+
+    class Meta:
+        model = Task
+        fields = [
+            'id', 'project', 'name', 'start', 'end', 'description', 'status', 'parent_task', 'creator',
+            'responsible_user', 'performers', 'is_completed', 'created_at'
+        ]
+
+
 class ProjectCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
@@ -64,10 +75,13 @@ class StageSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'color', 'position', 'taskIds', 'project']
 
     def get_taskIds(self, obj):
+        # Если id задач уже подгружены через prefetch (см. plan.utils), запрос не нужен
+        if 'task_set' in getattr(obj, '_prefetched_objects_cache', {}):
+            return [task.id for task in obj.task_set.all()]
         return list(obj.task_set.values_list('id', flat=True))
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     stages = StageSerializer(many=True, read_only=True)
     direction = serializers.PrimaryKeyRelatedField(queryset=Direction.objects.all(), write_only=True, required=True)
     directionSet = DirectionSerializer(source="direction", read_only=True)
@@ -78,7 +92,7 @@ class ProjectSerializer(serializers.ModelSerializer):
         fields = ['id', 'stages', 'direction', 'directionSet', 'project_id', 'name', 'description']
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     students_info = ProfileSerializer(many=True, read_only=True, source="students")
     #students = serializers.PrimaryKeyRelatedField(many=True, queryset=Profile.objects.all())
     project_info = ProjectSerializer( read_only=True)
@@ -89,9 +103,9 @@ class TeamSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'students_info', 'project', 'curator_info', 'is_agreed', 'curator', 'students', 'project_info', 'chat']
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author = ProfileSerializer(read_only=True, source="creator")
-    comment_set = CommentSerializer(many=True, read_only=True)
+    comment_set = CommentSerializer(many=True, read_only=True, source='comments')
     resp_user = ProfileSerializer(read_only=True, source='responsible_user')
     project_info = ProjectSerializer(read_only=True, source='project')
     subtasks = serializers.SerializerMethodField()
@@ -108,12 +122,17 @@ class TaskSerializer(serializers.ModelSerializer):
 
     def get_subtasks(self, obj):
         """Метод для получения подзадач"""
-        subtasks = obj.subtasks.all()  # Доступ к подзадачам через related_name
-        return TaskSerializer(subtasks, many=True).data  # Сериализуем подзадачи
-
+        # Дерево, заранее собранное plan.utils.prefetch_task_tree
+        subtasks = getattr(obj, 'subtask_list', None)
+        if subtasks is None:
+            subtasks = obj.subtasks.all()  # Доступ к подзадачам через related_name
+        return TaskSerializer(subtasks, many=True, context=self.context).data  # Сериализуем подзадачи
 
     def get_team(self, obj):
-        team = obj.project.team_set.filter(students=obj.creator).first()
+        if hasattr(obj, 'prefetched_team'):
+            team = obj.prefetched_team
+        else:
+            team = obj.project.team_set.filter(students=obj.creator).first()
         if team:
             return TeamSerializer(team).data
         return None
\ No newline at end of file
@@ -1,3 +1,553 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from crm.models import Event, Direction
+from crm.tests import ExplainTestCase
+from crm.utils import get_roles
+from . import events
+from .changes import changes_since
+from .models import Project, Stage, Team, Task, Comment, Meeting, Checklist, ChecklistItem, Change
+from .views import TaskFilter, MeetingFilter
+
+
+def create_profile(username):
+    return User.objects.create_user(username=username, password='password').profile
+
+
+class TaskAPITestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = create_profile('creator')
+        today = timezone.now().date()
+        event = Event.objects.create(name='Event', start=today, end=today, end_app=today)
+        direction = Direction.objects.create(event=event, name='Direction')
+        cls.project = Project.objects.create(direction=direction, name='Project')
+        cls.stages = [
+            Stage.objects.create(project=cls.project, name=name, position=position)
+            for position, name in enumerate(['Запланировано', 'В работе'], start=1)
+        ]
+        team = Team.objects.create(curator=create_profile('curator'), name='Team', project=cls.project)
+        team.students.add(cls.profile)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        # Роли пользователя загружаются один раз (crm.utils.get_roles) — грузим заранее,
+        # чтобы число запросов не зависело от порядка обращений к API
+        get_roles(self.profile.user)
+
+    def create_task(self, parent=None):
+        now = timezone.now()
+        task = Task.objects.create(
+            creator=self.profile, project=self.project, status=self.stages[0], name='Task',
+            description='', responsible_user=self.profile, start=now, end=now + timedelta(days=1),
+            parent_task=parent,
+        )
+        task.performers.add(self.profile)
+        Comment.objects.create(task=task, author=self.profile, content='Comment')
+        return task
+
+    def create_tree(self, roots):
+        for _ in range(roots):
+            root = self.create_task()
+            for _ in range(2):
+                self.create_task(parent=self.create_task(parent=root))
+
+
+class TaskTreeQueryBudgetTests(TaskAPITestCase):
+    # Запросы на всю страницу задач не должны зависеть от числа задач
+    QUERY_BUDGET = 15
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tasks/', {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data['results']
+
+    def test_task_list_within_query_budget(self):
+        self.create_tree(roots=10)
+
+        # На странице только корневая задача — подзадачи грузятся по уровням
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get('/api/tasks/', {'page_size': 1})
+
+        root = response.data['results'][0]
+        self.assertEqual(len(root['subtasks']), 2)
+        self.assertEqual(len(root['subtasks'][0]['subtasks']), 1)
+        self.assertEqual(root['team']['name'], 'Team')
+        self.assertEqual(len(root['comment_set']), 1)
+        self.assertEqual(len(root['stage']['taskIds']), 50)
+
+    def test_query_count_does_not_grow_with_tasks(self):
+        self.create_tree(roots=1)
+        small, _ = self.count_queries()
+
+        self.create_tree(roots=5)
+        large, results = self.count_queries()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(results), 30)
+
+
+class TaskKeysetPaginationTests(TaskAPITestCase):
+    def walk(self, **params):
+        ids, url, params = [], '/api/tasks/', {'page_size': 2, 'cursor': '', **params}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [task['id'] for task in response.data['results']]
+            url, params = response.data['next'], {}
+        return ids
+
+    def test_cursor_walks_all_tasks_once(self):
+        tasks = [self.create_task() for _ in range(5)]
+        # Одинаковое created_at не должно приводить к пропускам и повторам
+        Task.objects.update(created_at=timezone.now())
+
+        self.assertEqual(self.walk(), [task.id for task in tasks])
+
+    def test_cursor_seeks_past_offset_cutoff(self):
+        # Больше 1000 строк с одним created_at: смещение в курсоре DRF ограничено 1000
+        now = timezone.now()
+        Task.objects.bulk_create([
+            Task(creator=self.profile, project=self.project, status=self.stages[0], name=f'Task {number}',
+                 description='', responsible_user=self.profile, start=now, end=now + timedelta(days=1))
+            for number in range(1050)
+        ])
+        Task.objects.update(created_at=now)
+
+        ids = self.walk(page_size=100, count='false')
+
+        self.assertEqual(ids, list(Task.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_previous_link_returns_to_first_page(self):
+        tasks = [self.create_task() for _ in range(3)]
+        Task.objects.update(created_at=timezone.now())
+        second = self.client.get(self.client.get('/api/tasks/', {'page_size': 2, 'cursor': ''}).data['next'])
+
+        first = self.client.get(second.data['previous'])
+
+        self.assertEqual([task['id'] for task in second.data['results']], [tasks[2].id])
+        self.assertEqual([task['id'] for task in first.data['results']], [task.id for task in tasks[:2]])
+        self.assertIsNone(first.data['previous'])
+
+    def test_page_numbers_without_cursor(self):
+        # Фронтенд листает задачи через page/page_size и читает count
+        tasks = [self.create_task() for _ in range(5)]
+
+        response = self.client.get('/api/tasks/', {'page': 2, 'page_size': 2})
+
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([task['id'] for task in response.data['results']], [task.id for task in tasks[2:4]])
+        self.assertIn('page=3', response.data['next'])
+
+    def test_count_can_be_skipped(self):
+        self.create_task()
+        with CaptureQueriesContext(connection) as with_count:
+            response = self.client.get('/api/tasks/', {'cursor': ''})
+        self.assertEqual(response.data['count'], 1)
+
+        with CaptureQueriesContext(connection) as without_count:
+            response = self.client.get('/api/tasks/', {'cursor': '', 'count': 'false'})
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(len(without_count), len(with_count) - 1)
+
+
+class ProjectBoardTests(TaskAPITestCase):
+    def get_board(self, project_id=None):
+        return self.client.get(f'/api/project/{project_id or self.project.id}/board/')
+
+    def test_board_groups_cards_by_stage(self):
+        first, second = self.create_task(), self.create_task()
+        second.status = self.stages[1]
+        second.save()
+        orphan = self.create_task()
+        orphan.status = None
+        orphan.save()
+        checklist = Checklist.objects.create(task=first, name='Checklist')
+        ChecklistItem.objects.create(checklist=checklist, description='Done', is_completed=True)
+        ChecklistItem.objects.create(checklist=checklist, description='Todo')
+
+        with self.assertNumQueries(3):
+            response = self.get_board()
+
+        self.assertEqual(response.status_code, 200)
+        planned, in_progress = response.data['stages']
+        self.assertEqual(planned['name'], 'Запланировано')
+        self.assertEqual([card['id'] for card in planned['tasks']], [first.id])
+        self.assertEqual(planned['tasks'][0]['checklist_total'], 2)
+        self.assertEqual(planned['tasks'][0]['checklist_done'], 1)
+        self.assertEqual(planned['tasks'][0]['responsible_user_id'], self.profile.pk)
+        self.assertEqual([card['id'] for card in in_progress['tasks']], [second.id])
+        self.assertEqual([card['id'] for card in response.data['backlog']], [orphan.id])
+
+    def test_board_query_count_does_not_grow_with_tasks(self):
+        now = timezone.now()
+        Task.objects.bulk_create([
+            Task(creator=self.profile, project=self.project, status=self.stages[i % 2], name=f'Task {i}',
+                 description='', responsible_user=self.profile, start=now, end=now)
+            for i in range(2000)
+        ])
+
+        with self.assertNumQueries(3):
+            response = self.get_board()
+        self.assertEqual(sum(len(stage['tasks']) for stage in response.data['stages']), 2000)
+
+    def test_missing_project(self):
+        self.assertEqual(self.get_board(project_id=10 ** 6).status_code, 404)
+
+    def test_project_outside_scope(self):
+        self.client.force_authenticate(create_profile('outsider').user)
+        self.assertEqual(self.get_board().status_code, 404)
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class ProjectChangesTests(TaskAPITestCase):
+    def get_changes(self, since=None, project_id=None, **params):
+        if since is not None:
+            params['since'] = since
+        return self.client.get(f'/api/project/{project_id or self.project.id}/changes/', params)
+
+    def sync(self, since=None):
+        response = self.get_changes(since)
+        self.assertEqual(response.status_code, 200)
+        changes = {(change['type'], change['id']): change for change in response.data['changes']}
+        return changes, response.data['sync_token']
+
+    def test_initial_sync_returns_current_objects(self):
+        task = self.create_task()
+        checklist = Checklist.objects.create(task=task, name='Checklist')
+        ChecklistItem.objects.create(checklist=checklist, description='Item')
+        meeting = Meeting.objects.create(project=self.project, name='Meeting', datetime=timezone.now())
+        deleted = self.create_task()
+        deleted.delete()
+
+        changes, _ = self.sync()
+
+        comment = task.comments.get()
+        self.assertEqual(set(changes), {('task', task.id), ('comment', comment.id), ('checklist', checklist.id),
+                                        ('meeting', meeting.id), *(('stage', stage.id) for stage in self.stages)})
+        self.assertEqual(changes[('stage', self.stages[0].id)]['data']['taskIds'], [task.id])
+        self.assertEqual(changes[('task', task.id)]['data']['performers'], [self.profile.pk])
+        self.assertEqual(changes[('checklist', checklist.id)]['data']['checklistItems'][0]['description'], 'Item')
+
+    def test_only_changes_since_token(self):
+        task, other = self.create_task(), self.create_task()
+        _, token = self.sync()
+
+        for name in ['Renamed', 'Renamed twice']:
+            task.name = name
+            task.save()
+        comment_id = other.comments.get().id
+        other.comments.get().delete()
+
+        changes, token = self.sync(token)
+        self.assertEqual(list(changes), [('task', task.id), ('comment', comment_id)])
+        self.assertEqual(changes[('task', task.id)]['data']['name'], 'Renamed twice')
+        self.assertEqual(changes[('comment', comment_id)]['action'], 'delete')
+        self.assertEqual(self.sync(token)[0], {})
+
+    def test_related_changes_update_parent(self):
+        task = self.create_task()
+        checklist = Checklist.objects.create(task=task, name='Checklist')
+        item = ChecklistItem.objects.create(checklist=checklist, description='Item')
+        _, token = self.sync()
+
+        item.delete()
+        task.performers.clear()
+
+        changes, _ = self.sync(token)
+        self.assertEqual(changes[('checklist', checklist.id)]['data']['checklistItems'], [])
+        self.assertEqual(changes[('task', task.id)]['data']['performers'], [])
+
+    def test_moved_task_is_deleted_from_previous_project(self):
+        task = self.create_task()
+        comment = task.comments.get()
+        checklist = Checklist.objects.create(task=task, name='Checklist')
+        other = Project.objects.create(direction=self.project.direction, name='Other')
+        _, token = self.sync()
+
+        task.project = other
+        task.save()
+
+        changes, _ = self.sync(token)
+        moved = {('task', task.id), ('comment', comment.id), ('checklist', checklist.id)}
+        self.assertEqual({key: change['action'] for key, change in changes.items()},
+                         dict.fromkeys(moved, 'delete'))
+        self.assertEqual({(change['type'], change['id']) for change in changes_since(other.id)['changes']}, moved)
+
+        # Обратный перенос заменяет строку delete прежнего проекта
+        task.project = self.project
+        task.save()
+        changes, _ = self.sync(token)
+        self.assertEqual({change['action'] for change in changes.values()}, {'upsert'})
+
+    def test_query_count_does_not_grow_with_changes(self):
+        _, token = self.sync()
+        self.create_task()
+        self.get_changes(token)
+        with CaptureQueriesContext(connection) as small:
+            self.get_changes(token)
+
+        for _ in range(10):
+            task = self.create_task()
+            Checklist.objects.create(task=task, name='Checklist')
+            Meeting.objects.create(project=self.project, name='Meeting', datetime=timezone.now())
+        with CaptureQueriesContext(connection) as large:
+            response = self.get_changes(token)
+
+        self.assertEqual(len(response.data['changes']), 42)
+        self.assertEqual(len(small), len(large) - 4)  # + чек-листы с пунктами и встречи с участниками
+
+    def test_pages(self):
+        tasks = [self.create_task() for _ in range(3)]
+        Comment.objects.all().delete()
+        seen, token, has_more = [], None, True
+        while has_more:
+            response = self.get_changes(token, limit=2)
+            seen += [change['id'] for change in response.data['changes'] if change['type'] == 'task']
+            token, has_more = response.data['sync_token'], response.data['has_more']
+        self.assertEqual(seen, [task.id for task in tasks])
+
+    def test_limit_is_clamped(self):
+        self.create_task()
+        response = self.get_changes(limit=-5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['changes']), 1)
+        self.assertTrue(response.data['has_more'])
+
+    @override_settings(CHANGES_SETTLE_SECONDS=60)
+    def test_fresh_changes_are_repeated(self):
+        task = self.create_task()
+        changes, token = self.sync()
+        self.assertIn(('task', task.id), changes)
+        self.assertIn(('task', task.id), self.sync(token)[0])
+
+    def test_bad_tokens(self):
+        other = Project.objects.create(direction=self.project.direction, name='Other')
+        _, token = self.sync()
+        self.assertEqual(self.get_changes('garbage').status_code, 400)
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='password'))
+        self.assertEqual(self.get_changes(token, project_id=other.id).status_code, 400)
+        with override_settings(CHANGES_RETENTION_DAYS=-1):
+            self.assertEqual(self.get_changes(token).status_code, 410)
+
+    def test_project_outside_scope(self):
+        self.client.force_authenticate(create_profile('outsider').user)
+        self.assertEqual(self.get_changes().status_code, 404)
+
+    def test_prune_old_deletions(self):
+        self.create_task()
+        self.create_task().delete()
+        Change.objects.update(changed_at=timezone.now() - timedelta(days=31))
+
+        call_command('prune_changes', stdout=io.StringIO())
+
+        self.assertFalse(Change.objects.filter(action='delete').exists())
+        self.assertTrue(Change.objects.filter(action='upsert').exists())
+
+
+class ProjectEventsTests(TaskAPITestCase):
+    def setUp(self):
+        super().setUp()
+        events.get_broker.cache_clear()
+        self.addCleanup(events.get_broker.cache_clear)
+        self.app = events.EventStreamApp(self.django_app)
+        self.token = str(RefreshToken.for_user(self.profile.user).access_token)
+
+    @staticmethod
+    async def django_app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def open(self, path=None, token=None, headers=(), query=''):
+        """Запускает запрос к ASGI-приложению: (задача, полученные сообщения, событие отключения клиента)"""
+        messages, disconnected = [], asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path or f'/api/project/{self.project.id}/events/',
+            'query_string': f'token={token or self.token}{query}'.encode(), 'headers': list(headers),
+        }
+        return asyncio.ensure_future(self.app(scope, receive, send)), messages, disconnected
+
+    @staticmethod
+    def body(messages):
+        return b''.join(message.get('body', b'') for message in messages).decode()
+
+    async def wait_for(self, messages, text):
+        for _ in range(200):
+            if text in self.body(messages):
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'{text!r} не пришло: {self.body(messages)!r}')
+
+    def rename(self, task, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            task.name = name
+            task.save()
+
+    def test_changes_are_pushed(self):
+        task = self.create_task()
+
+        async def stream():
+            request, messages, disconnected = await self.open()
+            await self.wait_for(messages, 'retry:')
+            await sync_to_async(self.rename)(task, 'Pushed')
+            await self.wait_for(messages, 'Pushed')
+            disconnected.set()
+            await request
+            return messages
+
+        messages = async_to_sync(stream)()
+
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), messages[0]['headers'])
+        event_id = Change.objects.get(object_type='task', object_id=task.id).id
+        data = self.body(messages).split(f'id: {event_id}\ndata: ')[1].split('\n\n')[0]
+        self.assertEqual(json.loads(data)['data']['name'], 'Pushed')
+        self.assertFalse(events.get_broker().subscribers)
+
+    def test_resume_from_last_event_id(self):
+        first, second = self.create_task(), self.create_task()
+        last_event_id = Change.objects.get(object_type='task', object_id=first.id).id
+
+        async def stream(headers):
+            request, messages, disconnected = await self.open(headers=headers)
+            await self.wait_for(messages, 'retry:')
+            await asyncio.sleep(0.05)
+            disconnected.set()
+            await request
+            return self.body(messages)
+
+        body = async_to_sync(stream)([(b'last-event-id', str(last_event_id).encode())])
+        self.assertNotIn(f'"type":"task","id":{first.id}', body)
+        self.assertIn(f'"type":"task","id":{second.id}', body)
+
+        with override_settings(CHANGES_PAGE_SIZE=1):
+            body = async_to_sync(stream)([(b'last-event-id', b'0')])
+        position = Change.objects.filter(project=self.project).order_by('-id').first().id
+        self.assertIn(f'id: {position}\nevent: resync', body)
+
+    @override_settings(CHANGES_SETTLE_SECONDS=0)
+    def test_resume_from_sync_token(self):
+        first = self.create_task()
+        token = self.client.get(f'/api/project/{self.project.id}/changes/').data['sync_token']
+        second = self.create_task()
+
+        async def stream(token):
+            request, messages, disconnected = await self.open(query=f'&since={token}')
+            await asyncio.sleep(0.05)
+            disconnected.set()
+            await request
+            return messages
+
+        body = self.body(async_to_sync(stream)(token))
+        self.assertNotIn(f'"type":"task","id":{first.id}', body)
+        self.assertIn(f'"type":"task","id":{second.id}', body)
+        self.assertEqual(async_to_sync(stream)('garbage')[0]['status'], 400)
+
+    @override_settings(EVENTS_HEARTBEAT_SECONDS=0.02)
+    def test_heartbeat(self):
+        async def stream():
+            request, messages, disconnected = await self.open()
+            await self.wait_for(messages, ': ping')
+            disconnected.set()
+            await request
+
+        async_to_sync(stream)()
+
+    def test_access(self):
+        async def status(**kwargs):
+            request, messages, _ = await self.open(**kwargs)
+            await request
+            return messages[0]['status']
+
+        outsider = str(RefreshToken.for_user(create_profile('outsider').user).access_token)
+        self.assertEqual(async_to_sync(status)(token='garbage'), 401)
+        self.assertEqual(async_to_sync(status)(token=outsider), 404)
+        self.assertEqual(async_to_sync(status)(path='/api/tasks/'), 204)
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    def test_slow_client_is_disconnected(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        broker = events.LocalBroker()
+        subscription = broker.subscribe(self.project.id, loop)
+
+        broker.publish([Change.objects.get(object_type='stage', object_id=stage.id) for stage in self.stages] * 2)
+        loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertIsNone(subscription.queue.get_nowait())
+
+    def test_no_serialization_without_subscribers(self):
+        rows = list(Change.objects.all())
+        with self.assertNumQueries(0):
+            events.LocalBroker().publish(rows)
+
+    def test_database_broker_reads_other_workers_changes(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        broker = events.DatabaseBroker()
+        subscription = broker.subscribe(self.project.id, loop)
+        broker.poll_once()
+
+        task = self.create_task()  # on_commit в TestCase не выполняется — как запись другого воркера
+        broker.poll_once()
+        broker.poll_once()
+        loop.run_until_complete(asyncio.sleep(0))
+
+        received = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        self.assertEqual(sorted((item['type'], item['id']) for _, item in received),
+                         [('comment', task.comments.get().id), ('task', task.id)])
+
+
+class FilterIndexTests(ExplainTestCase, TaskAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        Task.objects.bulk_create([
+            Task(creator=cls.profile, project=cls.project, status=cls.stages[i % 2], name=f'Task {i}',
+                 description='', responsible_user=cls.profile, start=now, end=now + timedelta(days=i))
+            for i in range(200)
+        ])
+        Meeting.objects.bulk_create([
+            Meeting(project=cls.project, name=f'Meeting {i}', datetime=now + timedelta(days=i)) for i in range(50)
+        ])
+
+    def test_task_filters(self):
+        deadline = (timezone.now() + timedelta(days=7)).date()
+        self.assertNoTableScan(self.filter(TaskFilter, {'project': self.project.id, 'status': self.stages[0].id}))
+        self.assertNoTableScan(self.filter(TaskFilter, {'responsible_user': self.profile.pk,
+                                                        'created_before': deadline}))
+        self.assertNoTableScan(self.filter(TaskFilter, {'direction': self.project.direction_id}))
+
+    def test_meeting_filters(self):
+        self.assertNoTableScan(self.filter(MeetingFilter, {'participant': self.profile.pk}))
+        team = Team.objects.get()
+        self.assertNoTableScan(self.filter(MeetingFilter, {'team': team.id}))
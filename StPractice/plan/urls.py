@@ -22,6 +22,8 @@ urlpatterns = [
     path('project/create/', ProjectAPICreate.as_view()),
     path('project/', ProjectAPIList.as_view()),
     path('project/<int:pk>', ProjectAPIUpdate.as_view()),
+    path('project/<int:pk>/board/', ProjectBoardAPIView.as_view()),
+    path('project/<int:pk>/changes/', ProjectChangesAPIView.as_view()),
 
     path('stages/', StageAPIListCreate.as_view()),
     path('stages/<int:pk>/', StageAPIUpdate.as_view()),
@@ -0,0 +1,136 @@
+from django.db.models import Prefetch, prefetch_related_objects
+
+from crm.utils import count_subquery
+from .models import Task, Team, Comment, Stage, Project, ChecklistItem
+
+# Связи задачи, которые подтягиваются JOIN-ом в том же запросе
+TASK_SELECT_RELATED = (
+    'creator',
+    'responsible_user',
+    'project__direction',
+    'status',
+)
+
+
+def _stages_with_task_ids(prefix):
+    """Этапы вместе с id задач — для StageSerializer.get_taskIds"""
+    return Prefetch(
+        prefix,
+        queryset=Stage.objects.prefetch_related(
+            Prefetch('task_set', queryset=Task.objects.only('id', 'status_id'))
+        ),
+    )
+
+
+def task_prefetches():
+    """Prefetch-план для всех связей, которые выводит TaskSerializer"""
+    return [
+        'performers',
+        Prefetch('comments', queryset=Comment.objects.select_related('author')),
+        _stages_with_task_ids('project__stages'),
+        Prefetch('status__task_set', queryset=Task.objects.only('id', 'status_id')),
+    ]
+
+
+def task_queryset():
+    return Task.objects.select_related(*TASK_SELECT_RELATED)
+
+
+def prefetch_task_tree(tasks):
+    """
+    Загружает всё дерево подзадач для переданных задач: один запрос на уровень
+    вложенности плюс фиксированное число prefetch-запросов на всё дерево.
+    Подзадачи кладутся в атрибут subtask_list, команда автора — в prefetched_team.
+    """
+    tasks = list(tasks)
+    loaded = {task.id: task for task in tasks}
+    level = tasks
+
+    while level:
+        by_id = {task.id: task for task in level}
+        for task in level:
+            task.subtask_list = []
+
+        children = []
+        for child in task_queryset().filter(parent_task_id__in=by_id).order_by('id'):
+            # Задача уже загружена (есть на странице или в цикле parent_task) — берём тот же объект
+            if child.id in loaded:
+                child = loaded[child.id]
+            else:
+                loaded[child.id] = child
+                children.append(child)
+            by_id[child.parent_task_id].subtask_list.append(child)
+
+        level = children
+
+    nodes = list(loaded.values())
+    prefetch_related_objects(nodes, *task_prefetches())
+    _attach_teams(nodes)
+    return tasks
+
+
+def _attach_teams(tasks):
+    """Аналог project.team_set.filter(students=creator).first() для всех задач сразу"""
+    project_ids = {task.project_id for task in tasks}
+    creator_ids = {task.creator_id for task in tasks}
+
+    memberships = (
+        Team.students.through.objects
+        .filter(team__project_id__in=project_ids, profile_id__in=creator_ids)
+        .values_list('team__project_id', 'profile_id', 'team_id')
+        .order_by('team_id')
+    )
+    team_ids = {}
+    for project_id, profile_id, team_id in memberships:
+        team_ids.setdefault((project_id, profile_id), team_id)
+
+    teams = {}
+    if team_ids:
+        teams = Team.objects.select_related(
+            'curator', 'project__direction'
+        ).prefetch_related(
+            'students',
+            _stages_with_task_ids('project__stages'),
+        ).in_bulk(set(team_ids.values()))
+
+    for task in tasks:
+        team_id = team_ids.get((task.project_id, task.creator_id))
+        task.prefetched_team = teams.get(team_id)
+
+
+# Поля карточки задачи на доске
+BOARD_CARD_FIELDS = ('id', 'name', 'status_id', 'parent_task_id', 'responsible_user_id', 'end', 'is_completed')
+
+
+def build_board(project_id, projects=None):
+    """
+    Kanban-доска проекта: этапы по position с упорядоченными карточками задач.
+    Читается тремя запросами через values(), без экземпляров моделей и вложенных сериализаторов.
+    projects — доступные пользователю проекты. Возвращает None, если проекта нет или он недоступен.
+    """
+    projects = Project.objects.all() if projects is None else projects
+    project = projects.filter(pk=project_id).values('id', 'name').first()
+    if project is None:
+        return None
+
+    stages = list(
+        Stage.objects.filter(project_id=project_id).order_by('position', 'id').values('id', 'name', 'color', 'position')
+    )
+    cards = (
+        Task.objects.filter(project_id=project_id)
+        .annotate(
+            checklist_total=count_subquery(ChecklistItem, 'checklist__task'),
+            checklist_done=count_subquery(ChecklistItem, 'checklist__task', is_completed=True),
+        )
+        .order_by('created_at', 'id')
+        .values(*BOARD_CARD_FIELDS, 'checklist_total', 'checklist_done')
+    )
+
+    tasks_by_stage = {stage['id']: [] for stage in stages}
+    backlog = []  # Задачи без этапа
+    for card in cards:
+        tasks_by_stage.get(card.pop('status_id'), backlog).append(card)
+
+    for stage in stages:
+        stage['tasks'] = tasks_by_stage[stage['id']]
+    return {**project, 'stages': stages, 'backlog': backlog}
@@ -2,18 +2,22 @@ from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from rest_framework import generics, viewsets, pagination, status
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from crm.pagination import KeysetPagination
+from crm.scopes import scope_queryset
+from crm.search import FullTextSearchFilter, matching_ids
 from crm.serializers import ProfileSerializer, Profile
+from .changes import ExpiredToken, InvalidToken, changes_since
 from .models import *
 from .permissions import IsAuthorOrReadOnly
 from .serializers import *
+from .utils import task_queryset, prefetch_task_tree, build_board
 from django.db.models import Q
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 from django_filters import BaseInFilter
 
 
@@ -25,8 +29,8 @@ class ProfileSearchAPIView(generics.ListAPIView):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [SearchFilter]
-    search_fields = ['name', 'surname']
+    filter_backends = [FullTextSearchFilter]
+    search_type = 'profile'
 
 class ResultFilter(filters.FilterSet):
     team = filters.NumberFilter(field_name='team__id')
@@ -63,12 +67,13 @@ class TaskFilter(filters.FilterSet):
     status = filters.CharFilter(field_name='status', lookup_expr='exact') # Фильтрация по статусу
     creator = filters.NumberFilter(field_name='creator__user_id') # Фильтрация по создателю
     responsible_user = filters.NumberFilter(field_name='responsible_user__user_id') # Фильтрация по проекту
-    direction = filters.CharFilter(field_name='project__direction__id', lookup_expr='icontains')
+    direction = filters.NumberFilter(field_name='project__direction')
     project = filters.NumberFilter(field_name='project__id') # Фильтрация по проекту
     deadline = filters.DateFilter(field_name='end') # Фильтрация по дедлайну
     created_after = filters.DateFilter(field_name='start', lookup_expr='gte')  # Начальная дата
     created_before = filters.DateFilter(field_name='end', lookup_expr='lte')  # Конечная дата
     task_id = filters.NumberFilter(field_name='id') # Фильтрация по id
+    search = filters.CharFilter(method='filter_search') # Полнотекстовый поиск по названию и описанию
     team = filters.NumberFilter(method='filter_by_team') # Фильтрация по команде
 
     def filter_by_team(self, queryset, name, value):
@@ -78,6 +83,10 @@ class TaskFilter(filters.FilterSet):
             return queryset.none()
         return queryset.filter(project=team.project)
 
+    def filter_search(self, queryset, name, value):
+        ids = matching_ids(value, 'task')
+        return queryset.none() if ids is None else queryset.filter(id__in=ids)
+
     class Meta:
         model = Task
         fields = [
@@ -87,12 +96,17 @@ class TaskFilter(filters.FilterSet):
         ]
 
 
-class TaskAPIListPagination(pagination.PageNumberPagination):
+class TaskPageNumberPagination(pagination.PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
 
 
+class TaskAPIListPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+    fallback_class = TaskPageNumberPagination
+
+
 class TaskAPIList(generics.ListAPIView):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
@@ -101,6 +115,16 @@ class TaskAPIList(generics.ListAPIView):
     filterset_class = TaskFilter
     pagination_class = TaskAPIListPagination
 
+    def get_queryset(self):
+        return scope_queryset(task_queryset(), self.request.user, {'project': Project})
+
+    def paginate_queryset(self, queryset):
+        # Подзадачи, команды, комментарии и этапы грузятся пачкой для всей страницы
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            return None
+        return prefetch_task_tree(page)
+
 
 class TaskAPICreate(generics.CreateAPIView):
     queryset = Task.objects.all()
@@ -276,6 +300,56 @@ class ProjectAPIList(generics.ListAPIView):
     serializer_class = ProjectSerializer
     permission_classes = (IsAuthenticated,)
 
+    def get_queryset(self):
+        return scope_queryset(super().get_queryset(), self.request.user, {'id': Project})
+
+
+class ProjectBoardAPIView(APIView):
+    """
+    Kanban-доска проекта
+    GET /api/project/<pk>/board/
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk):
+        board = build_board(pk, scope_queryset(Project.objects.all(), request.user, {'id': Project}))
+        if board is None:
+            raise NotFound({"error": "Project not found."})
+        return Response(board)
+
+
+class ProjectChangesAPIView(APIView):
+    """
+    Изменения задач, комментариев, чек-листов и встреч проекта (plan.changes)
+    GET /api/project/<pk>/changes/?since=<sync_token>&limit=500
+    Без since — текущее состояние всех объектов. Ответ:
+    {
+        "changes": [{"type": "task", "id": 1, "action": "upsert", "data": {...}},
+                    {"type": "comment", "id": 2, "action": "delete"}],
+        "sync_token": "...",  // передать в since следующего запроса
+        "has_more": false     // true — сразу запросить следующую страницу
+    }
+    410 — токен устарел, проект нужно загрузить заново без since
+    Тот же токен продолжает поток событий: /api/project/<pk>/events/?since=<sync_token>
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk):
+        if not scope_queryset(Project.objects.filter(pk=pk), request.user, {'id': Project}).exists():
+            raise NotFound({"error": "Project not found."})
+        limit = request.query_params.get('limit')
+        try:
+            limit = max(min(int(limit), 1000), 1) if limit else None
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+
+        try:
+            return Response(changes_since(pk, request.query_params.get('since'), limit))
+        except ExpiredToken:
+            return Response({"error": "Sync token expired."}, status=status.HTTP_410_GONE)
+        except InvalidToken:
+            raise ValidationError({'since': 'Некорректный токен синхронизации'})
+
 
 class ProjectAPICreate(generics.CreateAPIView):
     queryset = Project.objects.all()
@@ -305,6 +379,9 @@ class TeamAPIListCreate(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend]
     filterset_class = TeamFilter
 
+    def get_queryset(self):
+        return scope_queryset(super().get_queryset(), self.request.user, {'id': Team})
+
 class TeamAPIUpdate(generics.RetrieveUpdateDestroyAPIView):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
@@ -331,6 +408,9 @@ class MeetingAPIListCreate(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend]
     filterset_class = MeetingFilter
 
+    def get_queryset(self):
+        return scope_queryset(super().get_queryset(), self.request.user, {'project': Project})
+
 
 class MeetingAPIUpdate(generics.RetrieveUpdateDestroyAPIView):
     queryset = Meeting.objects.all()
@@ -27,7 +27,7 @@ const eventApi = apiSlice.injectEndpoints({
     // Эндпоинт для получения списка мероприятий.
     getEvents: builder.query<Event[], void>({
       query: () => ({
-        url: '/api/events/',  // URL для получения списка мероприятий
+        url: '/api/events/?expand=directions',  // URL для получения списка мероприятий (с направлениями)
         withCredentials: true, // Отправка сессии/кредитов пользователя
       }),
       providesTags: ['Event'], // Указывает, что данные мероприятий должны быть обновлены/перезапрошены